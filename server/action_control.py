@@ -0,0 +1,76 @@
+import contextvars
+import threading
+import time
+from typing import Callable, Optional
+
+# 実行中のアクションの ActionControl (実行スレッドへは AppActionQueues がコンテキストごと引き継ぐ)
+CURRENT_CONTROL = contextvars.ContextVar("action_control", default=None)
+
+
+class ActionControl:
+    """
+    実行中の入力アクション1件の進捗通知と中断要求。ツール側 (イベントループ) と実行スレッドで共有する。
+    on_progress(progress, total, message) は実行スレッドから呼ばれる。全体を 0-100 として通知する。
+    複数ステップの場合は begin_step で現在のステップを設定すると、ステップ内の進み具合を全体に換算する。
+    """
+
+    def __init__(self, on_progress: Optional[Callable[[float, float, Optional[str]], None]] = None,
+                 min_interval: float = 0.1, clock: Callable[[], float] = time.monotonic):
+        self.cancel_event = threading.Event()
+        self._on_progress = on_progress
+        self.min_interval = min_interval
+        self._clock = clock
+        self._last_sent = None
+        self._last_progress = -1.0
+        self.step_index = 0
+        self.step_count = 1
+        # 現在のステップの進み具合と全体の進み具合 (0.0-1.0)
+        self.step_fraction = 0.0
+        self.fraction = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def should_stop(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def begin_step(self, index: int, count: int):
+        self.step_index = index
+        self.step_count = max(count, 1)
+        self.report(0, 1)
+
+    def report(self, done: float, total: float, message: Optional[str] = None):
+        """現在のステップが total 中 done まで進んだ (送信は min_interval 秒に1回まで、完了時は必ず送る)"""
+        self.step_fraction = min(1.0, done / total) if total else 1.0
+        self.fraction = (self.step_index + self.step_fraction) / self.step_count
+        if self._on_progress is None:
+            return
+        now = self._clock()
+        finished = self.step_fraction >= 1.0 and self.step_index == self.step_count - 1
+        if not finished and self._last_sent is not None and now - self._last_sent < self.min_interval:
+            return
+        progress = self.fraction * 100.0
+        # MCP の進捗は増加し続ける必要があるので、戻る値や同じ値は送らない
+        if progress <= self._last_progress:
+            return
+        self._last_sent = now
+        self._last_progress = progress
+        try:
+            self._on_progress(progress, 100.0, message)
+        except Exception:
+            # 通知の失敗で入力を止めない
+            pass
+
+    def percent(self) -> str:
+        """現在のステップの完了割合"""
+        return f"{self.step_fraction * 100:.0f}%"
+
+
+def current_control() -> ActionControl:
+    """実行中のアクションの ActionControl (ツール外から呼ばれた場合は中断されない空のもの)"""
+    control = CURRENT_CONTROL.get()
+    return control if control is not None else ActionControl()
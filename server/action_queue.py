@@ -0,0 +1,443 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+
+def percentile(values, q: float) -> float:
+    """q (0-100) パーセンタイル。値が無ければ 0.0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class LatencyStats:
+    """直近 maxlen 件の待ち時間・実行時間を保持して集計する"""
+
+    def __init__(self, maxlen: int = 1000):
+        self.waits: Deque[float] = collections.deque(maxlen=maxlen)
+        self.totals: Deque[float] = collections.deque(maxlen=maxlen)
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    def record(self, wait: float, total: float, ok: bool = True):
+        self.waits.append(wait)
+        self.totals.append(total)
+        self.completed += 1
+        if not ok:
+            self.failed += 1
+
+    def summary(self) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "throughput_per_s": self.completed / elapsed,
+            "wait_p50": percentile(self.waits, 50),
+            "wait_p99": percentile(self.waits, 99),
+            "latency_p50": percentile(self.totals, 50),
+            "latency_p95": percentile(self.totals, 95),
+            "latency_p99": percentile(self.totals, 99),
+        }
+
+
+class Overloaded(Exception):
+    """混雑しているため要求を受け付けなかった"""
+
+
+class DeadlineExceeded(Exception):
+    """期限までに実行を始められなかった"""
+
+
+class AdmissionController:
+    """
+    受け付け中 (実行中と実行待ち) の要求数の上限。全体で max_pending 件、クライアントごとに max_per_client 件を
+    超えた要求は待たせずに Overloaded ですぐ断る (待ち行列が伸び続けて全員の応答が遅れるのを防ぐ)。
+    イベントループ上からだけ使う。
+    """
+
+    def __init__(self, max_pending: int = 64, max_per_client: int = 16):
+        self.max_pending = max_pending
+        self.max_per_client = max_per_client
+        self.pending = 0
+        self.pending_by_client: Dict[str, int] = {}
+        self.admitted = 0
+        self.rejected_by_client: Dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def admit(self, client: str):
+        mine = self.pending_by_client.get(client, 0)
+        if self.pending >= self.max_pending or mine >= self.max_per_client:
+            self.rejected_by_client[client] = self.rejected_by_client.get(client, 0) + 1
+            limit = (f"全体 {self.max_pending} 件" if self.pending >= self.max_pending
+                     else f"クライアントごと {self.max_per_client} 件")
+            raise Overloaded(f"受け付け中の要求が上限 ({limit}) に達しています")
+        self.pending += 1
+        self.pending_by_client[client] = mine + 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+            left = self.pending_by_client[client] - 1
+            if left:
+                self.pending_by_client[client] = left
+            else:
+                del self.pending_by_client[client]
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "max_per_client": self.max_per_client,
+            "admitted": self.admitted,
+            "rejected": sum(self.rejected_by_client.values()),
+            "rejected_by_client": dict(self.rejected_by_client),
+        }
+
+
+class _Item:
+    """キューに積んだ入力アクション1件"""
+    __slots__ = ("func", "args", "kwargs", "ctx", "future", "enqueued_at", "client", "deadline", "started")
+
+    def __init__(self, func, args, kwargs, ctx, future, client: str, deadline: Optional[float]):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.ctx = ctx
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.client = client
+        self.deadline = deadline
+        self.started = False
+
+
+class FairQueue:
+    """
+    クライアントごとの FIFO をラウンドロビンで取り出すキュー。
+    1つのクライアントが大量に積んでも、他のクライアントのアクションは1件ずつ順番が回ってくる。
+    """
+
+    def __init__(self):
+        self._queues: "collections.OrderedDict[str, Deque]" = collections.OrderedDict()
+        self._size = 0
+        self._nonempty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def depth(self, client: str) -> int:
+        q = self._queues.get(client)
+        return len(q) if q else 0
+
+    def put_nowait(self, client: str, item):
+        q = self._queues.get(client)
+        if q is None:
+            q = self._queues[client] = collections.deque()
+        q.append(item)
+        self._size += 1
+        self._nonempty.set()
+
+    def get_nowait(self):
+        if not self._size:
+            raise asyncio.QueueEmpty
+        client, q = next(iter(self._queues.items()))
+        item = q.popleft()
+        if q:
+            # まだ残っていれば最後尾に回す
+            self._queues.move_to_end(client)
+        else:
+            del self._queues[client]
+        self._size -= 1
+        return item
+
+    async def get(self):
+        while not self._size:
+            self._nonempty.clear()
+            await self._nonempty.wait()
+        return self.get_nowait()
+
+    def remove(self, client: str, item) -> bool:
+        """まだ取り出されていない item を取り除く"""
+        q = self._queues.get(client)
+        if not q or item not in q:
+            return False
+        q.remove(item)
+        if not q:
+            del self._queues[client]
+        self._size -= 1
+        return True
+
+
+def _local_request():
+    """要求元の情報が無い場合 (stdio で1クライアントだけの場合など)"""
+    return "local", None
+
+
+class AppActionQueues:
+    """
+    対象アプリ (またはインスタンス) ごとの入力アクションキュー。
+    同じアプリへのアクションは投入順に1つずつ実行し、ブロッキングする処理はスレッドで動かす。
+    キーボード・マウス入力はOS全体で最前面のウィンドウに届くため、
+    アプリをまたいだ入力の実行は input_lock で1つずつにする。
+    input_lock を取ったキューは、溜まっているアクションを最大 max_batch 件まで続けて実行してから手放す
+    (複数のクライアントへ交互に投入されても、フォーカスの切り替えはまとめた単位でしか起きない)。
+    読み取り専用の処理 (スクリーンショット・ウィンドウ情報) は run_readonly でキューを通さず並行に動かす。
+
+    複数のクライアントから使う場合:
+    - request_info() が返す (クライアント名, 期限の秒数) で要求元を区別する。
+    - 同じアプリのキューの中ではクライアントごとに順番に実行する (FairQueue)。
+    - 期限までに実行を始められなかったアクションは実行せずに DeadlineExceeded で返す。
+    - admission を指定すると、受け付け中の要求数が上限を超えた時点で Overloaded で断る。
+    - run_shared は同じ観測を同時に要求したクライアントの間で1回の実行を共有し、少しの間結果を使い回す。
+
+    before_input(app, func) は各アクションを実行する直前に実行スレッドで呼ばれる
+    (キューの外で入力を送っている処理を、先に止めるために使う)。
+    実行中のアクションは pause_input で、待つ間だけ input_lock を他のアプリへ譲れる。
+    """
+
+    def __init__(self, max_batch: int = 8, admission: Optional[AdmissionController] = None,
+                 request_info: Callable[[], Tuple[str, Optional[float]]] = _local_request,
+                 before_input: Optional[Callable[[str, Callable], None]] = None):
+        self.max_batch = max(1, max_batch)
+        self.admission = admission
+        self.request_info = request_info
+        self.before_input = before_input
+        self._queues: Dict[str, FairQueue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._input_lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 実行スレッドごとの、実行中のアクションのキュー名 (pause_input 用)
+        self._running = threading.local()
+        self.stats_by_app: Dict[str, LatencyStats] = {}
+        self.stats_by_client: Dict[str, LatencyStats] = {}
+        self.readonly_stats = LatencyStats()
+        self.expired = 0
+        # run_shared: キー -> (開始時刻 time.time(), タスク) / (取得時刻 monotonic, 開始時刻 time.time(), 結果)
+        self._shared_pending: Dict[object, tuple] = {}
+        self._shared_results: Dict[object, tuple] = {}
+        self.shared_loads = 0
+        self.shared_joins = 0
+        self.shared_hits = 0
+        # アプリごとに最後の入力アクションが終わった時刻 (time.time())
+        self.last_completed: Dict[str, float] = {}
+        # 最後に入力を実行したキューと、実行するキューが変わった回数・まとめて実行した回数
+        self.last_key: Optional[str] = None
+        self.switches = 0
+        self.batches = 0
+
+    @property
+    def input_lock(self) -> asyncio.Lock:
+        # イベントループ上で初めて使う時に作る
+        if self._input_lock is None:
+            self._input_lock = asyncio.Lock()
+        return self._input_lock
+
+    def depth(self, app: str) -> int:
+        q = self._queues.get(app)
+        return q.qsize() if q else 0
+
+    def client_depth(self, client: str) -> int:
+        return sum(q.depth(client) for q in self._queues.values())
+
+    @contextlib.contextmanager
+    def _admit(self, client: str):
+        if self.admission is None:
+            yield
+        else:
+            with self.admission.admit(client):
+                yield
+
+    async def submit(self, app: str, func: Callable, *args, **kwargs):
+        """
+        アプリのキューにアクションを積み、実行結果を待って返す。
+        期限を過ぎても始まらなければ DeadlineExceeded (始まっていれば終わるまで待つ)。
+        """
+        client, timeout = self.request_info()
+        with self._admit(client):
+            key = (app or "").lower()
+            q = self._queues.get(key)
+            if q is None:
+                q = self._queues[key] = FairQueue()
+                self.stats_by_app[key] = LatencyStats()
+            worker = self._workers.get(key)
+            if worker is None or worker.done():
+                self._workers[key] = asyncio.create_task(self._run_worker(key, q))
+
+            future = asyncio.get_running_loop().create_future()
+            # 投入元のコンテキスト (実行中のツール名など) を実行スレッドへ引き継ぐ
+            ctx = contextvars.copy_context()
+            deadline = time.monotonic() + timeout if timeout else None
+            item = _Item(func, args, kwargs, ctx, future, client, deadline)
+            q.put_nowait(client, item)
+            try:
+                if deadline is not None:
+                    try:
+                        return await asyncio.wait_for(asyncio.shield(future), timeout)
+                    except asyncio.TimeoutError:
+                        if not item.started:
+                            future.cancel()
+                            q.remove(client, item)
+                            self._expire(key, item)
+                            raise DeadlineExceeded(f"{timeout:g}秒以内に実行を始められませんでした "
+                                                   f"(待ち {q.qsize()} 件)") from None
+                return await future
+            except asyncio.CancelledError:
+                # 要求が取り消されたら、まだ始まっていないアクションは実行しない
+                if not item.started:
+                    future.cancel()
+                    q.remove(client, item)
+                raise
+
+    async def _run_worker(self, key: str, q: FairQueue):
+        self._loop = asyncio.get_running_loop()
+        while True:
+            item = await q.get()
+            async with self.input_lock:
+                self.batches += 1
+                for n in range(self.max_batch):
+                    if n > 0:
+                        if q.empty():
+                            break
+                        item = q.get_nowait()
+                    await self._run_item(key, item)
+
+    def _client_stats(self, client: str) -> LatencyStats:
+        stats = self.stats_by_client.get(client)
+        if stats is None:
+            stats = self.stats_by_client[client] = LatencyStats()
+        return stats
+
+    def _expire(self, key: str, item: _Item):
+        self.expired += 1
+        waited = time.monotonic() - item.enqueued_at
+        self.stats_by_app[key].record(waited, waited, False)
+        self._client_stats(item.client).record(waited, waited, False)
+
+    async def _run_item(self, key: str, item: _Item):
+        future = item.future
+        if future.done():
+            return
+        if item.deadline is not None and time.monotonic() > item.deadline:
+            self._expire(key, item)
+            future.set_exception(DeadlineExceeded("期限までに実行を始められませんでした"))
+            return
+        item.started = True
+        if self.last_key is not None and self.last_key != key:
+            self.switches += 1
+        self.last_key = key
+        started = time.monotonic()
+        ok = True
+        try:
+            result = await asyncio.to_thread(item.ctx.run, self._call, key, item)
+        except Exception as e:
+            ok = False
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        self.last_completed[key] = time.time()
+        now = time.monotonic()
+        self.stats_by_app[key].record(started - item.enqueued_at, now - item.enqueued_at, ok)
+        self._client_stats(item.client).record(started - item.enqueued_at, now - item.enqueued_at, ok)
+
+    def _call(self, key: str, item: _Item):
+        if self.before_input is not None:
+            self.before_input(key, item.func)
+        self._running.key = key
+        try:
+            return item.func(*item.args, **item.kwargs)
+        finally:
+            self._running.key = None
+
+    def pause_input(self, seconds: float) -> bool:
+        """
+        実行中のアクションから (実行スレッドで) 呼ぶ。seconds 秒の間 input_lock を手放して他のアプリの入力を先に通し、
+        取り直してから戻る。同じアプリのキューは止めたままなので、このアプリへの他のアクションは割り込まない。
+        入力ロックを手放した場合は True (他のアプリにフォーカスが移っているかもしれない)。
+        アクションの外から呼んだ場合は、ただ待って False を返す。
+        """
+        if getattr(self._running, "key", None) is None or self._loop is None:
+            time.sleep(seconds)
+            return False
+        asyncio.run_coroutine_threadsafe(self._pause(seconds), self._loop).result()
+        return True
+
+    async def _pause(self, seconds: float):
+        self.input_lock.release()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await self.input_lock.acquire()
+
+    async def run_readonly(self, func: Callable, *args, **kwargs):
+        """読み取り専用の処理をキューを通さずスレッドで実行する"""
+        client, _ = self.request_info()
+        with self._admit(client):
+            return await self._run_readonly(func, *args, **kwargs)
+
+    async def run_shared(self, key, app: str, func: Callable, *args, max_age: float = 0.0):
+        """
+        読み取り専用の処理 (撮影など) をクライアント間で共有する。key が同じ処理が実行中ならその結果を待ち、
+        max_age 秒以内に得た結果があればそれを返す。ただし app への入力アクションがその処理の開始後に
+        終わっていれば、古い画面なので使わずに実行し直す。
+        """
+        client, _ = self.request_info()
+        with self._admit(client):
+            since = self.last_completed.get((app or "").lower(), 0.0)
+            cached = self._shared_results.get(key)
+            if cached is not None and time.monotonic() - cached[0] <= max_age and cached[1] >= since:
+                self.shared_hits += 1
+                return cached[2]
+            pending = self._shared_pending.get(key)
+            if pending is not None and pending[0] >= since:
+                self.shared_joins += 1
+            else:
+                self.shared_loads += 1
+                pending = (time.time(), asyncio.ensure_future(self._run_readonly(func, *args)))
+                self._shared_pending[key] = pending
+                pending[1].add_done_callback(lambda task, key=key, pending=pending: self._shared_done(key, pending))
+            # 待っているクライアントが取り消されても、他のクライアントの分の実行は続ける
+            return await asyncio.shield(pending[1])
+
+    def _shared_done(self, key, pending):
+        if self._shared_pending.get(key) is pending:
+            del self._shared_pending[key]
+        task = pending[1]
+        if not task.cancelled() and task.exception() is None:
+            self._shared_results[key] = (time.monotonic(), pending[0], task.result())
+
+    async def _run_readonly(self, func: Callable, *args, **kwargs):
+        started = time.monotonic()
+        ok = True
+        try:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self.readonly_stats.record(0.0, time.monotonic() - started, ok)
+
+    def stats(self) -> dict:
+        return {
+            "apps": {app: dict(s.summary(), depth=self.depth(app))
+                     for app, s in self.stats_by_app.items()},
+            "clients": {client: dict(s.summary(), depth=self.client_depth(client))
+                        for client, s in self.stats_by_client.items()},
+            "readonly": self.readonly_stats.summary(),
+            "shared": {"loads": self.shared_loads, "joins": self.shared_joins, "hits": self.shared_hits},
+            "admission": self.admission.stats() if self.admission is not None else None,
+            "switches": self.switches,
+            "batches": self.batches,
+            "expired": self.expired,
+        }
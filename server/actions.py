@@ -0,0 +1,187 @@
+import time
+from dataclasses import dataclass
+from typing import Annotated, Callable, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+class KeyStep(BaseModel):
+    """キー入力 (press_game_keys と同じ書式。"w", "shift+w space" など)"""
+    type: Literal["key"] = "key"
+    keys: str
+    duration: float = Field(0.1, description="キーを押し続ける時間(秒)")
+
+
+class ChordStep(BaseModel):
+    """複数キーの同時押し"""
+    type: Literal["chord"] = "chord"
+    keys: List[str]
+    duration: float = Field(0.1, description="押し続ける時間(秒)")
+
+
+class KeyEvent(BaseModel):
+    """タイムライン上のキー押下1回分 ("shift+w" のような同時押しも可)"""
+    key: str
+    start: float = Field(0.0, description="開始からの押下時刻(秒)")
+    hold: float = Field(0.1, description="押し続ける時間(秒)")
+
+
+class KeyTimelineStep(BaseModel):
+    """重なりを許すキー押下のタイムライン"""
+    type: Literal["timeline"] = "timeline"
+    events: List[KeyEvent]
+
+
+class DragStep(BaseModel):
+    """マウスの相対移動・ドラッグ (視点操作)"""
+    type: Literal["drag"] = "drag"
+    x: int
+    y: int
+    button: Optional[str] = Field("right", description="'left', 'right', 'middle' または 'none'(移動のみ)")
+    duration: float = 2.0
+    profile: Literal["linear", "ease_in_out", "bezier"] = "linear"
+
+
+class ScrollStep(BaseModel):
+    """マウスホイールのスクロール (ズーム)"""
+    type: Literal["scroll"] = "scroll"
+    amount: float
+    duration: float = 0.0
+    profile: Literal["linear", "ease_in_out", "ease_in", "ease_out"] = "linear"
+
+
+class EmoteStep(BaseModel):
+    """エモート (名前またはキー)"""
+    type: Literal["emote"] = "emote"
+    emote: str
+    wait: float = Field(1.0, description="エモート後の待機時間(秒)")
+
+
+class CommentStep(BaseModel):
+    """チャットコメントの送信"""
+    type: Literal["comment"] = "comment"
+    text: str
+
+
+class WaveStep(BaseModel):
+    """手を振る動作"""
+    type: Literal["wave"] = "wave"
+    side: str = "right"
+    duration: float = 2.0
+
+
+class WaitStep(BaseModel):
+    """何もせずに待つ"""
+    type: Literal["wait"] = "wait"
+    seconds: float
+
+
+Step = Annotated[
+    Union[KeyStep, ChordStep, KeyTimelineStep, DragStep, ScrollStep, EmoteStep, CommentStep, WaveStep, WaitStep],
+    Field(discriminator="type"),
+]
+
+MAX_STEPS = 200
+MAX_STEP_SECONDS = 60.0
+DRAG_BUTTONS = ("left", "right", "middle", "none", "")
+WAVE_SIDES = ("right", "left", "both")
+
+
+def validate_steps(steps: List[BaseModel]) -> List[str]:
+    """実行前にステップ列全体を検証し、エラーメッセージの一覧を返す (空なら問題なし)"""
+    errors = []
+    if not steps:
+        errors.append("ステップが空です")
+    if len(steps) > MAX_STEPS:
+        errors.append(f"ステップ数が多すぎます ({len(steps)} > {MAX_STEPS})")
+    for i, step in enumerate(steps):
+        for name in ("duration", "seconds", "wait"):
+            value = getattr(step, name, None)
+            if value is not None and not (0 <= value <= MAX_STEP_SECONDS):
+                errors.append(f"[{i}] {name} は 0〜{MAX_STEP_SECONDS} 秒で指定してください: {value}")
+        if isinstance(step, KeyStep) and not step.keys.split():
+            errors.append(f"[{i}] keys が空です")
+        elif isinstance(step, ChordStep) and not [k for k in step.keys if k.strip()]:
+            errors.append(f"[{i}] keys が空です")
+        elif isinstance(step, KeyTimelineStep):
+            errors.extend(f"[{i}] {e}" for e in validate_key_events(step.events))
+        elif isinstance(step, DragStep) and (step.button or "").lower() not in DRAG_BUTTONS:
+            errors.append(f"[{i}] button は left, right, middle, none のいずれかを指定してください: {step.button}")
+        elif isinstance(step, WaveStep) and step.side.lower() not in WAVE_SIDES:
+            errors.append(f"[{i}] sideは right, left, both のいずれかを指定してください: {step.side}")
+        elif isinstance(step, EmoteStep) and not step.emote.strip():
+            errors.append(f"[{i}] emote が空です")
+        elif isinstance(step, CommentStep) and not step.text:
+            errors.append(f"[{i}] text が空です")
+    return errors
+
+
+def validate_key_events(events: List[KeyEvent]) -> List[str]:
+    """キータイムラインの検証"""
+    errors = []
+    if not events:
+        errors.append("events が空です")
+    for j, ev in enumerate(events):
+        if not [k for k in ev.key.split('+') if k.strip()]:
+            errors.append(f"events[{j}] key が空です")
+        if ev.start < 0 or ev.hold < 0:
+            errors.append(f"events[{j}] start, hold は0以上で指定してください")
+        elif ev.start + ev.hold > MAX_STEP_SECONDS:
+            errors.append(f"events[{j}] 終了時刻が {MAX_STEP_SECONDS} 秒を超えています")
+    return errors
+
+
+@dataclass
+class StepResult:
+    """1ステップ分の実行結果。時刻は全ステップ共通のタイムライン開始からの秒数"""
+    index: int
+    type: str
+    start: float
+    elapsed: float
+    ok: bool
+    message: str = ""
+    error: str = ""
+
+    def describe(self) -> str:
+        status = "OK" if self.ok else "NG"
+        text = self.message if self.ok else self.error
+        return f"[{self.index}] {self.type} @{self.start:.3f}s +{self.elapsed:.3f}s {status}: {text}"
+
+
+class StepExecutor:
+    """
+    ステップ列を1本のタイムライン上で順番に実行する。
+    handlers はステップ種別 -> (step, app_name) を受け取って結果メッセージを返す関数。
+    例外はそのステップのエラーとして記録する。
+    """
+
+    def __init__(self, handlers: Dict[str, Callable], clock: Callable[[], float] = time.monotonic):
+        self.handlers = handlers
+        self._clock = clock
+
+    def run(self, steps: List[BaseModel], app_name: Optional[str] = None,
+            stop_on_error: bool = True,
+            should_stop: Optional[Callable[[], bool]] = None,
+            on_step: Optional[Callable[[int, int], None]] = None) -> List[StepResult]:
+        """
+        should_stop() が True を返すと残りのステップを実行せずに終わる。
+        on_step(i, n) は各ステップの開始前に呼ばれる (進捗通知用)。
+        """
+        results = []
+        t0 = self._clock()
+        for i, step in enumerate(steps):
+            if should_stop is not None and should_stop():
+                break
+            if on_step is not None:
+                on_step(i, len(steps))
+            start = self._clock()
+            try:
+                message = self.handlers[step.type](step, app_name)
+                ok, error = True, ""
+            except Exception as e:
+                message, ok, error = "", False, str(e)
+            end = self._clock()
+            results.append(StepResult(i, step.type, start - t0, end - start, ok, message or "", error))
+            if not ok and stop_on_error:
+                break
+        return results
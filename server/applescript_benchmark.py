@@ -0,0 +1,102 @@
+"""
+AppleScript 実行の計測: 常駐ワーカー (AppleScriptWorkerPool) と、1回ごとに subprocess.run(["osascript", ...]) で
+プロセスを起動する方式を比べる。1回あたりの時間 (p50/p99) と、複数スレッドから同時に呼んだときの処理件数/秒を表示する。
+
+Mac 以外でも動くよう、既定では osascript の代わりに applescript_standin.py を使う (--startup で起動時の準備時間を
+再現する)。--real で実際の osascript と System Events への問い合わせで計測する。
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from action_queue import percentile
+from applescript_worker import AppleScriptWorkerPool
+
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "applescript_standin.py")
+REAL_SCRIPT = 'tell application "System Events" to get name of first process whose frontmost is true'
+
+
+def commands(real: bool, startup: float):
+    """(ワーカーの起動コマンド, 1回起動で script を実行するコマンドを返す関数, 計測に使う script)"""
+    if real:
+        return None, lambda script: ["osascript", "-e", script], REAL_SCRIPT
+    base = [sys.executable, STANDIN, "--startup", str(startup)]
+    return base, lambda script: base + ["--once", script], "echo frontmost"
+
+
+def measure_fork(argv_for, script: str, n: int) -> list:
+    """毎回プロセスを起動して実行する"""
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        subprocess.run(argv_for(script), capture_output=True, text=True, timeout=30, check=True)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def measure_worker(pool: AppleScriptWorkerPool, script: str, n: int) -> list:
+    """温まったワーカーで実行する"""
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        pool.execute(script)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def measure_concurrent(call, threads: int, n: int) -> float:
+    """threads 本のスレッドから n 回ずつ call() を呼び、処理件数/秒を返す"""
+    def run():
+        for _ in range(n):
+            call()
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return threads * n / (time.perf_counter() - t0)
+
+
+def run_benchmark(real: bool = False, startup: float = 0.1, n: int = 30, threads: int = 4,
+                  pool_size: int = 2) -> dict:
+    worker_command, argv_for, script = commands(real, startup)
+    pool = AppleScriptWorkerPool(size=pool_size, command=worker_command)
+    try:
+        t0 = time.perf_counter()
+        pool.warm()
+        warm = time.perf_counter() - t0
+        result = {"warm": warm, "script": script}
+        for name, times in (("subprocess", measure_fork(argv_for, script, n)),
+                            ("worker", measure_worker(pool, script, n))):
+            result[name] = {"p50": percentile(times, 50), "p99": percentile(times, 99)}
+        result["subprocess"]["throughput"] = measure_concurrent(
+            lambda: subprocess.run(argv_for(script), capture_output=True, timeout=30, check=True), threads, n // threads or 1)
+        result["worker"]["throughput"] = measure_concurrent(lambda: pool.execute(script), threads, n)
+        result["restarts"] = sum(w.restarts for w in pool._workers)
+        return result
+    finally:
+        pool.close()
+
+
+def print_report(r: dict, threads: int):
+    print(f"script: {r['script']}  ワーカーの起動 (warm): {r['warm'] * 1000:.0f}ms")
+    print(f"{'方式':<12} {'p50':>9} {'p99':>9} {f'{threads}スレッド':>12}")
+    for name in ("subprocess", "worker"):
+        s = r[name]
+        print(f"{name:<12} {s['p50'] * 1000:>7.1f}ms {s['p99'] * 1000:>7.1f}ms {s['throughput']:>8.1f}件/秒")
+    print(f"速度比 (p50): {r['subprocess']['p50'] / max(r['worker']['p50'], 1e-9):.1f}倍  再起動 {r['restarts']} 回")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常駐ワーカーと osascript の1回起動の比較")
+    parser.add_argument("--real", action="store_true", help="実際の osascript で計測する (Mac 用)")
+    parser.add_argument("--startup", type=float, default=0.1, help="代替インタプリタの起動時の準備時間 (秒)")
+    parser.add_argument("-n", type=int, default=30, help="計測する呼び出し回数")
+    parser.add_argument("--threads", type=int, default=4, help="同時に呼ぶスレッド数")
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+    print_report(run_benchmark(args.real, args.startup, args.n, args.threads, args.pool_size), args.threads)
@@ -0,0 +1,62 @@
+"""
+AppleScript ワーカー (WORKER_JXA) の代わりに動くテスト用インタプリタ (Linux でも動作)。
+同じ1行1JSONのプロトコル ({"id", "script"} -> {"id", "ok", "result" | "error"}) で応答する。
+script は次の簡単なコマンドとして解釈する:
+  echo <text>   <text> を返す
+  sleep <秒>    眠ってから "slept" を返す
+  fail <msg>    エラー応答を返す
+  crash         応答せずにプロセスを終了する
+  それ以外      script をそのまま返す
+--startup 秒 で起動時の準備 (インタプリタと System Events への接続) にかかる時間を再現する。
+--once script で1回だけ実行して結果を表示して終わる (osascript -e の1回起動の代わり)。
+"""
+import argparse
+import json
+import sys
+import time
+
+
+def evaluate(script: str) -> str:
+    """script を実行して結果を返す (失敗時は RuntimeError)"""
+    command, _, arg = script.strip().partition(" ")
+    if command == "echo":
+        return arg
+    if command == "sleep":
+        time.sleep(float(arg))
+        return "slept"
+    if command == "fail":
+        raise RuntimeError(arg or "error")
+    if command == "crash":
+        sys.exit(3)
+    return script
+
+
+def serve(stdin=sys.stdin, stdout=sys.stdout):
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        req = {"id": None}
+        try:
+            req = json.loads(line)
+            res = {"id": req["id"], "ok": True, "result": evaluate(req["script"])}
+        except Exception as e:
+            res = {"id": req.get("id"), "ok": False, "error": str(e)}
+        stdout.write(json.dumps(res) + "\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AppleScript ワーカーのテスト用の代替インタプリタ")
+    parser.add_argument("--startup", type=float, default=0.0, help="起動時の準備にかかる時間 (秒)")
+    parser.add_argument("--once", default=None, help="このスクリプトを1回だけ実行して終わる")
+    args = parser.parse_args()
+    time.sleep(args.startup)
+    if args.once is not None:
+        try:
+            print(evaluate(args.once))
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+    else:
+        serve()
@@ -0,0 +1,237 @@
+import atexit
+import itertools
+import json
+import queue
+import subprocess
+import threading
+from typing import List, Optional
+
+
+# osascript(JXA) 上で動く常駐ワーカー。
+# 標準入力から1行1JSONのリクエスト {"id", "script"} を読み、NSAppleScript で実行して
+# 1行1JSONのレスポンス {"id", "ok", "result" | "error"} を返す。
+# インタプリタと System Events への接続はプロセスが生きている間使い回される。
+# リクエストは ASCII だけで送る (日本語は \uXXXX)。availableData の区切りが
+# マルチバイト文字の途中に来てもデコードに失敗しないようにするため。
+WORKER_JXA = r'''
+ObjC.import('Foundation');
+function fmt(desc) {
+    if (!desc || desc.isNil()) return '';
+    var s = desc.stringValue;
+    if (!s.isNil()) return s.js;
+    var n = desc.numberOfItems;
+    var parts = [];
+    for (var i = 1; i <= n; i++) parts.push(fmt(desc.descriptorAtIndex(i)));
+    return parts.join(', ');
+}
+function run() {
+    var stdin = $.NSFileHandle.fileHandleWithStandardInput;
+    var stdout = $.NSFileHandle.fileHandleWithStandardOutput;
+    var buf = '';
+    while (true) {
+        var data = stdin.availableData;
+        if (data.length === 0) break;
+        buf += $.NSString.alloc.initWithDataEncoding(data, $.NSUTF8StringEncoding).js;
+        var idx;
+        while ((idx = buf.indexOf('\n')) >= 0) {
+            var line = buf.slice(0, idx);
+            buf = buf.slice(idx + 1);
+            if (!line) continue;
+            var req = {id: null};
+            var res;
+            try {
+                req = JSON.parse(line);
+                var err = Ref();
+                var out = $.NSAppleScript.alloc.initWithSource(req.script).executeAndReturnError(err);
+                if (out.isNil()) {
+                    var info = ObjC.deepUnwrap(err[0]) || {};
+                    res = {id: req.id, ok: false, error: String(info.NSAppleScriptErrorMessage || 'AppleScript error')};
+                } else {
+                    res = {id: req.id, ok: true, result: fmt(out)};
+                }
+            } catch (e) {
+                res = {id: req.id, ok: false, error: String(e)};
+            }
+            stdout.writeData($(JSON.stringify(res) + '\n').dataUsingEncoding($.NSUTF8StringEncoding));
+        }
+    }
+}
+'''
+
+DEFAULT_WORKER_COMMAND = ['osascript', '-l', 'JavaScript', '-e', WORKER_JXA]
+
+
+class AppleScriptError(Exception):
+    """AppleScript自体がエラーを返した"""
+
+
+class AppleScriptTimeout(AppleScriptError):
+    """ワーカーが時間内に応答しなかった"""
+
+
+class AppleScriptWorker:
+    """
+    1つの常駐インタプリタプロセスとのやり取りを担当する。
+    フレーミングは改行区切りJSON。クラッシュ・タイムアウト時は次回呼び出しで自動再起動する。
+    command にはプロトコル互換の代替インタプリタ (テスト用のPythonスクリプト等) も指定できる。
+    """
+
+    def __init__(self, command: Optional[List[str]] = None, timeout: float = 5.0):
+        self.command = list(command or DEFAULT_WORKER_COMMAND)
+        self.timeout = timeout
+        self._proc = None
+        self._responses = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._started = False
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        if self._started:
+            self.restarts += 1
+        self._started = True
+        self._kill()
+        self._proc = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            bufsize=1,
+        )
+        self._responses = queue.Queue()
+        threading.Thread(target=self._read_loop, args=(self._proc, self._responses), daemon=True).start()
+
+    def _read_loop(self, proc, responses):
+        # 応答を1行ずつキューへ。EOF(クラッシュ・終了)は None で通知する
+        for line in proc.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                responses.put(json.loads(line))
+            except ValueError:
+                continue
+        responses.put(None)
+
+    def _kill(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.kill()
+            proc.wait(timeout=1.0)
+        except Exception:
+            pass
+
+    def stop(self):
+        with self._lock:
+            self._kill()
+
+    def execute(self, script: str, timeout: Optional[float] = None) -> str:
+        """スクリプトを実行して結果文字列を返す。失敗時は AppleScriptError を送出"""
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if not self.alive:
+                self.start()
+            req_id = next(self._ids)
+            # ASCII のみで送る (ワーカー側は読み取った塊ごとにデコードするため)
+            payload = json.dumps({"id": req_id, "script": script}) + "\n"
+            try:
+                self._proc.stdin.write(payload)
+                self._proc.stdin.flush()
+            except (BrokenPipeError, OSError):
+                # 書き込み前に落ちていた場合は1回だけ再起動して送り直す
+                self.start()
+                self._proc.stdin.write(payload)
+                self._proc.stdin.flush()
+
+            while True:
+                try:
+                    res = self._responses.get(timeout=timeout)
+                except queue.Empty:
+                    # 応答しないワーカーは捨てて、次回呼び出しで作り直す
+                    self._kill()
+                    raise AppleScriptTimeout(f"timeout after {timeout}s")
+                if res is None:
+                    self._kill()
+                    raise AppleScriptError("worker exited")
+                if res.get("id") != req_id:
+                    continue
+                if res.get("ok"):
+                    return res.get("result", "")
+                raise AppleScriptError(res.get("error", "unknown error"))
+
+
+class AppleScriptWorkerPool:
+    """同時に呼ばれても待たされないよう、小さなワーカープールで常駐プロセスを使い回す"""
+
+    def __init__(self, size: int = 2, command: Optional[List[str]] = None, timeout: float = 5.0):
+        self.size = size
+        self.command = command
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _acquire(self) -> AppleScriptWorker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                worker = AppleScriptWorker(self.command, self.timeout)
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def execute(self, script: str, timeout: Optional[float] = None) -> str:
+        worker = self._acquire()
+        try:
+            return worker.execute(script, timeout)
+        finally:
+            # LIFOで返すので、直近に使った(温まっている)ワーカーが優先される
+            self._idle.put(worker)
+
+    def warm(self):
+        """ワーカーを size 個まで先に起動しておく (最初のスクリプト実行でプロセスの起動を待たないように)"""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+                worker = AppleScriptWorker(self.command, self.timeout)
+                self._workers.append(worker)
+            try:
+                with worker._lock:
+                    if not worker.alive:
+                        worker.start()
+            finally:
+                # 起動に失敗しても execute 側で起動し直すので、プールには戻しておく
+                self._idle.put(worker)
+
+    def close(self):
+        for worker in self._workers:
+            worker.stop()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> AppleScriptWorkerPool:
+    """プロセス共通のワーカープール (初回呼び出し時に生成)"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = AppleScriptWorkerPool()
+            atexit.register(_default_pool.close)
+        return _default_pool
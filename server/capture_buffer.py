@@ -0,0 +1,191 @@
+import collections
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Optional
+
+
+@dataclass
+class Frame:
+    """バックグラウンドで撮影した1フレーム"""
+    seq: int
+    timestamp: float  # time.time() (撮影完了時刻)
+    image: Any
+    nbytes: int
+
+
+def image_nbytes(image) -> int:
+    """画像が占めるおおよそのメモリ量"""
+    try:
+        w, h = image.size
+        return w * h * len(image.getbands())
+    except Exception:
+        return 0
+
+
+class FrameRingBuffer:
+    """
+    フレーム数とバイト数の上限を持つリングバッファ。
+    上限を超えると古いフレームから捨てる (evicted に数える)。
+    """
+
+    def __init__(self, max_frames: int = 30, max_bytes: int = 256 * 1024 * 1024):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self._frames: Deque[Frame] = collections.deque()
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self.pushed = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def push(self, frame: Frame):
+        with self._cond:
+            self._frames.append(frame)
+            self._bytes += frame.nbytes
+            self.pushed += 1
+            while self._frames and (len(self._frames) > self.max_frames or
+                                    (self._bytes > self.max_bytes and len(self._frames) > 1)):
+                old = self._frames.popleft()
+                self._bytes -= old.nbytes
+                self.evicted += 1
+            self._cond.notify_all()
+
+    def latest(self) -> Optional[Frame]:
+        with self._cond:
+            return self._frames[-1] if self._frames else None
+
+    def first_after(self, timestamp: float) -> Optional[Frame]:
+        """timestamp より後に撮影された最初のフレーム"""
+        with self._cond:
+            for frame in self._frames:
+                if frame.timestamp > timestamp:
+                    return frame
+        return None
+
+    def wait_for_frame_after(self, timestamp: float, timeout: float) -> Optional[Frame]:
+        """timestamp より後のフレームが届くまで最大 timeout 秒待つ"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for frame in self._frames:
+                    if frame.timestamp > timestamp:
+                        return frame
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def clear(self):
+        with self._cond:
+            self._frames.clear()
+            self._bytes = 0
+
+
+class BackgroundCapturer:
+    """
+    source() を一定レートで呼んでフレームをリングバッファに溜めるバックグラウンドスレッド。
+    撮影が間に合わずに飛ばした回数は dropped に、source() が None を返して (撮れずに) 飛ばした回数は skipped に数える。
+    """
+
+    def __init__(self, source: Callable[[], Any], fps: float = 5.0, buffer: Optional[FrameRingBuffer] = None,
+                 name: str = ""):
+        self.source = source
+        self.fps = fps
+        self.buffer = buffer if buffer is not None else FrameRingBuffer()
+        self.name = name
+        self._stop = threading.Event()
+        self._thread = None
+        self._seq = 0
+        self.captured = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = ""
+        self.capture_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        period = 1.0 / self.fps
+        t0 = time.monotonic()
+        k = 0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                image = self.source()
+                if image is not None:
+                    self._seq += 1
+                    self.buffer.push(Frame(self._seq, time.time(), image, image_nbytes(image)))
+                    self.captured += 1
+                else:
+                    self.skipped += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+            now = time.monotonic()
+            # 撮影時間の指数移動平均
+            self.capture_ms = 0.8 * self.capture_ms + 0.2 * (now - started) * 1000
+
+            # 絶対期限で次の撮影時刻を決め、間に合わなかった分は飛ばして数える
+            k += 1
+            behind = int((now - t0) / period) - k
+            if behind > 0:
+                self.dropped += behind
+                k += behind
+            self._stop.wait(max(0.0, t0 + k * period - time.monotonic()))
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "fps": self.fps,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "evicted": self.buffer.evicted,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "frames": len(self.buffer),
+            "buffer_mb": self.buffer.nbytes / (1024 * 1024),
+            "capture_ms": self.capture_ms,
+        }
+
+
+class FakeFrameSource:
+    """テスト用のフレームソース。呼ばれるたびに連番入りの小さな画像 (無ければ連番そのもの) を返す"""
+
+    def __init__(self, size=(64, 48), cost: float = 0.0):
+        self.size = size
+        self.cost = cost
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.cost:
+            time.sleep(self.cost)
+        try:
+            from PIL import Image
+            return Image.new("RGB", self.size, (self.calls % 256, 0, 0))
+        except ImportError:
+            return self.calls
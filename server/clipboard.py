@@ -0,0 +1,53 @@
+import subprocess
+from typing import List
+
+
+class PasteboardClipboard:
+    """NSPasteboard (AppKit) を直接操作するクリップボード。pbcopy を起動しないので速い"""
+
+    def __init__(self):
+        # AppKit は pyobjc-framework-Quartz の依存として入る Mac 専用モジュール
+        import AppKit
+        self._pb = AppKit.NSPasteboard.generalPasteboard()
+        self._type = AppKit.NSPasteboardTypeString
+
+    def write(self, text: str):
+        self._pb.clearContents()
+        self._pb.setString_forType_(text, self._type)
+
+    def read(self) -> str:
+        return self._pb.stringForType_(self._type) or ""
+
+
+class PbcopyClipboard:
+    """pbcopy / pbpaste を使うクリップボード (AppKit が使えない場合の予備)"""
+
+    def write(self, text: str):
+        process = subprocess.Popen(['pbcopy'], stdin=subprocess.PIPE)
+        process.communicate(input=text.encode('utf-8'))
+
+    def read(self) -> str:
+        return subprocess.run(['pbpaste'], capture_output=True).stdout.decode('utf-8')
+
+
+class FakeClipboard:
+    """テスト用のクリップボード (Linuxでも動作)。書き込み履歴を残す"""
+
+    def __init__(self):
+        self.text = ""
+        self.writes: List[str] = []
+
+    def write(self, text: str):
+        self.text = text
+        self.writes.append(text)
+
+    def read(self) -> str:
+        return self.text
+
+
+def default_clipboard():
+    """使える中で一番速いクリップボードを返す"""
+    try:
+        return PasteboardClipboard()
+    except Exception:
+        return PbcopyClipboard()
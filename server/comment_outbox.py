@@ -0,0 +1,199 @@
+import asyncio
+import collections
+import contextvars
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, List, Optional
+
+from action_queue import LatencyStats
+
+
+class RateLimiter:
+    """送信間隔を min_interval 秒以上あける (スレッドセーフ)"""
+
+    def __init__(self, min_interval: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.min_interval = min_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, sleep: Optional[Callable[[float], None]] = None) -> float:
+        """
+        次の送信枠まで待ち、待った秒数を返す。
+        sleep を指定すると、待つ間はその関数を使う (入力ロックを手放して待つ場合など)。
+        """
+        with self._lock:
+            now = self._clock()
+            wait = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self.min_interval
+        if wait > 0:
+            (sleep or self._sleep)(wait)
+            self.waited += wait
+        return wait
+
+
+@dataclass
+class _Pending:
+    text: str
+    enqueued_at: float
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+
+class OutboxSession:
+    """
+    チャットを1回開いている間の送信セッション (送信スレッドから使う)。
+    next() で次に送るコメントを取り出し、送り終えたら done(result) で結果を返す (失敗した場合は ok=False)。
+    """
+
+    def __init__(self, outbox: "CommentOutbox", loop: asyncio.AbstractEventLoop):
+        self._outbox = outbox
+        self._loop = loop
+        self._current: Optional[_Pending] = None
+        self._started = 0.0
+        self.count = 0
+
+    def next(self) -> Optional[str]:
+        """次のコメント。max_batch 件送ったか送信待ちが無ければ None"""
+        if self.count >= self._outbox.max_batch:
+            return None
+        pending = self._outbox._take()
+        if pending is None:
+            return None
+        self._current = pending
+        self._started = time.monotonic()
+        self.count += 1
+        return pending.text
+
+    def done(self, result: str, ok: bool = True):
+        if self._current is None:
+            return
+        pending, self._current = self._current, None
+        self._loop.call_soon_threadsafe(self._outbox._finish, pending, result, ok, self._started, time.monotonic())
+
+    def fail(self, result: str):
+        """送信中のコメントがあればエラーとして結果を返す"""
+        self.done(result, ok=False)
+
+
+class CommentOutbox:
+    """
+    チャットコメントの送信キュー。
+    送信中 (チャットを開いている間) に届いたコメントは、チャットを閉じずに続けて貼り付ける (最大 max_batch 件)。
+    同じ文面が送信待ちにある場合は1件にまとめ、送信待ちが max_pending 件を超えた分は捨てる。
+
+    runner(session, rate_limiter) は session.next() でコメントを取り出して送信するコルーチン。
+    runner は呼び出し元のコンテキストを引き継がない送信タスクから呼ばれる。
+    """
+
+    def __init__(self, runner: Callable[[OutboxSession, RateLimiter], Awaitable[None]],
+                 min_interval: float = 1.0, max_pending: int = 20, max_batch: int = 10):
+        self.runner = runner
+        self.rate_limiter = RateLimiter(min_interval)
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self._pending: Deque[_Pending] = collections.deque()
+        # 送信スレッドからも取り出すのでロックで守る
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._worker = None
+        self.latency = LatencyStats()
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.batches = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, text: str) -> asyncio.Future:
+        """コメントを積んで、送信結果を受け取る Future を返す"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            for pending in self._pending:
+                if pending.text == text:
+                    # 送信待ちの同じ文面にまとめる
+                    pending.futures.append(future)
+                    self.coalesced += 1
+                    return future
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                future.set_result(f"コメント破棄 (送信待ちが上限 {self.max_pending} 件): {text}")
+                return future
+            self._pending.append(_Pending(text, time.monotonic(), [future]))
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._worker is None or self._worker.done():
+            # 送信タスクは後から積まれたコメントもまとめて送るので、最初に積んだ呼び出し元のコンテキスト
+            # (要求元のクライアントなど) を引き継がないよう、空のコンテキストで作る
+            self._worker = contextvars.Context().run(asyncio.create_task, self._run())
+        return future
+
+    async def submit(self, text: str) -> str:
+        """コメントを積んで送信完了まで待つ"""
+        return await self.enqueue(text)
+
+    def _take(self) -> Optional[_Pending]:
+        with self._lock:
+            return self._pending.popleft() if self._pending else None
+
+    def _finish(self, pending: _Pending, result: str, ok: bool, started: float, finished: float):
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self.latency.record(started - pending.enqueued_at, finished - pending.enqueued_at, ok)
+        for future in pending.futures:
+            if not future.done():
+                future.set_result(result)
+
+    def _fail_batch(self, result: str):
+        now = time.monotonic()
+        for _ in range(self.max_batch):
+            pending = self._take()
+            if pending is None:
+                break
+            self._finish(pending, result, False, now, now)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            session = OutboxSession(self, loop)
+            error = "コメント送信エラー: 送信されませんでした"
+            try:
+                await self.runner(session, self.rate_limiter)
+            except Exception as e:
+                error = f"コメント送信エラー: {e}"
+                session.fail(error)
+            if session.count == 0:
+                # 1件も取り出す前に終わった (入力キューの混雑・期限切れなど)。送信待ちが残ったままだと
+                # 同じ失敗を繰り返して空回りするので、このバッチで送るはずだった分を失敗として返す
+                self._fail_batch(error)
+            self.batches += 1
+            # 送信スレッドからの結果通知 (call_soon_threadsafe) を先に処理させる
+            await asyncio.sleep(0)
+
+    def stats(self) -> dict:
+        return dict(
+            self.latency.summary(),
+            depth=self.depth,
+            sent=self.sent,
+            failed=self.failed,
+            batches=self.batches,
+            coalesced=self.coalesced,
+            dropped=self.dropped,
+            rate_wait=self.rate_limiter.waited,
+        )
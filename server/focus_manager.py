@@ -0,0 +1,178 @@
+import time
+from typing import Callable, Optional, Tuple
+
+
+class FocusManager:
+    """
+    最前面のアプリとウィンドウ配置を追跡し、実際に変化していた時だけフォーカスし直す。
+    切り替え後は固定スリープではなく、最前面になったことを確認できるまでポーリングで待つ。
+    OS は指定の位置をそのまま使うとは限らない (メニューバーの下に押し下げる等) ので、移動後に実際に
+    なった配置をウィンドウIDと合わせて覚えておき、次回からはそれと一致すれば配置済みとみなす。
+
+    activate: (app_name_keyword, width, height, x, y) を受け取り、
+              アクティブ化と配置を行う関数。失敗時はエラーメッセージ、成功時は None を返す。
+    activate_window: (pid, window_id) を受け取り、そのウィンドウを最前面にする関数 (配置は変えない)。
+              同じアプリを複数起動している場合のインスタンス単位のフォーカスに使う。
+    """
+
+    def __init__(self, registry, activate: Callable[..., Optional[str]],
+                 activate_window: Optional[Callable[[int, int], Optional[str]]] = None,
+                 settle_timeout: float = 0.5, poll_interval: float = 0.02,
+                 state_max_age: float = 0.1,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.registry = registry
+        self._activate = activate
+        self.activate_window = activate_window
+        self.settle_timeout = settle_timeout
+        self.poll_interval = poll_interval
+        self.state_max_age = state_max_age
+        self._clock = clock
+        self._sleep = sleep
+        self.current_app = None
+        self.current_bounds = None
+        self.current_window = None
+        # アプリ名 -> (指定した (x, y, width, height), ウィンドウID, 移動後に実際になった bounds)
+        self._placed = {}
+        self.skips = 0
+        self.refocuses = 0
+        self.settle_timeouts = 0
+
+    def stats(self) -> dict:
+        return {
+            "current_app": self.current_app,
+            "current_bounds": self.current_bounds,
+            "current_window": self.current_window,
+            "skips": self.skips,
+            "refocuses": self.refocuses,
+            "settle_timeouts": self.settle_timeouts,
+        }
+
+    def is_frontmost(self, app_name_keyword: str, max_age: Optional[float] = None) -> bool:
+        """アプリが最前面にあるか (配置は見ない)"""
+        max_age = self.state_max_age if max_age is None else max_age
+        try:
+            front = self.registry.frontmost(max_age=max_age)
+        except Exception:
+            return False
+        return front is not None and app_name_keyword.lower() in front.owner_name.lower()
+
+    def is_focused(self, app_name_keyword: str, x: int = 0, y: int = 0,
+                   width: Optional[int] = None, height: Optional[int] = None,
+                   max_age: Optional[float] = None) -> bool:
+        """
+        アプリが最前面にあり、ウィンドウが指定の位置・サイズになっているか。
+        同じ指定で前回移動した結果の配置 (OS が調整した後の位置) のままでも配置済みとみなす。
+        """
+        if not self.is_frontmost(app_name_keyword, max_age):
+            return False
+        try:
+            win = self.registry.find(app_name_keyword)
+        except Exception:
+            # 状態を確認できない場合は常にフォーカスし直す
+            return False
+        if win is None:
+            return False
+        placed = self._placed.get(app_name_keyword)
+        settled = placed is not None and placed == ((x, y, width, height), win.window_id, tuple(win.bounds))
+        if not settled and not _geometry_matches(win.bounds, x, y, width, height):
+            return False
+        self.current_app = app_name_keyword
+        self.current_bounds = win.bounds
+        return True
+
+    def wait_until_focused(self, app_name_keyword: str, timeout: Optional[float] = None) -> bool:
+        """最前面になるまで待つ (最大 timeout 秒)。確認できたら True"""
+        timeout = self.settle_timeout if timeout is None else timeout
+        deadline = self._clock() + timeout
+        while True:
+            # ポーリング中は毎回取り直す。配置は activate が済ませているので最前面かどうかだけを見る
+            if self.is_frontmost(app_name_keyword, max_age=0):
+                return True
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                self.settle_timeouts += 1
+                return False
+            self._sleep(min(self.poll_interval, remaining))
+
+    def ensure_focus(self, app_name_keyword: str, width: Optional[int] = None, height: Optional[int] = None,
+                     x: int = 0, y: int = 0) -> Tuple[bool, Optional[str]]:
+        """
+        必要な時だけフォーカスし直す。
+        戻り値: (フォーカスし直したか, エラーメッセージ or None)
+        """
+        if self.is_focused(app_name_keyword, x, y, width, height):
+            self.skips += 1
+            return False, None
+
+        error = self._activate(app_name_keyword, width, height, x, y)
+        # 位置・サイズを変更したのでキャッシュ済みのジオメトリを捨てる
+        self.registry.invalidate(app_name_keyword)
+        self.current_app = None
+        self.current_bounds = None
+        self._placed.pop(app_name_keyword, None)
+        if error:
+            return True, error
+
+        self.refocuses += 1
+        if self.wait_until_focused(app_name_keyword):
+            self._remember_placement(app_name_keyword, x, y, width, height)
+        return True, None
+
+    def _remember_placement(self, app_name_keyword, x, y, width, height):
+        # 移動後に実際になった配置を覚える (指定と違っていても、次回の判定はこれと比べる)
+        try:
+            win = self.registry.find(app_name_keyword)
+        except Exception:
+            return
+        if win is not None:
+            self._placed[app_name_keyword] = ((x, y, width, height), win.window_id, tuple(win.bounds))
+            self.current_app = app_name_keyword
+            self.current_bounds = win.bounds
+
+    def is_window_focused(self, pid: int, window_id: int, max_age: Optional[float] = None) -> bool:
+        """pid のプロセスが最前面にあるか (キー入力はプロセス単位で届くので PID で判定する)"""
+        max_age = self.state_max_age if max_age is None else max_age
+        try:
+            front = self.registry.frontmost(max_age=max_age)
+        except Exception:
+            return False
+        if front is None or front.pid != pid:
+            return False
+        self.current_window = (pid, window_id)
+        return True
+
+    def ensure_window_focus(self, pid: int, window_id: int) -> Tuple[bool, Optional[str]]:
+        """
+        (pid, window_id) のウィンドウを必要な時だけ最前面にする (位置・サイズは変えない)。
+        戻り値: (フォーカスし直したか, エラーメッセージ or None)
+        """
+        if self.is_window_focused(pid, window_id):
+            self.skips += 1
+            return False, None
+        if self.activate_window is None:
+            return True, "エラー: ウィンドウ単位のアクティブ化に対応していません"
+        error = self.activate_window(pid, window_id)
+        self.current_app = None
+        self.current_bounds = None
+        self.current_window = None
+        if error:
+            return True, error
+        self.refocuses += 1
+        deadline = self._clock() + self.settle_timeout
+        while not self.is_window_focused(pid, window_id, max_age=0):
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                self.settle_timeouts += 1
+                break
+            self._sleep(min(self.poll_interval, remaining))
+        return True, None
+
+
+def _geometry_matches(bounds, x, y, width=None, height=None) -> bool:
+    bx, by, bw, bh = bounds
+    if (bx, by) != (x, y):
+        return False
+    if width is not None and height is not None and (bw, bh) != (width, height):
+        return False
+    return True
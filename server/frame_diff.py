@@ -0,0 +1,143 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+Box = Tuple[int, int, int, int]  # (x, y, w, h)
+
+
+def _gray(img: Image.Image, scale: float = 1.0) -> np.ndarray:
+    """グレースケールの float32 配列に変換 (scale < 1 なら縮小してから)"""
+    if scale < 1.0:
+        w, h = img.size
+        img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.Resampling.BILINEAR)
+    return np.asarray(img.convert("L"), dtype=np.float32)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0, :] = np.sqrt(1.0 / n)
+    return m
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(img: Image.Image, hash_size: int = 8) -> int:
+    """知覚ハッシュ (32x32 に縮小 → 2次元DCT → 低周波成分を中央値で2値化)"""
+    small = np.asarray(img.convert("L").resize((32, 32), Image.Resampling.BILINEAR), dtype=np.float32)
+    dct = _DCT32 @ small @ _DCT32.T
+    low = dct[:hash_size, :hash_size].flatten()
+    bits = low > np.median(low[1:])
+    value = 0
+    for b in bits:
+        value = (value << 1) | int(b)
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+@dataclass
+class FrameDiff:
+    """2フレームの比較結果"""
+    score: float  # 変化したタイルの割合 (0.0-1.0)
+    mean_diff: float  # 画素値差の平均 (0-255)
+    phash_distance: int
+    boxes: List[Box] = field(default_factory=list)
+
+    def changed(self, threshold: float) -> bool:
+        return self.score >= threshold
+
+    def describe(self) -> str:
+        boxes = ", ".join(f"({x},{y},{w},{h})" for x, y, w, h in self.boxes) or "なし"
+        return (f"変化スコア {self.score:.3f} (平均差 {self.mean_diff:.1f}, phash距離 {self.phash_distance}/64), "
+                f"変化領域: {boxes}")
+
+
+def _tile_boxes(mask: np.ndarray, tile_w: float, tile_h: float, size: Tuple[int, int]) -> List[Box]:
+    """変化タイルのマスクを連結成分ごとの外接矩形 (元画像の座標) にまとめる"""
+    rows, cols = mask.shape
+    seen = np.zeros_like(mask, dtype=bool)
+    boxes = []
+    width, height = size
+    for r in range(rows):
+        for c in range(cols):
+            if not mask[r, c] or seen[r, c]:
+                continue
+            stack = [(r, c)]
+            seen[r, c] = True
+            r0 = r1 = r
+            c0 = c1 = c
+            while stack:
+                y, x = stack.pop()
+                r0, r1 = min(r0, y), max(r1, y)
+                c0, c1 = min(c0, x), max(c1, x)
+                # 斜めも含めて隣接とみなす
+                for dy in (-1, 0, 1):
+                    for dx in (-1, 0, 1):
+                        ny, nx = y + dy, x + dx
+                        if 0 <= ny < rows and 0 <= nx < cols and mask[ny, nx] and not seen[ny, nx]:
+                            seen[ny, nx] = True
+                            stack.append((ny, nx))
+            x0 = int(c0 * tile_w)
+            y0 = int(r0 * tile_h)
+            x1 = min(width, int(round((c1 + 1) * tile_w)))
+            y1 = min(height, int(round((r1 + 1) * tile_h)))
+            boxes.append((x0, y0, x1 - x0, y1 - y0))
+    # 大きい領域から順に
+    boxes.sort(key=lambda b: b[2] * b[3], reverse=True)
+    return boxes
+
+
+def diff_frames(prev: Image.Image, cur: Image.Image, tile: int = 16, threshold: float = 12.0,
+                scale: float = 0.25) -> FrameDiff:
+    """
+    2フレームをタイルごとに比較する。
+    scale 倍に縮小したグレースケール画像を tile ピクセル角のタイルに分け、
+    平均絶対差が threshold を超えたタイルを「変化あり」とする。
+    """
+    if prev.size != cur.size:
+        # ウィンドウサイズが変わった場合は全体が変化したとみなす
+        w, h = cur.size
+        return FrameDiff(1.0, 255.0, hamming(phash(prev), phash(cur)), [(0, 0, w, h)])
+
+    a = _gray(prev, scale)
+    b = _gray(cur, scale)
+    diff = np.abs(a - b)
+
+    h, w = diff.shape
+    rows = -(-h // tile)
+    cols = -(-w // tile)
+    # 端のタイルは画像外を0で埋め、実際の画素数で平均する
+    padded = np.zeros((rows * tile, cols * tile), dtype=np.float32)
+    padded[:h, :w] = diff
+    counts = np.zeros_like(padded)
+    counts[:h, :w] = 1.0
+    sums = padded.reshape(rows, tile, cols, tile).sum(axis=(1, 3))
+    tiles = sums / counts.reshape(rows, tile, cols, tile).sum(axis=(1, 3))
+    mask = tiles > threshold
+
+    # 縮小後のタイル1辺を元画像のピクセル数に戻す
+    width, height = cur.size
+    boxes = _tile_boxes(mask, tile * width / w, tile * height / h, cur.size) if mask.any() else []
+    return FrameDiff(
+        score=float(mask.mean()),
+        mean_diff=float(diff.mean()),
+        phash_distance=hamming(phash(prev), phash(cur)),
+        boxes=boxes,
+    )
+
+
+def crop_regions(img: Image.Image, boxes: List[Box], limit: int = 4, padding: int = 8) -> List[Image.Image]:
+    """変化領域を少し余白を付けて切り出す"""
+    crops = []
+    w, h = img.size
+    for x, y, bw, bh in boxes[:limit]:
+        crops.append(img.crop((max(0, x - padding), max(0, y - padding),
+                               min(w, x + bw + padding), min(h, y + bh + padding))))
+    return crops
@@ -0,0 +1,100 @@
+import io
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import Image
+
+FORMATS = ("png", "jpeg", "webp")
+
+
+@dataclass
+class EncodedImage:
+    """エンコード済み画像とその統計"""
+    data: bytes
+    format: str
+    size: Tuple[int, int]
+    original_size: Tuple[int, int]
+    resize_ms: float
+    encode_ms: float
+
+    @property
+    def byte_size(self) -> int:
+        return len(self.data)
+
+    def describe(self) -> str:
+        w, h = self.size
+        ow, oh = self.original_size
+        scaled = f" (元 {ow}x{oh}, 縮小 {self.resize_ms:.1f}ms)" if self.size != self.original_size else ""
+        return f"{w}x{h} {self.format} {self.byte_size} bytes, エンコード {self.encode_ms:.1f}ms{scaled}"
+
+
+def normalize_format(fmt: str) -> str:
+    fmt = (fmt or "png").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in FORMATS:
+        raise ValueError(f"format は {', '.join(FORMATS)} のいずれかを指定してください: {fmt}")
+    return fmt
+
+
+def encode_image(img: Image.Image, fmt: str = "png", max_dimension: Optional[int] = None,
+                 quality: int = 80) -> EncodedImage:
+    """
+    画像をメモリ上でエンコードする。
+    max_dimension を指定すると長辺がその値以下になるよう縮小する (アスペクト比は維持)。
+    quality は JPEG / WebP の画質 (1-100)。PNG では使わない。
+    """
+    fmt = normalize_format(fmt)
+    original_size = img.size
+
+    t0 = time.perf_counter()
+    if max_dimension and max(img.size) > max_dimension:
+        img = img.copy()
+        # reducing_gap で先に整数倍で縮めてから補間するので、Retinaの大きな画像でも速い
+        img.thumbnail((max_dimension, max_dimension), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    resize_ms = (time.perf_counter() - t0) * 1000
+
+    # JPEGはアルファを持てない。スクリーンショットのアルファは不要なのでWebPも揃える
+    if fmt in ("jpeg", "webp") and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    t0 = time.perf_counter()
+    buf = io.BytesIO()
+    if fmt == "png":
+        img.save(buf, format="PNG")
+    elif fmt == "jpeg":
+        img.save(buf, format="JPEG", quality=quality)
+    else:
+        # method=0 が最速 (デフォルトの4は画面キャプチャには遅すぎる)
+        img.save(buf, format="WEBP", quality=quality, method=0)
+    encode_ms = (time.perf_counter() - t0) * 1000
+
+    return EncodedImage(buf.getvalue(), fmt, img.size, original_size, resize_ms, encode_ms)
+
+
+def synthetic_frame(width: int = 2880, height: int = 1800) -> Image.Image:
+    """ベンチマーク用の画面っぽい合成画像 (グラデーション + UI風の矩形 + ノイズ)"""
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    img = Image.blend(img, noise, 0.3)
+    panel = Image.new("RGB", (width // 3, height // 6), (30, 30, 40))
+    for i in range(4):
+        img.paste(panel, (width // 20 + i * width // 5, height - height // 5))
+    return img
+
+
+def benchmark(width: int = 2880, height: int = 1800, repeat: int = 3):
+    """形式・縮小サイズごとのエンコード時間とバイト数を計測して表示する"""
+    img = synthetic_frame(width, height)
+    print(f"source {width}x{height}")
+    for max_dimension in (None, 1920, 1280, 768):
+        for fmt in FORMATS:
+            results = [encode_image(img, fmt, max_dimension) for _ in range(repeat)]
+            best = min(results, key=lambda r: r.resize_ms + r.encode_ms)
+            print(f"  max={max_dimension or '-':>5} {fmt:>5}: "
+                  f"{best.resize_ms + best.encode_ms:8.1f}ms {best.byte_size:>9} bytes {best.size}")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,280 @@
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from action_queue import percentile
+from clipboard import FakeClipboard, default_clipboard
+from metrics import span
+from window_registry import FakeWindowBackend, WindowInfo, WindowRegistry
+
+BUTTONS = ("left", "right", "middle")
+
+_pyautogui = None
+
+
+def load_pyautogui():
+    """pyautogui を初回利用時に読み込んで設定する (読み込みが重いので起動時には読まない)"""
+    global _pyautogui
+    if _pyautogui is None:
+        import pyautogui
+        # PyAutoGUIの安全装置（マウスを画面四隅にやると停止）
+        pyautogui.FAILSAFE = True
+        # デフォルトの遅延(0.1s)を無効化し、手動で制御する
+        pyautogui.PAUSE = 0
+        _pyautogui = pyautogui
+    return _pyautogui
+
+
+class InputBackend:
+    """
+    入力バックエンドの共通部分。
+    実装は mouse_position / mouse_move / mouse_drag / mouse_button / scroll / key_down / key_up を持つ。
+    クリップボードとウィンドウ情報は clipboard / registry に委ねる (clipboard 省略時は初回利用時に用意する)。
+    """
+
+    def __init__(self, registry: WindowRegistry, clipboard=None):
+        self.registry = registry
+        self._clipboard = clipboard
+
+    @property
+    def clipboard(self):
+        if self._clipboard is None:
+            self._clipboard = default_clipboard()
+        return self._clipboard
+
+    @clipboard.setter
+    def clipboard(self, clipboard):
+        self._clipboard = clipboard
+
+    def prewarm(self):
+        """重いモジュールを先に読み込んでおく (読み込むものが無い実装では何もしない)"""
+
+    def sleep(self, seconds: float, cancel: Optional[threading.Event] = None) -> bool:
+        """seconds 秒待つ。cancel がセットされたら途中で戻り True を返す"""
+        if seconds <= 0:
+            return False
+        if cancel is not None:
+            return cancel.wait(seconds)
+        time.sleep(seconds)
+        return False
+
+    def press(self, key: str):
+        self.key_down(key)
+        self.key_up(key)
+
+    def hotkey(self, *keys: str):
+        """同時押し (押した逆順に離す)"""
+        for k in keys:
+            self.key_down(k)
+        for k in reversed(keys):
+            self.key_up(k)
+
+    def clipboard_write(self, text: str):
+        self.clipboard.write(text)
+
+    def clipboard_read(self) -> str:
+        return self.clipboard.read()
+
+    def window_bounds(self, app_name: str):
+        return self.registry.get_bounds(app_name)
+
+    def record_schedule(self, stats):
+        """スケジューラの実行記録を受け取る (記録しない実装では何もしない)"""
+
+
+class QuartzInputBackend(InputBackend):
+    """
+    Quartz の CGEventPost でマウス、pyautogui でキーボードを操作する Mac 用バックエンド。
+    Quartz / pyautogui は Mac 専用で読み込みも重いので、最初の入力 (または prewarm) の時点で読み込む。
+    """
+
+    def __init__(self, registry: Optional[WindowRegistry] = None, clipboard=None):
+        super().__init__(registry or WindowRegistry(), clipboard)
+        self._quartz = None
+        self._button_map = None
+
+    @property
+    def _q(self):
+        if self._quartz is None:
+            import Quartz
+            self._quartz = Quartz
+        return self._quartz
+
+    @property
+    def _gui(self):
+        return load_pyautogui()
+
+    @property
+    def _buttons(self):
+        if self._button_map is None:
+            q = self._q
+            # ボタン名 -> (押下, 解放, ドラッグ, ボタン番号)
+            self._button_map = {
+                "left": (q.kCGEventLeftMouseDown, q.kCGEventLeftMouseUp, q.kCGEventLeftMouseDragged,
+                         q.kCGMouseButtonLeft),
+                "right": (q.kCGEventRightMouseDown, q.kCGEventRightMouseUp, q.kCGEventRightMouseDragged,
+                          q.kCGMouseButtonRight),
+                "middle": (q.kCGEventOtherMouseDown, q.kCGEventOtherMouseUp, q.kCGEventOtherMouseDragged,
+                           q.kCGMouseButtonCenter),
+            }
+        return self._button_map
+
+    def prewarm(self):
+        self._buttons
+        self._gui
+        self.clipboard
+
+    def _post_mouse(self, event_type, x, y, button, dx=0, dy=0):
+        q = self._q
+        with span("mouse_event"):
+            # 座標はfloatである必要がある
+            e = q.CGEventCreateMouseEvent(None, event_type, (float(x), float(y)), button)
+            # Delta値を明示的に設定 (ゲーム視点操作用)
+            if dx != 0 or dy != 0:
+                q.CGEventSetIntegerValueField(e, q.kCGMouseEventDeltaX, int(dx))
+                q.CGEventSetIntegerValueField(e, q.kCGMouseEventDeltaY, int(dy))
+            q.CGEventPost(q.kCGHIDEventTap, e)
+
+    def mouse_position(self) -> Tuple[int, int]:
+        x, y = self._gui.position()
+        return int(x), int(y)
+
+    def mouse_move(self, x, y, dx=0, dy=0):
+        self._post_mouse(self._q.kCGEventMouseMoved, x, y, self._q.kCGMouseButtonLeft, dx, dy)
+
+    def mouse_drag(self, button: str, x, y, dx=0, dy=0):
+        _, _, drag, cg_button = self._buttons[button]
+        self._post_mouse(drag, x, y, cg_button, dx, dy)
+
+    def mouse_button(self, button: str, down: bool, x, y):
+        press, release, _, cg_button = self._buttons[button]
+        self._post_mouse(press if down else release, x, y, cg_button)
+
+    def scroll(self, dy: int, unit: str = "line"):
+        # dy: 正数が上(奥)、負数が下(手前)。unit は "line" (行単位) または "pixel" (ピクセル単位)
+        q = self._q
+        units = q.kCGScrollEventUnitPixel if unit == "pixel" else q.kCGScrollEventUnitLine
+        with span("scroll_event"):
+            q.CGEventPost(q.kCGHIDEventTap, q.CGEventCreateScrollWheelEvent(None, units, 1, int(dy)))
+
+    def key_down(self, key: str):
+        with span("key_event"):
+            self._gui.keyDown(key)
+
+    def key_up(self, key: str):
+        with span("key_event"):
+            self._gui.keyUp(key)
+
+    def press(self, key: str):
+        with span("key_event"):
+            self._gui.press(key)
+
+    def hotkey(self, *keys: str):
+        with span("key_event"):
+            self._gui.hotkey(*keys)
+
+    def clipboard_write(self, text: str):
+        with span("clipboard"):
+            self.clipboard.write(text)
+
+    def clipboard_read(self) -> str:
+        with span("clipboard"):
+            return self.clipboard.read()
+
+
+class InputEvent(NamedTuple):
+    """記録した入力イベント1件"""
+    timestamp: float
+    kind: str  # move, drag, button, scroll, key_down, key_up
+    data: tuple
+
+
+class RecordingInputBackend(InputBackend):
+    """
+    実際には入力せず、全イベントを時刻付きで記録するバックエンド (Linuxでも動作)。
+    sleep は実際に眠り、眠った時間を sleep_time に積算する (残りが処理時間)。
+    """
+
+    def __init__(self, windows: Optional[List[WindowInfo]] = None, position: Tuple[int, int] = (0, 0),
+                 clock: Callable[[], float] = time.perf_counter, sleep: Callable[[float], None] = time.sleep):
+        if windows is None:
+            windows = [WindowInfo(1, 1, "cluster", (0, 0, 1280, 800))]
+        super().__init__(WindowRegistry(FakeWindowBackend(windows)), FakeClipboard())
+        self.position = position
+        self._clock = clock
+        self._sleep = sleep
+        self.events: List[InputEvent] = []
+        self.schedules = []
+        self.sleep_time = 0.0
+        self.held_keys = set()
+        self.held_buttons = set()
+
+    def _record(self, kind: str, *data):
+        self.events.append(InputEvent(self._clock(), kind, data))
+
+    def reset(self):
+        self.events = []
+        self.schedules = []
+        self.sleep_time = 0.0
+
+    def sleep(self, seconds: float, cancel: Optional[threading.Event] = None) -> bool:
+        if seconds <= 0:
+            return False
+        started = self._clock()
+        interrupted = False
+        if cancel is not None:
+            interrupted = cancel.wait(seconds)
+        else:
+            self._sleep(seconds)
+        self.sleep_time += self._clock() - started
+        return interrupted
+
+    def mouse_position(self) -> Tuple[int, int]:
+        return self.position
+
+    def mouse_move(self, x, y, dx=0, dy=0):
+        self.position = (int(x), int(y))
+        self._record("move", int(x), int(y), int(dx), int(dy))
+
+    def mouse_drag(self, button: str, x, y, dx=0, dy=0):
+        if button not in BUTTONS:
+            raise ValueError(f"不明なボタン: {button}")
+        self.position = (int(x), int(y))
+        self._record("drag", button, int(x), int(y), int(dx), int(dy))
+
+    def mouse_button(self, button: str, down: bool, x, y):
+        if button not in BUTTONS:
+            raise ValueError(f"不明なボタン: {button}")
+        (self.held_buttons.add if down else self.held_buttons.discard)(button)
+        self._record("button", button, bool(down), int(x), int(y))
+
+    def scroll(self, dy: int, unit: str = "line"):
+        self._record("scroll", int(dy), unit)
+
+    def key_down(self, key: str):
+        self.held_keys.add(key)
+        self._record("key_down", key)
+
+    def key_up(self, key: str):
+        self.held_keys.discard(key)
+        self._record("key_up", key)
+
+    def record_schedule(self, stats):
+        self.schedules.append(stats)
+
+    def summary(self, wall: float) -> dict:
+        """wall 秒の実行に対するイベント数・sleep/処理時間・スケジュール誤差の集計"""
+        lateness = [v for s in self.schedules for v in s.lateness]
+        return {
+            "events": len(self.events),
+            "wall": wall,
+            "sleep": self.sleep_time,
+            "work": max(0.0, wall - self.sleep_time),
+            "ticks": sum(s.ticks for s in self.schedules),
+            "skipped": sum(s.skipped for s in self.schedules),
+            "sched_err_mean": sum(lateness) / len(lateness) if lateness else 0.0,
+            "sched_err_p99": percentile(lateness, 99),
+            "sched_err_max": max(lateness) if lateness else 0.0,
+            "held_keys": sorted(self.held_keys),
+            "held_buttons": sorted(self.held_buttons),
+        }
@@ -0,0 +1,88 @@
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+
+class Instance(NamedTuple):
+    """名前付きのクライアント1つ分 (PID とウィンドウIDに固定する)"""
+    name: str
+    pid: int
+    window_id: int
+    app_name: str
+
+
+class InstanceRegistry:
+    """
+    同じアプリを複数起動した時に、名前でクライアントを指定するための対応表。
+    アプリ名の部分一致ではなく (PID, ウィンドウID) でウィンドウを引くので、同名のクライアントを区別できる。
+    名前は大文字小文字を区別しない。
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._instances: Dict[str, Instance] = {}
+
+    def __contains__(self, name) -> bool:
+        return isinstance(name, str) and name.lower() in self._instances
+
+    def get(self, name: str) -> Optional[Instance]:
+        if not isinstance(name, str):
+            return None
+        return self._instances.get(name.lower())
+
+    def list(self) -> List[Instance]:
+        with self._lock:
+            return sorted(self._instances.values(), key=lambda i: i.name)
+
+    def bind(self, name: str, pid: int, window_id: int, app_name: str = "") -> Instance:
+        key = name.lower()
+        if not key:
+            raise ValueError("インスタンス名が空です")
+        instance = Instance(key, int(pid), int(window_id), app_name)
+        with self._lock:
+            self._instances[key] = instance
+        return instance
+
+    def unbind(self, name: str) -> bool:
+        with self._lock:
+            return self._instances.pop(name.lower(), None) is not None
+
+    def window(self, name: str):
+        """インスタンスのウィンドウ情報 (ウィンドウが閉じられていれば None)"""
+        instance = self.get(name)
+        if instance is None:
+            return None
+        return self.registry.get(instance.pid, instance.window_id)
+
+    def bounds(self, name: str):
+        win = self.window(name)
+        return win.bounds if win else None
+
+    def discover(self, app_name_keyword: str) -> List[Instance]:
+        """
+        アプリのウィンドウを列挙し、まだ登録されていないものを "<アプリ名>-<番号>" で登録する。
+        1プロセスにつき面積最大のウィンドウを使う。登録済みでウィンドウが無くなったものは外す。
+        """
+        self.registry.invalidate(app_name_keyword)
+        windows = self.registry.find_windows(app_name_keyword)
+        main_windows = {}
+        for w in windows:
+            best = main_windows.get(w.pid)
+            if best is None or w.bounds[2] * w.bounds[3] > best.bounds[2] * best.bounds[3]:
+                main_windows[w.pid] = w
+        alive = {(w.pid, w.window_id) for w in windows}
+        prefix = app_name_keyword.lower()
+        with self._lock:
+            for key, inst in list(self._instances.items()):
+                if inst.app_name.lower() == prefix and (inst.pid, inst.window_id) not in alive:
+                    del self._instances[key]
+            bound_pids = {i.pid for i in self._instances.values()}
+            n = 1
+            for w in sorted(main_windows.values(), key=lambda w: (w.pid, w.window_id)):
+                if w.pid in bound_pids:
+                    continue
+                while f"{prefix}-{n}" in self._instances:
+                    n += 1
+                name = f"{prefix}-{n}"
+                self._instances[name] = Instance(name, w.pid, w.window_id, app_name_keyword)
+        return [i for i in self.list() if i.app_name.lower() == prefix]
@@ -0,0 +1,73 @@
+from typing import Callable, List, Optional, Tuple
+
+from scheduler import DeadlineScheduler, ScheduleStats
+
+DOWN = "down"
+UP = "up"
+
+
+def build_key_timeline(events) -> List[Tuple[float, str, str]]:
+    """
+    (key, start, hold) を持つイベント列を、時刻順の押下・解放ストリーム [(秒, "down"|"up", キー)] にまとめる。
+    同じキーの押下が重なった場合は参照カウントで1回の押下にまとめ、最後の解放でだけ離す。
+    同時刻では解放を先に並べるので、連続した押下はいったん離してから押し直しになる。
+    """
+    raw = []
+    seq = 0
+    for ev in events:
+        keys = [k.strip().lower() for k in ev.key.split('+') if k.strip()]
+        end = ev.start + ev.hold
+        # 同時押しは記述順に押して逆順に離す
+        for k in keys:
+            raw.append((ev.start, 1, seq, k))
+            seq += 1
+        for k in reversed(keys):
+            raw.append((end, 0, seq, k))
+            seq += 1
+    raw.sort()
+
+    counts = {}
+    stream = []
+    for t, is_down, _, key in raw:
+        n = counts.get(key, 0)
+        if is_down:
+            if n == 0:
+                stream.append((t, DOWN, key))
+            counts[key] = n + 1
+        else:
+            counts[key] = n - 1
+            if n == 1:
+                stream.append((t, UP, key))
+    return stream
+
+
+def run_key_timeline(events, key_down: Callable[[str], None], key_up: Callable[[str], None],
+                     scheduler: Optional[DeadlineScheduler] = None,
+                     should_stop: Optional[Callable[[], bool]] = None) -> ScheduleStats:
+    """
+    キータイムラインを1つのスケジューラで実行する。
+    エラー・中断時も、押したままのキーは必ず全て離す。
+    """
+    stream = build_key_timeline(events)
+    scheduler = scheduler or DeadlineScheduler()
+    held = []
+
+    def on_event(i):
+        if should_stop is not None and should_stop():
+            raise InterruptedError("キー入力が中断されました")
+        _, kind, key = stream[i]
+        if kind == DOWN:
+            key_down(key)
+            held.append(key)
+        else:
+            key_up(key)
+            held.remove(key)
+
+    try:
+        return scheduler.run_events([t for t, _, _ in stream], on_event)
+    finally:
+        for key in reversed(held):
+            try:
+                key_up(key)
+            except Exception:
+                pass
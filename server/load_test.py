@@ -0,0 +1,151 @@
+"""
+Streamable HTTP で起動したサーバーに、多数のクライアントから同時に入力操作と観測を送る負荷試験。
+入力・ウィンドウ・撮影は記録用の偽物に差し替え、同じプロセス内でサーバーを起動するので Mac 以外でも動く。
+全体の処理件数/秒と応答時間 (p50/p99)、クライアントごとのキュー待ち時間、混雑で断った件数などを表示する。
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import threading
+import time
+
+import uvicorn
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+from mcp.types import Implementation
+from PIL import Image
+
+import main
+from action_queue import percentile
+from input_backend import RecordingInputBackend
+from screen_grab import FakeCaptureSource
+
+# 失敗として数える応答の先頭
+_ERROR_PREFIXES = ("混雑エラー", "期限切れ", "エラー", "撮影エラー", "入力エラー")
+
+
+def setup_fake_backend(capture_delay: float = 0.03):
+    """入力は記録用バックエンド、撮影は capture_delay 秒かかる固定画像にする"""
+    main.set_input_backend(RecordingInputBackend())
+    frame = Image.new("RGB", (1280, 800), (40, 80, 120))
+
+    def grab(window):
+        time.sleep(capture_delay)
+        return frame
+    main.set_capture_source(FakeCaptureSource(grab))
+    main.CHAT_ROI = None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int):
+    """別スレッドのイベントループでサーバーを起動し、受け付けを始めるまで待つ"""
+    config = uvicorn.Config(main.mcp.streamable_http_app(), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="load-test-server", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("サーバーが起動しませんでした")
+        time.sleep(0.01)
+    return server, thread
+
+
+async def _client(url: str, name: str, calls, deadline, results: list):
+    """
+    1クライアント分: 接続して calls の (種類, ツール名, 引数) を順に呼び、
+    (クライアント名, 種類, 応答時間, 成功か, 応答文) を results に追加する
+    """
+    meta = {"deadline": deadline} if deadline else None
+    async with streamable_http_client(url) as (read, write, _):
+        async with ClientSession(read, write, client_info=Implementation(name=name, version="0")) as session:
+            await session.initialize()
+            for kind, tool, args in calls:
+                t0 = time.perf_counter()
+                result = await session.call_tool(tool, args, meta=meta)
+                elapsed = time.perf_counter() - t0
+                text = result.content[0].text if result.content else ""
+                ok = not result.isError and not text.startswith(_ERROR_PREFIXES)
+                results.append((name, kind, elapsed, ok, text))
+
+
+def _calls(role: str, n: int):
+    if role == "planner":
+        return [("input", "press_game_keys", {"keys": "w", "duration": 0.01})] * n
+    # 観測は撮影とウィンドウ位置を交互に
+    return [("observe", "take_screenshot", {}) if i % 2 == 0 else ("observe", "get_window_bounds", {})
+            for i in range(n)]
+
+
+async def run_load_test(planners: int = 8, observers: int = 8, calls: int = 20, deadline: float = None,
+                        port: int = None) -> dict:
+    """
+    planners 個のクライアントが入力操作を、observers 個のクライアントが観測を、それぞれ calls 回ずつ
+    同時に送る。サーバーは既に起動していて port で待ち受けているものとする。
+    """
+    url = f"http://127.0.0.1:{port}/mcp"
+    results = []
+    clients = ([(f"planner-{i}", _calls("planner", calls)) for i in range(planners)]
+               + [(f"observer-{i}", _calls("observer", calls)) for i in range(observers)])
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client(url, name, c, deadline, results) for name, c in clients))
+    wall = time.perf_counter() - t0
+    report = {"clients": len(clients), "calls": len(results), "wall": wall,
+              "throughput": len(results) / wall, "kinds": {}}
+    for kind in ("input", "observe"):
+        lat = [r[2] for r in results if r[1] == kind]
+        report["kinds"][kind] = {
+            "calls": len(lat),
+            "failed": sum(1 for r in results if r[1] == kind and not r[3]),
+            "p50": percentile(lat, 50),
+            "p99": percentile(lat, 99),
+            "max": max(lat, default=0.0),
+        }
+    report["queues"] = main.ACTION_QUEUES.stats()
+    report["errors"] = sorted({r[4] for r in results if not r[3]})[:5]
+    return report
+
+
+def print_report(r: dict):
+    print(f"{r['clients']} クライアント, {r['calls']} 呼び出し, {r['wall']:.2f}秒, {r['throughput']:.1f} 件/秒")
+    print(f"{'kind':<8} {'calls':>6} {'failed':>6} {'p50':>9} {'p99':>9} {'max':>9}")
+    for kind, k in r["kinds"].items():
+        print(f"{kind:<8} {k['calls']:>6} {k['failed']:>6} {k['p50'] * 1000:>7.1f}ms {k['p99'] * 1000:>7.1f}ms "
+              f"{k['max'] * 1000:>7.1f}ms")
+    q = r["queues"]
+    print("クライアントごとの入力キュー待ち:")
+    for client, s in sorted(q["clients"].items()):
+        print(f"  {client:<24} 完了 {s['completed']:>4} 待ち p50 {s['wait_p50'] * 1000:>7.1f}ms "
+              f"p99 {s['wait_p99'] * 1000:>7.1f}ms")
+    adm = q["admission"]
+    print(f"受け付け {adm['admitted']} 件, 拒否 {adm['rejected']} 件, 期限切れ {q['expired']} 件, "
+          f"観測 実行 {q['shared']['loads']} / 共有 {q['shared']['joins']} / 再利用 {q['shared']['hits']}")
+    for text in r["errors"]:
+        print(f"  失敗例: {text}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="複数クライアントからの同時アクセスの負荷試験")
+    parser.add_argument("--planners", type=int, default=8, help="入力操作を送るクライアント数")
+    parser.add_argument("--observers", type=int, default=8, help="観測 (撮影・ウィンドウ位置) を送るクライアント数")
+    parser.add_argument("--calls", type=int, default=20, help="1クライアントあたりの呼び出し回数")
+    parser.add_argument("--deadline", type=float, default=None, help="入力操作の期限 (秒, _meta.deadline で送る)")
+    parser.add_argument("--capture-delay", type=float, default=0.03, help="偽の撮影1回にかかる時間 (秒)")
+    args = parser.parse_args()
+    # 接続ごとの HTTP のログは表示しない
+    for name in ("httpx", "mcp"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    setup_fake_backend(args.capture_delay)
+    port = _free_port()
+    server, thread = start_server(port)
+    try:
+        print_report(asyncio.run(run_load_test(args.planners, args.observers, args.calls, args.deadline, port)))
+    finally:
+        server.should_exit = True
+        thread.join(5)
@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+Box = Tuple[int, int, int, int]  # (x, y, w, h)
+
+
+class Match(NamedTuple):
+    """テンプレートが見つかった位置 (フレームの画素座標) と一致度"""
+    box: Box
+    score: float  # 正規化相互相関 (-1.0-1.0)
+    elapsed: float  # 探索にかかった秒数
+    cached: bool  # 前回の位置の周辺だけで見つかったか
+
+    @property
+    def center(self) -> Tuple[int, int]:
+        x, y, w, h = self.box
+        return x + w // 2, y + h // 2
+
+
+def to_gray(img) -> Image.Image:
+    """PIL 画像または配列をグレースケールの PIL 画像にする"""
+    if isinstance(img, np.ndarray):
+        a = img.mean(axis=2) if img.ndim == 3 else img
+        return Image.fromarray(np.clip(a, 0, 255).astype(np.uint8))
+    return img if img.mode == "L" else img.convert("L")
+
+
+def _array(gray: Image.Image) -> np.ndarray:
+    return np.asarray(gray, dtype=np.float32)
+
+
+class Frame:
+    """探索対象のフレーム。グレースケール化・縮小は必要になった時に行い、複数のテンプレートの探索で使い回す"""
+
+    def __init__(self, image):
+        self.image = to_gray(image) if isinstance(image, np.ndarray) else image
+        self.size = self.image.size
+        self._gray = None
+        self._levels: Dict[int, np.ndarray] = {}
+
+    @property
+    def gray(self) -> Image.Image:
+        if self._gray is None:
+            self._gray = to_gray(self.image)
+        return self._gray
+
+    def level(self, k: int) -> np.ndarray:
+        a = self._levels.get(k)
+        if a is None:
+            # reduce は画素の平均で縮小する (C 実装なので NumPy で平均を取るより速い)
+            a = self._levels[k] = _array(self.gray.reduce(2 ** k) if k else self.gray)
+        return a
+
+    def region(self, box: Box) -> np.ndarray:
+        """元の解像度の一部 (x, y, w, h)。全体を変換済みでなければ切り出してから変換する"""
+        x, y, w, h = box
+        if 0 in self._levels:
+            return self._levels[0][y:y + h, x:x + w]
+        return _array(to_gray(self.image.crop((x, y, x + w, y + h))))
+
+
+def _fast_len(n: int) -> int:
+    """n 以上で素因数が 2, 3, 5 だけの長さ (FFT が速い)"""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+def _window_sums(a: np.ndarray, h: int, w: int) -> np.ndarray:
+    """各 (h, w) 窓の総和 (積分画像で O(画素数))"""
+    ii = np.zeros((a.shape[0] + 1, a.shape[1] + 1))
+    np.cumsum(np.cumsum(a, axis=0, dtype=np.float64), axis=1, out=ii[1:, 1:])
+    return ii[h:, w:] - ii[:-h, w:] - ii[h:, :-w] + ii[:-h, :-w]
+
+
+def ncc(image: np.ndarray, templ: np.ndarray) -> np.ndarray:
+    """
+    正規化相互相関のマップ (形状は (H-h+1, W-w+1))。
+    分子は FFT による相関、分母の窓ごとの分散は積分画像で求める。平坦な窓は 0 にする。
+    """
+    H, W = image.shape
+    h, w = templ.shape
+    if h > H or w > W:
+        return np.zeros((0, 0))
+    t = templ - templ.mean()
+    t_norm = np.sqrt((t * t).sum())
+    if t_norm == 0:
+        return np.zeros((H - h + 1, W - w + 1))
+    shape = (_fast_len(H + h - 1), _fast_len(W + w - 1))
+    spec = np.fft.rfft2(image, shape) * np.fft.rfft2(t[::-1, ::-1], shape)
+    corr = np.fft.irfft2(spec, shape)[h - 1:H, w - 1:W]
+    n = h * w
+    s1 = _window_sums(image, h, w)
+    var = _window_sums(image * image, h, w) - s1 * s1 / n
+    denom = np.sqrt(np.maximum(var, 0.0)) * t_norm
+    # 平坦な窓 (分散がほぼ 0) は一致度を定義できないので 0 とする
+    valid = denom > 1e-6 * t_norm * np.sqrt(n)
+    out = np.zeros_like(corr)
+    np.divide(corr, denom, out=out, where=valid)
+    return out
+
+
+def _peaks(score: np.ndarray, count: int, radius: Tuple[int, int]) -> List[Tuple[int, int, float]]:
+    """一致度マップから上位 count 個の山 (x, y, score) を、近くの重複を除いて取り出す"""
+    s = score.copy()
+    ry, rx = radius
+    peaks = []
+    for _ in range(count):
+        idx = int(np.argmax(s))
+        y, x = divmod(idx, s.shape[1])
+        value = float(s[y, x])
+        if value == -np.inf:
+            break
+        peaks.append((x, y, value))
+        s[max(0, y - ry):y + ry + 1, max(0, x - rx):x + rx + 1] = -np.inf
+    return peaks
+
+
+class Template:
+    """参照画像と、そのピラミッド (半分ずつ縮小したもの) を保持する"""
+
+    def __init__(self, name: str, image, levels: int = 5, min_size: int = 8):
+        self.name = name
+        gray = to_gray(image)
+        self.size = gray.size
+        self.pyramid = [_array(gray)]
+        while len(self.pyramid) <= levels:
+            factor = 2 ** len(self.pyramid)
+            if min(self.size) // factor < min_size:
+                break
+            self.pyramid.append(_array(gray.reduce(factor)))
+
+    @property
+    def levels(self) -> int:
+        return len(self.pyramid) - 1
+
+
+class Locator:
+    """
+    フレームの中から参照画像 (ボタン・アイコン・チャット欄など) を正規化相互相関で探す。
+    縮小したピラミッドの最上段で候補を絞り、元の解像度では候補の周りだけを調べる。
+    テンプレートごとに前回見つかった位置を覚えておき、まずその周辺だけを探す。
+    """
+
+    def __init__(self, levels: int = 5, min_size: int = 8, candidates: int = 5, margin: float = 0.5):
+        self.levels = levels
+        self.min_size = min_size
+        self.candidates = candidates
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._templates: Dict[str, Tuple[float, Template]] = {}
+        self._last: Dict[str, Box] = {}
+        self.lookups = 0
+        self.cache_hits = 0
+        self.total_time = 0.0
+
+    def template(self, path: str) -> Template:
+        """画像ファイルからテンプレートを読み込む (更新されていなければ前回のものを使う)"""
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            entry = self._templates.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        with Image.open(path) as img:
+            templ = Template(path, img, self.levels, self.min_size)
+        with self._lock:
+            self._templates[path] = (mtime, templ)
+        return templ
+
+    def forget(self, name: Optional[str] = None):
+        """前回の位置を忘れる (name 省略時はすべて)"""
+        with self._lock:
+            if name is None:
+                self._last.clear()
+            else:
+                self._last.pop(name, None)
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "cache_hits": self.cache_hits,
+            "mean_ms": self.total_time / self.lookups * 1000 if self.lookups else 0.0,
+            "templates": len(self._templates),
+        }
+
+    def _search_region(self, frame: Frame, templ: np.ndarray, x0: int, y0: int, x1: int, y1: int):
+        """元の解像度で、左上が [x0, x1] x [y0, y1] に入る位置だけを調べて最良の (x, y, score) を返す"""
+        h, w = templ.shape
+        W, H = frame.size
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(W - w, x1), min(H - h, y1)
+        if x1 < x0 or y1 < y0:
+            return None
+        score = ncc(frame.region((x0, y0, x1 - x0 + w, y1 - y0 + h)), templ)
+        idx = int(np.argmax(score))
+        y, x = divmod(idx, score.shape[1])
+        return x0 + x, y0 + y, float(score[y, x])
+
+    def _full_search(self, frame: Frame, template: Template):
+        level = template.levels
+        coarse = template.pyramid[level]
+        score = ncc(frame.level(level), coarse)
+        if score.size == 0:
+            return None
+        if level == 0:
+            idx = int(np.argmax(score))
+            y, x = divmod(idx, score.shape[1])
+            return x, y, float(score[y, x])
+        # 縮小段の候補を元の解像度で詰める (縮小による位置のずれは 2^level 画素以内)
+        factor = 2 ** level
+        radius = (max(1, coarse.shape[0] // 2), max(1, coarse.shape[1] // 2))
+        best = None
+        for cx, cy, _ in _peaks(score, self.candidates, radius):
+            found = self._search_region(frame, template.pyramid[0], cx * factor - factor, cy * factor - factor,
+                                        cx * factor + factor, cy * factor + factor)
+            if found is not None and (best is None or found[2] > best[2]):
+                best = found
+        return best
+
+    def locate(self, frame, template: Template, threshold: float = 0.8, use_cache: bool = True) -> Optional[Match]:
+        """
+        frame (PIL 画像・配列・Frame) の中で template に最も一致する位置を返す。
+        前回の位置の周辺で threshold 以上なら全体は探さない。フレームより大きいテンプレートは None。
+        """
+        started = time.perf_counter()
+        if not isinstance(frame, Frame):
+            frame = Frame(frame)
+        w, h = template.size
+        found, cached = None, False
+        last = self._last.get(template.name) if use_cache else None
+        if last is not None:
+            pad = int(self.margin * min(w, h)) + 8
+            found = self._search_region(frame, template.pyramid[0], last[0] - pad, last[1] - pad,
+                                        last[0] + pad, last[1] + pad)
+            cached = found is not None and found[2] >= threshold
+        if not cached:
+            found = self._full_search(frame, template)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.lookups += 1
+            self.cache_hits += int(cached)
+            self.total_time += elapsed
+            if found is not None and found[2] >= threshold:
+                self._last[template.name] = (found[0], found[1], w, h)
+        if found is None:
+            return None
+        return Match((found[0], found[1], w, h), found[2], elapsed, cached)
+
+
+def synthetic_frame(size=(1920, 1080), seed: int = 0) -> Image.Image:
+    """ベンチマーク用の画面っぽい画像 (グラデーション・矩形・ノイズ)"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w]
+    base = np.stack([(xx * 255 / w), (yy * 255 / h), ((xx + yy) * 127 / (w + h))], axis=2)
+    for _ in range(40):
+        x, y = rng.integers(0, max(1, w - 200)), rng.integers(0, max(1, h - 120))
+        base[y:y + rng.integers(20, 120), x:x + rng.integers(40, 200)] = rng.integers(0, 256, 3)
+    base += rng.normal(0, 6, base.shape)
+    return Image.fromarray(np.clip(base, 0, 255).astype(np.uint8))
+
+
+def _benchmark(repeat: int = 5):
+    """フルHDの合成フレームで、探索 (キャッシュなし / 前回位置あり) の所要時間と位置の正しさを確認する"""
+    frame = synthetic_frame()
+    locator = Locator()
+    cases = [("button", (1500, 900, 120, 40)), ("icon", (300, 200, 48, 48)), ("chatbox", (40, 700, 400, 60))]
+    for name, (x, y, w, h) in cases:
+        templ = Template(name, frame.crop((x, y, x + w, y + h)), locator.levels, locator.min_size)
+        cold = []
+        for _ in range(repeat):
+            locator.forget(name)
+            m = locator.locate(frame, templ)
+            cold.append(m.elapsed)
+        assert m.box[:2] == (x, y) and m.score > 0.99, (name, m)
+        warm = []
+        for _ in range(repeat):
+            m = locator.locate(frame, templ)
+            warm.append(m.elapsed)
+        assert m.cached and m.box[:2] == (x, y), (name, m)
+        print(f"{name:<8} {w}x{h:<4} levels={templ.levels} score={m.score:.3f} "
+              f"cold {sorted(cold)[repeat // 2] * 1000:6.1f}ms  cached {sorted(warm)[repeat // 2] * 1000:6.2f}ms")
+    # 見つからない画像は一致度が低い
+    noise = np.random.default_rng(1).integers(0, 256, (90, 160), dtype=np.uint8)
+    other = Template("other", Image.fromarray(noise), locator.levels, locator.min_size)
+    m = locator.locate(frame, other)
+    print(f"missing  score={m.score:.3f} {m.elapsed * 1000:.1f}ms")
+    assert m.score < 0.8
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,217 @@
+import threading
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+# 方向名 -> 移動キー
+MOVE_KEYS = {"forward": "w", "back": "s", "left": "a", "right": "d"}
+
+
+def parse_directions(direction: str) -> Tuple[str, ...]:
+    """"forward", "forward+left", "forward left" などを方向名のタプルにする (空文字は方向なし)"""
+    names = [d for d in direction.replace("+", " ").lower().split() if d]
+    unknown = [d for d in names if d not in MOVE_KEYS]
+    if unknown:
+        raise ValueError(f"方向は {', '.join(MOVE_KEYS)} から指定してください: {', '.join(unknown)}")
+    return tuple(dict.fromkeys(names))
+
+
+class LocomotionController:
+    """
+    バックグラウンドスレッドで移動キー・ダッシュキーを押し続け、視点の旋回 (右ドラッグ) を一定レートで送る。
+    start / steer / stop はすぐに戻り、実際の入力はすべてこのスレッドから行う。
+    watchdog_timeout 秒以上コマンドが来なければ、押しているキー・ボタンをすべて離して止まる。
+
+    backend は key_down / key_up / mouse_button / mouse_drag を持つ入力バックエンド。
+    旋回量 (ピクセル/秒) は実際の経過時間で積算し、端数は次のティックに持ち越すので合計がずれない。
+    """
+
+    def __init__(self, backend, rate_hz: float = 60.0, watchdog_timeout: float = 3.0,
+                 sprint_key: str = "shift", turn_button: str = "right",
+                 clock: Callable[[], float] = time.monotonic):
+        self.backend = backend
+        self.rate_hz = rate_hz
+        self.watchdog_timeout = watchdog_timeout
+        self.sprint_key = sprint_key
+        self.turn_button = turn_button
+        self._clock = clock
+        self._lock = threading.Lock()
+        # start / stop (スレッドの起動と停止) を1つずつにする。別スレッドから同時に呼ばれても、
+        # 止めたはずのスレッドが残ったり、キーを離さないまま参照を失ったりしないように
+        self._control = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # 指示された状態 (コマンド側で書き換え、スレッド側で反映する)
+        self._directions: Tuple[str, ...] = ()
+        self._sprint = False
+        self._turn = (0.0, 0.0)
+        self._anchor = (0, 0)
+        self._last_command = 0.0
+        # 実際に押している状態 (スレッドだけが触る)
+        self._held = []
+        self._turning = False
+        self._carry = [0.0, 0.0]
+        # 統計
+        self.ticks = 0
+        self.turned = [0, 0]
+        self.watchdog_trips = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.stop_reason = ""
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _command(self, directions=None, sprint=None, turn=None, anchor=None):
+        with self._lock:
+            if directions is not None:
+                self._directions = tuple(directions)
+            if sprint is not None:
+                self._sprint = bool(sprint)
+            if turn is not None:
+                self._turn = (float(turn[0]), float(turn[1]))
+            if anchor is not None:
+                self._anchor = (int(anchor[0]), int(anchor[1]))
+            self._last_command = self._clock()
+        self._wake.set()
+
+    def start(self, directions: Iterable[str] = ("forward",), sprint: bool = False,
+              turn: Tuple[float, float] = (0.0, 0.0), anchor: Optional[Tuple[int, int]] = None):
+        """移動を始める (既に動いていれば指示を置き換える)"""
+        with self._control:
+            self._command(tuple(directions), sprint, turn, anchor)
+            if self.running and not self._stop.is_set():
+                return
+            if self._thread is not None:
+                # 止まる途中のスレッドが残っていれば、キーを離し終えるのを待ってから作り直す
+                self._thread.join()
+            self._stop.clear()
+            self.ticks = 0
+            self.turned = [0, 0]
+            self.stop_reason = ""
+            self.started_at = self._clock()
+            self.stopped_at = None
+            self._thread = threading.Thread(target=self._run, name="locomotion", daemon=True)
+            self._thread.start()
+
+    def steer(self, directions: Optional[Iterable[str]] = None, sprint: Optional[bool] = None,
+              turn: Optional[Tuple[float, float]] = None):
+        """指定した項目だけ変更する (何も指定しなくてもウォッチドッグの延長になる)"""
+        self._command(tuple(directions) if directions is not None else None, sprint, turn)
+
+    def stop(self, timeout: float = 1.0, reason: str = "stop"):
+        """止めてすべて離す (reason は state() の stop_reason に残る)"""
+        with self._control:
+            if self._thread is None:
+                return
+            self.stop_reason = self.stop_reason or reason
+            self._stop.set()
+            self._wake.set()
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                # timeout までに終わらなければ参照を残し、次の start で終わるのを待つ
+                self._thread = None
+
+    def state(self) -> dict:
+        with self._lock:
+            directions, sprint, turn = self._directions, self._sprint, self._turn
+            idle = self._clock() - self._last_command
+        return {
+            "running": self.running,
+            "directions": directions,
+            "sprint": sprint,
+            "turn": turn,
+            "held": list(self._held),
+            "turning": self._turning,
+            "ticks": self.ticks,
+            "turned": tuple(self.turned),
+            "elapsed": ((self.stopped_at or self._clock()) - self.started_at) if self.started_at is not None else 0.0,
+            "idle": idle,
+            "watchdog_trips": self.watchdog_trips,
+            "stop_reason": self.stop_reason,
+        }
+
+    # ---- 以下はスレッド側 ----
+
+    def _apply_keys(self, wanted):
+        for key in [k for k in self._held if k not in wanted]:
+            self.backend.key_up(key)
+            self._held.remove(key)
+        for key in wanted:
+            if key not in self._held:
+                self.backend.key_down(key)
+                self._held.append(key)
+
+    def _apply_turn(self, turn, anchor, dt: float):
+        tx, ty = turn
+        if tx == 0 and ty == 0:
+            if self._turning:
+                self.backend.mouse_button(self.turn_button, False, *anchor)
+                self._turning = False
+            self._carry = [0.0, 0.0]
+            return
+        if not self._turning:
+            self.backend.mouse_button(self.turn_button, True, *anchor)
+            self._turning = True
+        self._carry[0] += tx * dt
+        self._carry[1] += ty * dt
+        dx, dy = int(self._carry[0]), int(self._carry[1])
+        if dx or dy:
+            self._carry[0] -= dx
+            self._carry[1] -= dy
+            self.backend.mouse_drag(self.turn_button, anchor[0], anchor[1], dx, dy)
+            self.turned[0] += dx
+            self.turned[1] += dy
+
+    def _release_all(self, anchor):
+        for key in reversed(self._held):
+            try:
+                self.backend.key_up(key)
+            except Exception:
+                pass
+        self._held = []
+        if self._turning:
+            try:
+                self.backend.mouse_button(self.turn_button, False, *anchor)
+            except Exception:
+                pass
+            self._turning = False
+
+    def _run(self):
+        period = 1.0 / self.rate_hz
+        anchor = self._anchor
+        last = self._clock()
+        t0 = last
+        k = 0
+        try:
+            while not self._stop.is_set():
+                now = self._clock()
+                with self._lock:
+                    directions, sprint, turn = self._directions, self._sprint, self._turn
+                    anchor = self._anchor
+                    idle = now - self._last_command
+                if idle > self.watchdog_timeout:
+                    self.watchdog_trips += 1
+                    self.stop_reason = "watchdog"
+                    break
+                wanted = [MOVE_KEYS[d] for d in directions]
+                if sprint and wanted:
+                    wanted.insert(0, self.sprint_key)
+                self._apply_keys(wanted)
+                self._apply_turn(turn, anchor, now - last)
+                last = now
+                self.ticks += 1
+
+                # 絶対期限で次のティックへ (遅れた分は飛ばす。旋回量は経過時間で積算するので失われない)
+                k = max(k + 1, int((self._clock() - t0) / period) + 1)
+                self._wake.clear()
+                remaining = t0 + k * period - self._clock()
+                if remaining > 0:
+                    # 指示の変更で起こされたら、期限を待たずにすぐ反映する
+                    if self._wake.wait(remaining):
+                        k = int((self._clock() - t0) / period)
+        finally:
+            self._release_all(anchor)
+            self.stopped_at = self._clock()
+
@@ -1,53 +1,60 @@
+import asyncio
+import contextvars
+import functools
+import json
 import time
 import os
 import datetime
 import tempfile
-import math
 import subprocess
-import pyautogui
-from mcp.server.fastmcp import FastMCP
-from Quartz import (
-    CGEventCreateMouseEvent, CGEventCreateScrollWheelEvent, CGEventPost, CGEventSetIntegerValueField,
-    kCGEventMouseMoved, kCGEventLeftMouseDown, kCGEventLeftMouseUp,
-    kCGEventLeftMouseDragged, kCGEventRightMouseDown, kCGEventRightMouseUp,
-    kCGEventRightMouseDragged, kCGEventOtherMouseDown, kCGEventOtherMouseUp,
-    kCGEventOtherMouseDragged, kCGEventScrollWheel,
-    kCGMouseButtonLeft, kCGMouseButtonRight, kCGMouseButtonCenter,
-    kCGHIDEventTap, kCGMouseEventDeltaX, kCGMouseEventDeltaY
+import threading
+from typing import List
+from pydantic import ValidationError
+from mcp import types
+from mcp.server.fastmcp import Context, FastMCP, Image
+from window_registry import WindowInfo, WindowRegistry
+from applescript_worker import AppleScriptError, get_default_pool
+from focus_manager import FocusManager
+from action_queue import AdmissionController, AppActionQueues, DeadlineExceeded, Overloaded
+from scheduler import DeadlineScheduler
+from key_timeline import run_key_timeline
+from image_encode import encode_image
+from capture_buffer import BackgroundCapturer, FrameRingBuffer
+from screen_grab import Capture, CaptureNeedsFocus, RegionCaptureSource, WindowCaptureSource, grab_rect
+from waits import changed_from, settled, wait_until
+from input_backend import QuartzInputBackend, load_pyautogui
+from comment_outbox import CommentOutbox
+from metrics import get_default_metrics
+from action_control import CURRENT_CONTROL, ActionControl, current_control
+from locomotion import LocomotionController, parse_directions
+from scroll_engine import ScrollEngine
+from session_record import QuartzEventTap, Session, SessionRecorder, replay
+from instances import InstanceRegistry
+from actions import (
+    Step, StepExecutor, validate_steps, validate_key_events,
+    KeyEvent, KeyStep, ChordStep, KeyTimelineStep, DragStep, ScrollStep, EmoteStep, CommentStep, WaveStep, WaitStep
 )
 
 # サーバーのインスタンスを作成
 mcp = FastMCP("ClusterControllerMcp")
 
-# PyAutoGUIの安全装置（マウスを画面四隅にやると停止）
-pyautogui.FAILSAFE = True
-# デフォルトの遅延(0.1s)を無効化し、手動で制御する
-pyautogui.PAUSE = 0
-
-
-def _post_mouse_event(event_type, x, y, button, dx=0, dy=0):
-    """Quartzでマウスイベントを送信"""
-    # 座標はfloatである必要がある
-    e = CGEventCreateMouseEvent(None, event_type, (float(x), float(y)), button)
-    
-    # Delta値を明示的に設定 (ゲーム視点操作用)
-    if dx != 0 or dy != 0:
-        CGEventSetIntegerValueField(e, kCGMouseEventDeltaX, int(dx))
-        CGEventSetIntegerValueField(e, kCGMouseEventDeltaY, int(dy))
-        
-    CGEventPost(kCGHIDEventTap, e)
-
-def _post_scroll_event(dy):
-    """Quartzでスクロールイベントを送信"""
-    # dy: 正数が上(奥)、負数が下(手前)
-    # createScrollWheelEventは unit数を指定。
-    # wheelCount=1, wheel1=dy
-    e = CGEventCreateScrollWheelEvent(None, 0, 1, dy)
-    CGEventPost(kCGHIDEventTap, e)
+# ツール・フェーズごとの所要時間の計測 (環境変数 CLUSTER_MCP_METRICS=0 で無効)
+METRICS = get_default_metrics()
 
 
+@METRICS.timed("applescript")
 def run_applescript(script: str) -> str:
-    """AppleScriptを実行するためのヘルパー関数"""
+    """AppleScriptを実行するためのヘルパー関数 (常駐ワーカー経由)"""
+    try:
+        return get_default_pool().execute(script).strip()
+    except AppleScriptError as e:
+        return f"Error: {e}"
+    except OSError:
+        # ワーカーを起動できない環境では1回ごとにosascriptを起動する
+        return _run_applescript_subprocess(script)
+
+def _run_applescript_subprocess(script: str) -> str:
+    """osascriptを1回起動してAppleScriptを実行する (従来方式)"""
     try:
         proc = subprocess.run(
             ['osascript', '-e', script],
@@ -63,6 +70,60 @@ def run_applescript(script: str) -> str:
 # グローバル変数でフォーカスする対象のアプリ名を保持
 CURRENT_APP_NAME = "cluster"
 
+# 入力アクションはアプリ (インスタンス) ごとのキューで順番に実行する (ブロッキング処理はスレッドで動かす)
+# 1つのキューが続けて実行する最大件数 (大きいほどフォーカスの切り替えが減り、他のクライアントの待ちが増える)
+MAX_BATCH = int(os.environ.get("CLUSTER_MCP_MAX_BATCH", "8"))
+# 複数のクライアント (HTTP) から使う場合の受け付け上限 (実行中 + 実行待ちの要求数。全体 / クライアントごと)
+ADMISSION = AdmissionController(int(os.environ.get("CLUSTER_MCP_MAX_PENDING", "64")),
+                                int(os.environ.get("CLUSTER_MCP_MAX_PENDING_PER_CLIENT", "16")))
+# 入力アクションが実行を始めるまでの期限 (秒, 0 で無期限)。要求の _meta.deadline で1回ごとに指定もできる
+QUEUE_DEADLINE = float(os.environ.get("CLUSTER_MCP_QUEUE_DEADLINE", "60"))
+# 継続移動 (start_moving) はキューの外で入力を送り続けるので、他の入力アクションを実行する前に止める
+ACTION_QUEUES = AppActionQueues(MAX_BATCH, ADMISSION, lambda: _request_info(),
+                                lambda app, func: _preempt_locomotion(app, func))
+# 撮影・ウィンドウ位置の結果をクライアント間で使い回す最大秒数 (入力アクションが終わった後は使い回さない)
+OBSERVATION_MAX_AGE = float(os.environ.get("CLUSTER_MCP_OBSERVATION_MAX_AGE", "0.25"))
+# クライアント名 -> そのクライアントが focus_window で選んだアプリ名 (選んでいなければ CURRENT_APP_NAME)
+CLIENT_APPS = {}
+
+# アプリ名(小文字) -> バックグラウンド撮影
+CAPTURERS = {}
+# take_screenshot(after=...) で新しいフレームを待つ最大時間(秒)
+FRAME_WAIT_TIMEOUT = 2.0
+# アプリ名(小文字) -> 画面変化の比較基準となる最後に観測した画像
+CHANGE_BASELINES = {}
+
+# ドラッグ・マウス移動のイベント送信レート (Hz)
+INPUT_RATE_HZ = float(os.environ.get("CLUSTER_MCP_INPUT_RATE_HZ", "120"))
+# 手を振る動作のイベント送信レート (Hz)
+WAVE_RATE_HZ = 20.0
+
+# チャット欄の位置 (ウィンドウに対する割合 x, y, 幅, 高さ)。send_comment の状態確認に使う (None で確認せず固定時間待つ)
+CHAT_ROI = (0.0, 0.55, 0.5, 0.45)
+# 画面の静止判定を始めるまでの最小待ち時間(秒)
+SETTLE_MIN_WAIT = 0.05
+
+# コメント送信の最小間隔 (秒)。連投制限に引っかからないよう環境変数で調整できる
+COMMENT_MIN_INTERVAL = float(os.environ.get("CLUSTER_MCP_COMMENT_INTERVAL", "1.0"))
+# まとめて送信する際、2件目以降の貼り付け前に押すキー (送信後に入力モードが外れる場合に設定)
+CHAT_REOPEN_KEY = os.environ.get("CLUSTER_MCP_CHAT_REOPEN_KEY") or None
+# アプリごとのコメント送信キュー
+COMMENT_OUTBOXES = {}
+# 長い入力アクションの進捗通知の間隔(秒)
+PROGRESS_INTERVAL = 0.1
+# アプリ名(小文字) -> 実行中・実行待ちのアクションの ActionControl (cancel_actions で中断する)
+ACTIVE_CONTROLS = {}
+# 継続移動 (start_moving) のキー保持・旋回のレート (Hz) とダッシュに使うキー
+LOCOMOTION_RATE_HZ = 60.0
+SPRINT_KEY = os.environ.get("CLUSTER_MCP_SPRINT_KEY", "shift")
+# 継続移動のコントローラ (最初の start_moving で作る) と、移動させているアプリ (キューのキー)
+LOCOMOTION = None
+LOCOMOTION_APP = None
+# 操作記録ファイルの保存先
+SESSION_DIR = os.environ.get("CLUSTER_MCP_SESSION_DIR") or tempfile.gettempdir()
+# 記録中の (SessionRecorder, イベントタップ, 保存先)
+RECORDING = None
+
 # エモートのショートカット設定 (0-9)
 # キーはエモート名、値は送信するキー
 EMOTE_MAP = {    
@@ -78,8 +139,52 @@ EMOTE_MAP = {
     "smile": "0",    # 笑顔
 }
 
+# Quartzのウィンドウ列挙によるレジストリ (osascriptを毎回起動しないためのキャッシュ)
+WINDOW_REGISTRY = WindowRegistry()
+# マウス・キーボード・クリップボード・ウィンドウ情報の入出力先 (計測時は set_input_backend で差し替える)
+# Quartz / pyautogui / クリップボードは最初の入力 (または起動後の先読み) の時点で読み込む
+INPUT = QuartzInputBackend(WINDOW_REGISTRY)
+# スクロールはピクセル単位のイベントで送り、丸めた端数は次に持ち越す (CLUSTER_MCP_SCROLL_UNIT=line で行単位)
+# CLUSTER_MCP_SCROLL_PIXELS_PER_LINE は amount 10 (ホイール1目盛り) を何ピクセルとして送るか。
+# 既定の 1 は従来 (amount / 10 を切り捨てたピクセル数) と同じ量で、大きくするとその倍率で速くスクロールする
+SCROLL_UNIT = os.environ.get("CLUSTER_MCP_SCROLL_UNIT", "pixel")
+SCROLL_PIXELS_PER_LINE = float(os.environ.get("CLUSTER_MCP_SCROLL_PIXELS_PER_LINE", "1"))
+# 対象アプリ (キューのキー) -> ScrollEngine。持ち越す端数がアプリ・インスタンスをまたがないよう別々に持つ
+SCROLL_ENGINES = {}
+# 同じアプリを複数起動した時の名前 -> (PID, ウィンドウID)
+INSTANCES = InstanceRegistry(WINDOW_REGISTRY)
+# 観測用の撮影: ウィンドウIDで直接撮り (フォーカス不要)、撮れない時だけ最前面にして画面領域を撮る
+# CLUSTER_MCP_CAPTURE_CLIENT_AREA=1 でタイトルバーを除いた描画領域だけにする
+CAPTURE_CLIENT_AREA = os.environ.get("CLUSTER_MCP_CAPTURE_CLIENT_AREA", "0") == "1"
+CAPTURE_SOURCE = WindowCaptureSource(CAPTURE_CLIENT_AREA)
+FALLBACK_CAPTURE_SOURCE = RegionCaptureSource(CAPTURE_CLIENT_AREA)
+# アプリ名(小文字) -> 最後に撮った Capture の (写っている範囲, 画像サイズ)。画像座標を画面座標に直すのに使う
+CAPTURE_GEOMETRY = {}
+# 画面内の参照画像 (ボタン・アイコンなど) を探す。テンプレートは名前で指定するとこのフォルダから読む
+# numpy を使う経路計算・画像比較・テンプレート検索のモジュールは、起動を速くするため最初に使う時点で読み込む
+LOCATOR = None
+TEMPLATE_DIR = (os.environ.get("CLUSTER_MCP_TEMPLATE_DIR")
+                or os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+TEMPLATE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+
+@METRICS.timed("window_bounds")
 def _get_window_bounds_impl(app_name_keyword: str):
     """内部用: 指定されたアプリのウィンドウ位置とサイズを取得 (x, y, w, h)"""
+    if app_name_keyword in INSTANCES:
+        bounds = INSTANCES.bounds(app_name_keyword)
+        return bounds if bounds else f"Error: インスタンス '{app_name_keyword}' のウィンドウが見つかりません"
+    try:
+        bounds = INPUT.window_bounds(app_name_keyword)
+        if bounds:
+            return bounds
+    except Exception:
+        # Quartzで列挙できない場合はAppleScriptで取得する
+        pass
+    # 最小化されている等でオンスクリーンに無い場合もAppleScriptにフォールバック
+    return _get_window_bounds_applescript(app_name_keyword)
+
+def _get_window_bounds_applescript(app_name_keyword: str):
+    """内部用: AppleScript (System Events) でウィンドウ位置とサイズを取得 (x, y, w, h)"""
     script = f'''
     tell application "System Events"
         set procList to every process whose name contains "{app_name_keyword}"
@@ -136,15 +241,8 @@ def _get_window_bounds_impl(app_name_keyword: str):
             return f"Error: Parse exception {e} on result: {result}"
     return f"Error: No result or AppleScript error. Raw: {result}"
 
-def _focus_window_impl(app_name_keyword: str, width: int = None, height: int = None, x: int = None, y: int = None) -> str:
-    """内部用: 指定されたアプリケーションをアクティブにする実装"""
-    if not app_name_keyword:
-        return ""
-        
-    # ユーザー要望: デフォルトで(0,0)に移動
-    if x is None: x = 0
-    if y is None: y = 0
-
+def _activate_window_applescript(app_name_keyword: str, width: int = None, height: int = None, x: int = 0, y: int = 0):
+    """内部用: AppleScriptでアプリを最前面にして位置・サイズを設定する。エラー時はメッセージを返す"""
     # サイズ・位置変更用のスクリプトパーツ
     # System Eventsのプロセス -> ウィンドウに対して操作を行う
     settings_cmds = ""
@@ -173,8 +271,154 @@ def _focus_window_impl(app_name_keyword: str, width: int = None, height: int = N
         return f"エラー: '{app_name_keyword}' を含むアプリケーションが見つかりませんでした。"
     elif result and "Error" in result:
         return f"AppleScriptエラー: {result}"
-    
-    time.sleep(0.5) # 切り替え待機
+    return None
+
+def _activate_instance_applescript(pid: int, window_id: int = None):
+    """内部用: AppleScriptで PID のプロセスを最前面にする (位置・サイズは変えない)。エラー時はメッセージを返す"""
+    script = f'''
+    tell application "System Events"
+        set procList to every process whose unix id is {int(pid)}
+        if (count of procList) > 0 then
+            set frontmost of item 1 of procList to true
+            return "Found"
+        else
+            return "NotFound"
+        end if
+    end tell
+    '''
+    result = run_applescript(script)
+    if result and "NotFound" in result:
+        return f"エラー: PID {pid} のプロセスが見つかりませんでした。"
+    elif result and "Error" in result:
+        return f"AppleScriptエラー: {result}"
+    return None
+
+# 最前面のアプリとウィンドウ配置を追跡し、変化があった時だけフォーカスし直す
+FOCUS_MANAGER = FocusManager(WINDOW_REGISTRY, _activate_window_applescript, _activate_instance_applescript)
+
+# サーバー内部の処理 (コメント送信キューなど) がキューに積む時のクライアント名。特定のクライアントに数えないために使う
+INTERNAL_CLIENT = contextvars.ContextVar("internal_client", default=None)
+
+def _request_info():
+    """
+    内部用: 要求元のクライアント名と入力アクションの期限 (秒)。
+    クライアント名は clientInfo の名前 (HTTP ではセッションIDの先頭を付けて区別する)、
+    期限は要求の _meta.deadline (無ければ QUEUE_DEADLINE)。
+    サーバー内部の処理では INTERNAL_CLIENT の名前、ツール呼び出しの外では "local"
+    """
+    deadline = QUEUE_DEADLINE or None
+    internal = INTERNAL_CLIENT.get()
+    if internal:
+        return internal, deadline
+    try:
+        rc = mcp.get_context().request_context
+    except ValueError:
+        return "local", deadline
+    params = rc.session.client_params
+    client = params.clientInfo.name if params is not None else "client"
+    session_id = rc.request.headers.get("mcp-session-id") if rc.request is not None else None
+    if session_id:
+        client = f"{client}#{session_id[:8]}"
+    requested = getattr(rc.meta, "deadline", None) if rc.meta is not None else None
+    if isinstance(requested, (int, float)) and requested > 0:
+        deadline = float(requested)
+    return client, deadline
+
+def _default_app() -> str:
+    """内部用: 要求元のクライアントが focus_window で選んだアプリ (無ければ最後に選ばれたアプリ)"""
+    return CLIENT_APPS.get(_request_info()[0], CURRENT_APP_NAME)
+
+class InputError(ValueError):
+    """ツールの引数の誤り (_input_errors を付けたツールは "入力エラー: ..." として返す)"""
+
+def _input_errors(func):
+    """内部用: ツール用デコレータ。引数の解釈 (対象の決定・ステップの作成) で見つかった誤りを文字列で返す"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except InputError as e:
+            return f"入力エラー: {e}"
+    return wrapper
+
+def _target_app(app_name: str = None, instance: str = None) -> str:
+    """内部用: 操作対象 (キューのキー)。インスタンス名 > アプリ名 > 前回の focus_window の順"""
+    if instance:
+        if instance not in INSTANCES:
+            raise InputError(f"インスタンス '{instance}' は登録されていません (list_instances で確認してください)")
+        return instance.lower()
+    return app_name or _default_app()
+
+def _make_step(step_type, **fields):
+    """内部用: ツールの引数からステップを作る。値が不正なら InputError を送出する"""
+    try:
+        return step_type(**fields)
+    except ValidationError as e:
+        errors = []
+        for err in e.errors():
+            name = ".".join(str(p) for p in err["loc"])
+            if err["type"] == "literal_error":
+                expected = err["ctx"]["expected"].replace("'", "").replace(" or ", ", ")
+                errors.append(f"{name} は {expected} のいずれかを指定してください: {err['input']}")
+            else:
+                errors.append(f"{name}: {err['msg']}")
+        raise InputError(", ".join(errors)) from None
+
+def set_input_backend(backend):
+    """入力バックエンドを差し替える (ウィンドウ情報の参照先も合わせて切り替える)"""
+    global INPUT, WINDOW_REGISTRY
+    INPUT = backend
+    WINDOW_REGISTRY = backend.registry
+    FOCUS_MANAGER.registry = backend.registry
+    INSTANCES.registry = backend.registry
+
+def set_capture_source(source, fallback=None):
+    """観測用の撮影方法を差し替える (fallback 省略時は従来の画面領域の撮影のまま)"""
+    global CAPTURE_SOURCE, FALLBACK_CAPTURE_SOURCE
+    CAPTURE_SOURCE = source
+    if fallback is not None:
+        FALLBACK_CAPTURE_SOURCE = fallback
+
+def _scheduler(rate_hz: float = None, skip_frames: bool = True) -> DeadlineScheduler:
+    """内部用: 入力バックエンドの sleep と計測フック、実行中アクションの中断・進捗通知を使うスケジューラ"""
+    control = current_control()
+    return DeadlineScheduler(rate_hz or INPUT_RATE_HZ, sleep=INPUT.sleep, skip_frames=skip_frames,
+                             observer=INPUT.record_schedule,
+                             should_stop=control.should_stop, on_progress=control.report)
+
+def _pause(seconds: float, report: bool = True) -> bool:
+    """内部用: seconds 秒待つ (report=True なら待ちの進み具合を進捗として通知)。中断された場合は True を返す"""
+    control = current_control()
+    if not report:
+        return INPUT.sleep(seconds, control.cancel_event)
+    started = time.monotonic()
+    while True:
+        remaining = seconds - (time.monotonic() - started)
+        if remaining <= 0:
+            control.report(1, 1)
+            return False
+        if INPUT.sleep(min(remaining, PROGRESS_INTERVAL), control.cancel_event):
+            return True
+        control.report(time.monotonic() - started, seconds)
+
+@METRICS.timed("focus")
+def _focus_window_impl(app_name_keyword: str, width: int = None, height: int = None, x: int = None, y: int = None) -> str:
+    """内部用: 指定されたアプリケーションをアクティブにする実装"""
+    if not app_name_keyword:
+        return ""
+    if app_name_keyword in INSTANCES:
+        return _focus_instance_impl(app_name_keyword)
+        
+    # ユーザー要望: デフォルトで(0,0)に移動
+    if x is None: x = 0
+    if y is None: y = 0
+
+    # 既に最前面かつ配置も同じなら、AppleScript・切り替え待機・マウス移動を省略
+    changed, error = FOCUS_MANAGER.ensure_focus(app_name_keyword, width, height, x, y)
+    if error:
+        return error
+    if not changed:
+        return f"成功: アプリケーション '{app_name_keyword}' は既にアクティブです。"
     
     # 成功したらマウスを中央に移動（ユーザー要望）
     bounds = _get_window_bounds_impl(app_name_keyword)
@@ -183,14 +427,30 @@ def _focus_window_impl(app_name_keyword: str, width: int = None, height: int = N
         bx, by, bw, bh = bounds
         center_x = bx + (bw // 2)
         center_y = by + (bh // 2)
-        _post_mouse_event(kCGEventMouseMoved, center_x, center_y, kCGMouseButtonLeft)
+        INPUT.mouse_move(center_x, center_y)
     
     return f"成功: アプリケーション '{app_name_keyword}' をアクティブにしました。"
 
 
+def _focus_instance_impl(name: str) -> str:
+    """内部用: インスタンスのウィンドウを (配置を変えずに) アクティブにする"""
+    instance = INSTANCES.get(name)
+    if INSTANCES.window(name) is None:
+        return f"エラー: インスタンス '{name}' のウィンドウが見つかりません (終了した可能性があります)。"
+    changed, error = FOCUS_MANAGER.ensure_window_focus(instance.pid, instance.window_id)
+    if error:
+        return error
+    if not changed:
+        return f"成功: インスタンス '{name}' は既にアクティブです。"
+    bounds = INSTANCES.bounds(name)
+    if bounds:
+        bx, by, bw, bh = bounds
+        INPUT.mouse_move(bx + bw // 2, by + bh // 2)
+    return f"成功: インスタンス '{name}' をアクティブにしました。"
 
 @mcp.tool()
-def focus_window(app_name_keyword: str, width: int = None, height: int = None, x: int = None, y: int = None) -> str:
+@METRICS.tool
+async def focus_window(app_name_keyword: str, width: int = None, height: int = None, x: int = None, y: int = None) -> str:
     """
     指定されたアプリケーション名を検索して最前面（アクティブ）にします。
     以降のコマンドでもこのアプリがデフォルトで使用されます。
@@ -199,7 +459,8 @@ def focus_window(app_name_keyword: str, width: int = None, height: int = None, x
     例: 'Minecraft', 'Terminal', 'Google Chrome'
 
     Args:
-        app_name_keyword: アプリケーション名
+        app_name_keyword: アプリケーション名。list_instances のインスタンス名を指定すると、そのクライアントを
+                          (位置・サイズを変えずに) アクティブにし、以降のコマンドの対象にします。
         width: ウィンドウの幅 (optional)
         height: ウィンドウの高さ (optional)
         x: 左上のX座標 (optional)
@@ -207,419 +468,1650 @@ def focus_window(app_name_keyword: str, width: int = None, height: int = None, x
     """
     global CURRENT_APP_NAME
     CURRENT_APP_NAME = app_name_keyword
-    return _focus_window_impl(app_name_keyword, width, height, x, y)
+    CLIENT_APPS[_request_info()[0]] = app_name_keyword
+    try:
+        return await ACTION_QUEUES.submit(app_name_keyword, _focus_window_impl, app_name_keyword, width, height, x, y)
+    except (Overloaded, DeadlineExceeded) as e:
+        return _queue_error(e)
+
+def _describe_instance(instance) -> str:
+    """内部用: インスタンス1件を文字列にする"""
+    bounds = INSTANCES.bounds(instance.name)
+    where = f"位置 {bounds}" if bounds else "ウィンドウなし"
+    depth = ACTION_QUEUES.depth(instance.name)
+    return f"{instance.name}: PID {instance.pid}, ウィンドウID {instance.window_id}, {where}, 待ち {depth} 件"
 
 @mcp.tool()
-def press_game_keys(keys: str, duration: float = 0.1, app_name: str = None) -> str:
+@METRICS.tool
+async def list_instances(app_name: str = "cluster") -> str:
     """
-    キー入力または同時押し操作を行います。
+    同じアプリを複数起動している場合に、各クライアントをインスタンス名 ("cluster-1", "cluster-2", ...) で一覧します。
+    新しく見つかったウィンドウは自動で登録し、終了したものは外します。
+    各ツールの instance 引数にインスタンス名を指定すると、そのクライアントを操作できます。
+    インスタンスごとに別のキューで実行され、続けて届いた操作はまとめて実行するのでフォーカスの切り替えが少なくなります。
+
     Args:
-        keys: スペース区切りのキー (例: "w", "shift+w", "space", "command+c")
-              MacのCommandキーは 'command' と指定します。
-        duration: キーを押す時間
-        app_name: キー入力前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        app_name: 探すアプリ名 (部分一致)。
     """
-    target_app = app_name if app_name else CURRENT_APP_NAME
-    focus_msg = _focus_window_impl(target_app)
-    
-    # Mac用にキー名を調整（必要であれば）
-    # pyautoguiは一般的に 'command', 'shift', 'ctrl', 'option' などに対応
-    
-    key_groups = keys.lower().split()
-    results = []
-    
-    try:
-        for item in key_groups:
-            # 同時押し処理 ('+'で分割)
-            if '+' in item:
-                combo_keys = item.split('+')
-                
-                # キーダウン
-                for k in combo_keys:
-                    pyautogui.keyDown(k)
-                
-                time.sleep(duration)
-                
-                # キーアップ（逆順）
-                for k in reversed(combo_keys):
-                    pyautogui.keyUp(k)
-                
-                results.append(f"[{item}]")
-
-            # 単発キー処理
-            else:
-                pyautogui.keyDown(item)
-                time.sleep(duration)
-                pyautogui.keyUp(item)
-                results.append(item)
-            
-            time.sleep(0.05)
-            
-        return f"{focus_msg}\n入力完了: {' -> '.join(results)}" if focus_msg else f"入力完了: {' -> '.join(results)}"
-        
-    except Exception as e:
-        # エラー時は全てのキーをリセット試行
-        return f"{focus_msg}\n入力エラー: {str(e)} (キー名が正しいか確認してください)"
+    instances = await ACTION_QUEUES.run_readonly(INSTANCES.discover, app_name)
+    if not instances:
+        return f"'{app_name}' のウィンドウが見つかりませんでした。"
+    lines = [_describe_instance(i) for i in instances]
+    q = ACTION_QUEUES
+    lines.append(f"フォーカス切り替え {FOCUS_MANAGER.refocuses} 回, キューの切り替え {q.switches} 回 / "
+                 f"まとめて実行 {q.batches} 回 (最大 {q.max_batch} 件ずつ)")
+    return "\n".join(lines)
 
 @mcp.tool()
-def move_mouse_relative(x: int, y: int, button: str = "right", duration: float = 2.0, app_name: str = None) -> str:
+@METRICS.tool
+async def bind_instance(name: str, pid: int, window_id: int = None, app_name: str = "cluster") -> str:
     """
-    マウスを現在の位置から相対的に移動（ドラッグ）させます。視点変更用。
-    
+    PID (とウィンドウID) を指定してインスタンス名を付けます。既にある名前は付け替えます。
+
     Args:
-        x: 横方向移動量
-        y: 縦方向移動量
-        button: ドラッグするボタン ('left', 'right', 'middle')。デフォルトは 'right' (視点移動用)。ただの移動なら None または 'none'。
-        duration: かける時間 (デフォルト: 2.0秒)
-        app_name: 操作前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        name: インスタンス名 (例: "host", "guest")。
+        pid: クライアントのプロセスID。
+        window_id: ウィンドウID。省略時はそのプロセスで面積最大のウィンドウを使います。
+        app_name: アプリ名 (list_instances での一覧用)。
     """
-    target_app = app_name if app_name else CURRENT_APP_NAME
-    focus_msg = _focus_window_impl(target_app)
+    if window_id is None:
+        windows = await ACTION_QUEUES.run_readonly(WINDOW_REGISTRY.refresh)
+        windows = [w for w in windows if w.pid == pid and w.layer == 0]
+        if not windows:
+            return f"エラー: PID {pid} のウィンドウが見つかりませんでした。"
+        window_id = max(windows, key=lambda w: w.bounds[2] * w.bounds[3]).window_id
+    try:
+        instance = INSTANCES.bind(name, pid, window_id, app_name)
+    except ValueError as e:
+        return f"入力エラー: {e}"
+    return f"登録しました: {_describe_instance(instance)}"
 
+# ---------------------------------------------------------------
+# ステップ実行 (各ツールと run_actions で共通の実装)
+# 各ステップはフォーカス済みの前提で入力だけを行い、結果メッセージを返す。失敗時は例外を送出する。
+# ---------------------------------------------------------------
+
+def _hold_keys(keys, duration: float) -> bool:
+    """内部用: キーを同時に押してduration秒保持し、逆順に離す。中断された場合は True を返す"""
+    pressed = []
     try:
-        # Retinaディスプレイ等のスケーリング対策が必要な場合がありますが、
-        # 相対移動(moveRel)なら基本的にはそのまま動作します。
-        
+        for k in keys:
+            INPUT.key_down(k)
+            pressed.append(k)
+        return _pause(duration)
+    finally:
+        # 途中でエラーになっても押したキーは必ず離す
+        for k in reversed(pressed):
+            INPUT.key_up(k)
 
-        # 現在位置とウィンドウ範囲を取得
-        current_x, current_y = pyautogui.position()
-        bounds = _get_window_bounds_impl(target_app)
-        
-        if bounds:
-            win_x, win_y, win_w, win_h = bounds
-            
-            # まずウィンドウ中央に移動（ユーザー要望）
-            center_x = win_x + (win_w // 2)
-            center_y = win_y + (win_h // 2)
-            _post_mouse_event(kCGEventMouseMoved, center_x, center_y, kCGMouseButtonLeft)
-            current_x, current_y = center_x, center_y
-            
-            # 目標座標を計算
-            target_x = current_x + x
-            target_y = current_y + y
-            
-            # ウィンドウ範囲内にクランプ
-            target_x = max(win_x, min(win_x + win_w, target_x))
-            target_y = max(win_y, min(win_y + win_h, target_y))
-            
-            # 補正後の相対移動量を再計算
-            # x, y は相対移動量、current_x, current_y は絶対座標として管理
-            
-        else:
-            # クランプなし
-            target_x = current_x + x
-            target_y = current_y + y
-
-        # buttonが None または 文字列の 'none' 以外ならドラッグ
-        if button and button.lower() not in ['none', '']:
-            # 指定がなければ right
-            btn = button.lower()
-            
-            down_evt = kCGEventRightMouseDown
-            up_evt = kCGEventRightMouseUp
-            drag_evt = kCGEventRightMouseDragged
-            cg_btn = kCGMouseButtonRight
-            
-            if btn == 'left':
-                down_evt = kCGEventLeftMouseDown
-                up_evt = kCGEventLeftMouseUp
-                drag_evt = kCGEventLeftMouseDragged
-                cg_btn = kCGMouseButtonLeft
-            elif btn == 'middle':
-                down_evt = kCGEventOtherMouseDown
-                up_evt = kCGEventOtherMouseUp
-                drag_evt = kCGEventOtherMouseDragged
-                cg_btn = kCGMouseButtonCenter
-            
-            # Down
-            _post_mouse_event(down_evt, current_x, current_y, cg_btn)
-            
-            # ユーザー要望: 右クリック長押し
-            time.sleep(0.3)
-            
-            # Drag Loop
-            # 現在地から target_x, target_y へ補間
-            start_x, start_y = current_x, current_y
-            diff_x = target_x - start_x
-            diff_y = target_y - start_y
-            
-            if duration > 0:
-                steps = int(max(duration * 60, 1))
-                dt = duration / steps
-                prev_x, prev_y = start_x, start_y
-                for i in range(steps):
-                    # 線形補間
-                    progress = (i + 1) / steps
-                    next_x = start_x + (diff_x * progress)
-                    next_y = start_y + (diff_y * progress)
-                    
-                    # Delta計算
-                    dx = next_x - prev_x
-                    dy = next_y - prev_y
-                    
-                    _post_mouse_event(drag_evt, next_x, next_y, cg_btn, dx=dx, dy=dy)
-                    prev_x, prev_y = next_x, next_y
-                    time.sleep(dt)
-            else:
-                _post_mouse_event(drag_evt, target_x, target_y, cg_btn, dx=diff_x, dy=diff_y)
-                
-            # Up
-            _post_mouse_event(up_evt, target_x, target_y, cg_btn)
-            
-            action = f"{btn}ボタンドラッグ(Quartz+Delta)"
+def _key_step(step: KeyStep, app_name: str = None) -> str:
+    """ステップ: キー入力 (スペース区切りで順番に、'+'で同時押し)"""
+    # Mac用にキー名を調整（必要であれば）
+    # pyautoguiは一般的に 'command', 'shift', 'ctrl', 'option' などに対応
+
+    key_groups = step.keys.lower().split()
+    results = []
+
+    for i, item in enumerate(key_groups):
+        # 同時押し処理 ('+'で分割)
+        if '+' in item:
+            interrupted = _hold_keys(item.split('+'), step.duration)
+            results.append(f"[{item}]")
+
+        # 単発キー処理
         else:
-            # Move
-            start_x, start_y = current_x, current_y
-            diff_x = target_x - start_x
-            diff_y = target_y - start_y
-            
-            if duration > 0:
-                steps = int(max(duration * 60, 1))
-                dt = duration / steps
-                prev_x, prev_y = start_x, start_y
-                for i in range(steps):
-                    progress = (i + 1) / steps
-                    next_x = start_x + (diff_x * progress)
-                    next_y = start_y + (diff_y * progress)
-                    
-                    dx = next_x - prev_x
-                    dy = next_y - prev_y
-                    
-                    _post_mouse_event(kCGEventMouseMoved, next_x, next_y, kCGMouseButtonLeft, dx=dx, dy=dy)
-                    prev_x, prev_y = next_x, next_y
-                    time.sleep(dt)
-            else:
-                _post_mouse_event(kCGEventMouseMoved, target_x, target_y, kCGMouseButtonLeft)
-                
-            action = f"マウス移動(Quartz)"
+            interrupted = _hold_keys([item], step.duration)
+            results.append(item)
 
-        return f"{focus_msg}\n視点操作完了: {action} (X:{x}, Y:{y})" if focus_msg else f"視点操作完了: {action} (X:{x}, Y:{y})"
-    except Exception as e:
-        return f"{focus_msg}\nマウス操作エラー: {str(e)}"
+        if interrupted or _pause(0.05, report=False):
+            return f"入力を中断しました: {' -> '.join(results)} ({i + 1}/{len(key_groups)} 個目で中断, キーは解放済み)"
 
-@mcp.tool()
-def scroll_zoom(amount: int, duration: float = 0.0, app_name: str = None) -> str:
-    """
-    マウスホイールを回転させてスクロール操作を行います。視点の拡大縮小などに使用します。
+    return f"入力完了: {' -> '.join(results)}"
 
-    Args:
-        amount: スクロール量。正の値で上回転（ズームイン）、負の値で下回転（ズームアウト）。
-                目安として 10 程度で大きく変化します。
-        duration: アニメーション時間（秒）。0の場合は瞬時にスクロールします。指定した場合は時間をかけてスクロールします。
-        app_name: 操作前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+def _post_interpolated_mouse(button, start_x, start_y, diff_x, diff_y, duration: float, profile: str = "linear"):
     """
-    target_app = app_name if app_name else CURRENT_APP_NAME
-    focus_msg = _focus_window_impl(target_app)
+    内部用: 始点から diff だけ duration 秒かけて、事前計算した経路 (profile) に沿ってマウスイベントを送る。
+    button を指定するとそのボタンのドラッグ、None なら移動のみ。
+    中断された場合はそこまでに動いた量 (dx, dy)、最後まで動いた場合は None を返す。
+    """
+    from trajectory import motion_path
+    path = motion_path(profile, int(diff_x), int(diff_y), duration, INPUT_RATE_HZ)
+    offsets = path.offsets
+    prev = [0, 0]
+
+    def tick(i, n):
+        # 飛ばしたティックがあっても、座標の差分で送るので移動量は失われない
+        ox, oy = int(offsets[i, 0]), int(offsets[i, 1])
+        x, y, dx, dy = start_x + ox, start_y + oy, ox - prev[0], oy - prev[1]
+        if button:
+            INPUT.mouse_drag(button, x, y, dx, dy)
+        else:
+            INPUT.mouse_move(x, y, dx, dy)
+        prev[0], prev[1] = ox, oy
+
+    # 絶対期限に合わせて送信するので、送信時間や sleep の誤差が積み上がらない
+    stats = _scheduler().run(duration, tick, ticks=path.ticks)
+    return (prev[0], prev[1]) if stats.stopped else None
+
+def _chord_step(step: ChordStep, app_name: str = None) -> str:
+    """ステップ: 複数キーの同時押し"""
+    keys = [k.strip().lower() for k in step.keys if k.strip()]
+    if _hold_keys(keys, step.duration):
+        return f"同時押しを中断しました: [{'+'.join(keys)}] ({current_control().percent()} 完了, キーは解放済み)"
+    return f"同時押し完了: [{'+'.join(keys)}]"
+
+def _timeline_step(step: KeyTimelineStep, app_name: str = None) -> str:
+    """ステップ: 重なりを許すキー押下のタイムライン"""
+    stats = run_key_timeline(step.events, INPUT.key_down, INPUT.key_up, scheduler=_scheduler())
+    summary = stats.summary()
+    if stats.stopped:
+        return (f"タイムライン入力を中断しました: {stats.reached}/{stats.ticks_planned}イベント実行, "
+                f"{summary['elapsed']:.3f}秒 (キーは解放済み)")
+    return (f"タイムライン入力完了: {len(step.events)}キー, {stats.ticks}イベント, "
+            f"{summary['elapsed']:.3f}秒 (最大遅れ {summary['jitter_max'] * 1000:.1f}ms)")
+
+def _drag_step(step: DragStep, app_name: str = None) -> str:
+    """ステップ: マウスの相対移動・ドラッグ (視点操作)"""
+    x, y, button, duration = step.x, step.y, step.button, step.duration
+
+    # Retinaディスプレイ等のスケーリング対策が必要な場合がありますが、
+    # 相対移動(moveRel)なら基本的にはそのまま動作します。
+
+
+    # 現在位置とウィンドウ範囲を取得
+    current_x, current_y = INPUT.mouse_position()
+    bounds = _get_window_bounds_impl(app_name)
+
+    if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
+        win_x, win_y, win_w, win_h = bounds
+
+        # まずウィンドウ中央に移動（ユーザー要望）
+        center_x = win_x + (win_w // 2)
+        center_y = win_y + (win_h // 2)
+        INPUT.mouse_move(center_x, center_y)
+        current_x, current_y = center_x, center_y
+
+        # 目標座標を計算
+        target_x = current_x + x
+        target_y = current_y + y
+
+        # ウィンドウ範囲内にクランプ
+        target_x = max(win_x, min(win_x + win_w, target_x))
+        target_y = max(win_y, min(win_y + win_h, target_y))
+
+        # 補正後の相対移動量を再計算
+        # x, y は相対移動量、current_x, current_y は絶対座標として管理
+
+    else:
+        # クランプなし
+        target_x = current_x + x
+        target_y = current_y + y
+
+    # buttonが None または 文字列の 'none' 以外ならドラッグ
+    if button and button.lower() not in ['none', '']:
+        # 指定がなければ right
+        btn = button.lower()
+        cg_btn = btn if btn in ('left', 'middle') else 'right'
+
+        # Down
+        INPUT.mouse_button(cg_btn, True, current_x, current_y)
+        # ボタンを離す位置 (中断した場合はそこまで動いた位置)
+        end = [current_x, current_y]
+
+        try:
+            # ユーザー要望: 右クリック長押し
+            if _pause(0.3, report=False):
+                stopped = (0, 0)
+            else:
+                # Drag Loop
+                # 現在地から target_x, target_y へ補間
+                start_x, start_y = current_x, current_y
+                diff_x = target_x - start_x
+                diff_y = target_y - start_y
+
+                if duration > 0:
+                    stopped = _post_interpolated_mouse(cg_btn, start_x, start_y, diff_x, diff_y, duration,
+                                                       step.profile)
+                else:
+                    INPUT.mouse_drag(cg_btn, target_x, target_y, diff_x, diff_y)
+                    stopped = None
+                end = [target_x, target_y] if stopped is None else [start_x + stopped[0], start_y + stopped[1]]
+        finally:
+            # Up (途中でエラーになってもボタンは離す)
+            INPUT.mouse_button(cg_btn, False, end[0], end[1])
+
+        action = f"{btn}ボタンドラッグ(Quartz+Delta)"
+    else:
+        # Move
+        start_x, start_y = current_x, current_y
+        diff_x = target_x - start_x
+        diff_y = target_y - start_y
 
-    try:
         if duration > 0:
-            # 連続スクロール
-            steps = int(max(duration * 10, 1)) # 0.1秒に1回程度
-            step_delay = duration / steps
-            step_amount = int(amount / steps)
-            
-            # 余り対策
-            remainder = amount - (step_amount * steps)
-            
-            for i in range(steps):
-                current_amount = step_amount
-                if i == steps - 1:
-                    current_amount += remainder
-                
-                if current_amount != 0:
-                    # Quartz scroll (wheelCount units)
-                    # pyautoguiのamount ~10 -> Quartz 1
-                    scroll_val = int(current_amount / 10)
-                    if scroll_val == 0:
-                        scroll_val = 1 if current_amount > 0 else -1
-                    _post_scroll_event(scroll_val)
-                time.sleep(step_delay)
-                
-            return f"{focus_msg}\nスクロール操作完了 (アニメーション): amount={amount}, duration={duration}" if focus_msg else f"スクロール操作完了 (アニメーション): amount={amount}, duration={duration}"
+            stopped = _post_interpolated_mouse(None, start_x, start_y, diff_x, diff_y, duration, step.profile)
         else:
-            # Quartz scroll
-            scroll_val = int(amount / 10)
-            if scroll_val == 0 and amount != 0:
-                 scroll_val = 1 if amount > 0 else -1
-            _post_scroll_event(scroll_val)
-            return f"{focus_msg}\nスクロール操作完了: amount={amount}" if focus_msg else f"スクロール操作完了: amount={amount}"
-    except Exception as e:
-        return f"{focus_msg}\nスクロール操作エラー: {str(e)}"
+            INPUT.mouse_move(target_x, target_y)
+            stopped = None
 
-def _copy_to_clipboard(text: str):
-    """クリップボードにテキストをコピー (Mac用 pbcopy)"""
-    try:
-        # echo -n で改行なしで渡す
-        process = subprocess.Popen(['pbcopy'], stdin=subprocess.PIPE)
-        process.communicate(input=text.encode('utf-8'))
-    except Exception as e:
-        print(f"Clipboard Error: {e}")
+        action = f"マウス移動(Quartz)"
 
-@mcp.tool()
-def send_comment(comment: str, app_name: str = None) -> str:
+    if stopped is not None:
+        return (f"視点操作を中断しました: {action} ({current_control().percent()} 完了, "
+                f"X:{stopped[0]}, Y:{stopped[1]} / X:{x}, Y:{y})")
+    return f"視点操作完了: {action} (X:{x}, Y:{y})"
+
+def _scroll_engine(app_name: str) -> ScrollEngine:
+    """内部用: 対象アプリのスクロール (端数の持ち越しはアプリ・インスタンスごと)"""
+    key = (app_name or "").lower()
+    engine = SCROLL_ENGINES.get(key)
+    if engine is None:
+        engine = SCROLL_ENGINES[key] = ScrollEngine(INPUT, SCROLL_UNIT, SCROLL_PIXELS_PER_LINE)
+    # 入力バックエンドが差し替えられていても今のものへ送る
+    engine.backend = INPUT
+    return engine
+
+def _scroll_step(step: ScrollStep, app_name: str = None) -> str:
+    """ステップ: マウスホイールのスクロール (端数は持ち越すので、送る合計は指定した量と一致する)"""
+    amount, duration = step.amount, step.duration
+    engine = _scroll_engine(app_name)
+
+    if duration > 0:
+        # 入力レートで少しずつ送る (遅れて飛ばしたティックの分は次のティックでまとめて送る)
+        stats, _ = engine.run(amount, duration, _scheduler(), step.profile)
+        if stats.stopped:
+            return (f"スクロール操作を中断しました: {stats.reached}/{stats.ticks_planned} ステップ実行 "
+                    f"({stats.fraction * 100:.0f}% 完了), amount={amount:g}")
+        return f"スクロール操作完了 (アニメーション): amount={amount:g}, duration={duration}"
+    engine.scroll(amount)
+    return f"スクロール操作完了: amount={amount:g}"
+
+def _emote_step(step: EmoteStep, app_name: str = None) -> str:
+    """ステップ: エモート (キー入力後に待機)"""
+    # マップからキーを検索、無ければそのまま使用
+    key = EMOTE_MAP.get(step.emote.lower(), step.emote)
+
+    msg = _key_step(KeyStep(keys=key, duration=0.1), app_name)
+
+    # ユーザー要望によりエモート後に1秒ウェイト
+    if _pause(step.wait):
+        return f"{msg} (待機を中断しました)"
+
+    return f"{msg} ({step.wait:g}秒待機)"
+
+def _chat_roi_probe(app_name: str):
+    """内部用: チャット欄付近を撮影する関数を返す (ウィンドウが見つからなければ None)"""
+    if CHAT_ROI is None:
+        return None
+    bounds = _get_window_bounds_impl(app_name)
+    if not (isinstance(bounds, (tuple, list)) and len(bounds) == 4):
+        return None
+    bx, by, bw, bh = bounds
+    rx, ry, rw, rh = CHAT_ROI
+    rect = (int(bx + bw * rx), int(by + bh * ry), max(1, int(bw * rw)), max(1, int(bh * rh)))
+    return lambda: grab_rect(*rect)
+
+def _roi_differs(a, b) -> bool:
+    """内部用: チャット欄の画像が変化したか (タイル1枚でも変われば変化とみなす)"""
+    from frame_diff import diff_frames
+    return diff_frames(a, b, scale=0.5).score > 0
+
+def _chat_changed(probe):
     """
-    チャットコメントを送信します。
-    Bキーでチャットを開き、クリップボード経由で貼り付けてエンターで送信します。
-    日本語も送信可能です。
+    内部用: 今のチャット欄を基準にして、そこから変化したら True を返す述語を作る。
+    判定できない場合 (probe が無い・基準画像を撮れない) は None を返す。
     """
-    target_app = app_name if app_name else CURRENT_APP_NAME
-    focus_msg = _focus_window_impl(target_app)
-    
+    if probe is None:
+        return None
     try:
-        # 1. チャットを開く (B)
-        pyautogui.press('b')
-        time.sleep(0.5)
-        
-        # 2. クリップボードにコピー
-        _copy_to_clipboard(comment)
-        
-        # 3. 貼り付け (Cmd+V)
-        pyautogui.hotkey('command', 'v')
-        time.sleep(0.1)
-        
-        # 4. 送信 (Enter)
-        pyautogui.press('enter')
-        
-        # 送信後に少し待ってからBキーで閉じる（ユーザー報告により追加）
-        # Enterで送信後、入力モードから抜けるがウィンドウが残る場合、Bで閉じる挙動の可能性
-        # さらに、クリックしてフォーカスを戻してからBを押す（ユーザー要望）
-        time.sleep(1.0)
-        
-        bounds = _get_window_bounds_impl(target_app)
-        if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
-            bx, by, bw, bh = bounds
-            center_x = bx + (bw // 2)
-            center_y = by + (bh // 2)
-            _post_mouse_event(kCGEventMouseMoved, center_x, center_y, kCGMouseButtonLeft)
-            _post_mouse_event(kCGEventLeftMouseDown, center_x, center_y, kCGMouseButtonLeft)
-            _post_mouse_event(kCGEventLeftMouseUp, center_x, center_y, kCGMouseButtonLeft)
-            time.sleep(0.5)
-            
-        pyautogui.press('b')
-        
-        return f"{focus_msg}\nコメント送信完了: {comment}" if focus_msg else f"コメント送信完了: {comment}"
-        
-    except Exception as e:
-        return f"{focus_msg}\nコメント送信エラー: {str(e)}"
+        return changed_from(probe, _roi_differs)
+    except Exception:
+        return None
 
-@mcp.tool()
-def perform_emote(emote_name: str, app_name: str = None) -> str:
-    """
-    エモートを実行します。
-    名前（"wave", "clap"など）またはキー（"1"など）で指定できます。
-    利用可能なエモート名: wave, clap, nod, shake, heart, joy, surprise, sad, angry, special
-    """
-    target_app = app_name if app_name else CURRENT_APP_NAME
-    
-    # マップからキーを検索、無ければそのまま使用
-    key = EMOTE_MAP.get(emote_name.lower(), emote_name)
-    
-    # 実際に入力するキーが有効か一応チェック（ここでは簡易的に）
-    msg = press_game_keys(keys=key, duration=0.1, app_name=target_app)
-    
-    # ユーザー要望によりエモート後に1秒ウェイト
-    time.sleep(1.0)
-    
-    return f"{msg} (1秒待機)"
+def _wait_for(predicate, timeout: float, min_wait: float = 0.0) -> float:
+    """内部用: predicate が満たされるまで最大 timeout 秒待ち、待った秒数を返す"""
+    if predicate is None:
+        # 判定できない場合は従来通り上限まで待つ
+        INPUT.sleep(timeout)
+        return timeout
+    return wait_until(predicate, timeout, min_wait=min_wait).elapsed
 
-@mcp.tool()
-def wave_hands(side: str = "right", duration: float = 2.0, app_name: str = None) -> str:
+def _wait_chat_settled(probe, timeout: float) -> float:
+    """内部用: チャット欄の動きが収まるまで最大 timeout 秒待ち、待った秒数を返す"""
+    try:
+        predicate = settled(probe, _roi_differs) if probe else None
+    except Exception:
+        predicate = None
+    # 静止判定は、直後の2枚がたまたま同じになるのを避けるため少し間を空けてから始める
+    return _wait_for(predicate, timeout, min_wait=SETTLE_MIN_WAIT)
+
+def _open_chat(probe, waits: dict):
+    """内部用: Bキーでチャットを開く"""
+    # 基準画像を押下前に撮っておく
+    opened = _chat_changed(probe)
+    INPUT.press('b')
+    waits["open"] = _wait_for(opened, 0.5)
+
+def _post_chat_message(text: str, probe, waits: dict):
+    """内部用: 開いているチャットにクリップボード経由で貼り付けて Enter で送信する"""
+    # クリップボードにコピー (読み戻して反映を確認)
+    _copy_to_clipboard(text)
+    waits["clipboard"] = waits.get("clipboard", 0.0) + wait_until(lambda: _read_clipboard() == text, 0.5).elapsed
+
+    # 貼り付け (Cmd+V)
+    pasted = _chat_changed(probe)
+    INPUT.hotkey('command', 'v')
+    waits["paste"] = waits.get("paste", 0.0) + _wait_for(pasted, 0.1)
+
+    # 送信 (Enter)
+    sent = _chat_changed(probe)
+    INPUT.press('enter')
+    waits["send"] = waits.get("send", 0.0) + _wait_for(sent, 1.0)
+
+def _close_chat(app_name: str, probe, waits: dict):
+    """内部用: ウィンドウ中央をクリックしてフォーカスを戻し、Bキーでチャットを閉じる"""
+    # Enterで送信後、入力モードから抜けるがウィンドウが残る場合、Bで閉じる挙動の可能性
+    # さらに、クリックしてフォーカスを戻してからBを押す（ユーザー要望）
+    bounds = _get_window_bounds_impl(app_name)
+    if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
+        bx, by, bw, bh = bounds
+        center_x = bx + (bw // 2)
+        center_y = by + (bh // 2)
+        INPUT.mouse_move(center_x, center_y)
+        INPUT.mouse_button('left', True, center_x, center_y)
+        INPUT.mouse_button('left', False, center_x, center_y)
+        # クリック後の画面の動きが収まるまで待つ
+        waits["click"] = _wait_chat_settled(probe, 0.5)
+
+    INPUT.press('b')
+
+def _format_waits(waits: dict) -> str:
+    return ", ".join(f"{k} {v:.2f}s" for k, v in waits.items())
+
+def _comment_step(step: CommentStep, app_name: str = None) -> str:
+    """ステップ: チャットコメント送信"""
+    # 各待機は画面やクリップボードの変化を確認できた時点で打ち切る (従来の固定待ち時間は上限として使う)
+    waits = {}
+    probe = _chat_roi_probe(app_name)
+    _open_chat(probe, waits)
+    _post_chat_message(step.text, probe, waits)
+    _close_chat(app_name, probe, waits)
+    return f"コメント送信完了: {step.text} (待機: {_format_waits(waits)})"
+
+def _send_comment_batch(session, app_name: str, rate_limiter) -> int:
     """
-    指定した腕（CキーまたはZキー）を上げながらマウスを動かして手を振る動作を行います。
-    
-    Args:
-        side: "right" (右手/Cキー), "left" (左手/Zキー), "both" (両手). Default: "right"
-        duration: 動作時間(秒). Default: 2.0
-        app_name: アプリ名.
+    内部用: チャットを1回開いたまま、送信待ちのコメントを続けて送信する。
+    送信中に届いたコメントも session.next() で受け取って同じチャットに貼り付ける。
+    送信間隔は rate_limiter で制限する。間隔をあけて待つ間は入力ロックを他のアプリへ譲る。送信した件数を返す。
     """
-    target_app = app_name if app_name else CURRENT_APP_NAME
-    focus_msg = _focus_window_impl(target_app)
-    
+    text = session.next()
+    if text is None:
+        return 0
+    focus_msg = _focus_window_impl(app_name)
+    prefix = f"{focus_msg}\n" if focus_msg else ""
+    probe = _chat_roi_probe(app_name)
+    _open_chat(probe, {})
+    count = 0
+    try:
+        while text is not None:
+            if count > 0 and CHAT_REOPEN_KEY:
+                # 送信後に入力モードが外れる場合は、次の貼り付け前に入力欄を開き直す
+                INPUT.press(CHAT_REOPEN_KEY)
+            waits = {"rate": rate_limiter.acquire(ACTION_QUEUES.pause_input)}
+            if waits["rate"] > 0:
+                # 待つ間に他のアプリが入力していればフォーカスが移っているので戻す
+                _focus_window_impl(app_name)
+            try:
+                _post_chat_message(text, probe, waits)
+                session.done(f"{prefix}コメント送信完了: {text} (待機: {_format_waits(waits)})")
+            except Exception as e:
+                session.done(f"{prefix}コメント送信エラー: {e}", ok=False)
+            count += 1
+            prefix = ""
+            text = session.next()
+    finally:
+        _close_chat(app_name, probe, {})
+    return count
+
+def _wave_step(step: WaveStep, app_name: str = None) -> str:
+    """ステップ: 腕を上げながらマウスを8の字に動かして手を振る"""
+    side, duration = step.side, step.duration
+
     side_map = {
         'right': ['c'],
         'left': ['z'],
         'both': ['z', 'c']
     }
-    
+
     keys = side_map.get(side.lower())
     if not keys:
-         return f"{focus_msg}\nエラー: sideは right, left, both のいずれかを指定してください"
+        raise ValueError("sideは right, left, both のいずれかを指定してください")
 
+    pressed = []
     try:
         # キーを押す
         for k in keys:
-            pyautogui.keyDown(k)
-            
+            INPUT.key_down(k)
+            pressed.append(k)
+
         # マウスを振るループ (8の字に動かすと自然に見える)
-        start_t = time.time()
-        
+
         # 振幅と速度
         amp = 40.0
         speed = 8.0
-        
+
         # 画面中央付近を基準にするため現在地取得
-        mx, my = pyautogui.position()
-        
-        while time.time() - start_t < duration:
-            t = time.time() - start_t
-            
-            # 速度成分 (Delta) を計算
-            # 位置 x = sin(t), y = sin(2t) / 2 とすると
-            # 速度 dx = cos(t), dy = cos(2t)
-            
-            dx = int(amp * math.cos(t * speed)) 
-            dy = int(amp * math.cos(t * speed * 2) * 0.5)
-            
-            _post_mouse_event(kCGEventMouseMoved, mx, my, kCGMouseButtonLeft, dx=dx, dy=dy)
-            
-            time.sleep(0.05)
-            
-        return f"{focus_msg}\n手を振る動作完了 ({side}, {duration}秒)"
-        
-    except Exception as e:
-        return f"{focus_msg}\nエラー: {e}"
+        mx, my = INPUT.mouse_position()
+
+        # 位置 x = sin(t), y = sin(2t) / 2 の速度成分 (Delta) を事前計算した経路を再生する
+        # 丸め誤差は次のティックに持ち越すので、8の字の形がティックごとの切り捨てで歪まない
+        from trajectory import figure8_path
+        path = figure8_path(amp, duration, WAVE_RATE_HZ, speed)
+        deltas = path.deltas
+
+        def tick(i, n):
+            INPUT.mouse_move(mx, my, int(deltas[i, 0]), int(deltas[i, 1]))
+
+        # 1イベントあたりの移動量が固定なので、レートは従来の 20Hz (0.05秒間隔) のまま
+        # 8の字の形を保つため、遅れてもティックは飛ばさない
+        if duration > 0:
+            stats = _scheduler(WAVE_RATE_HZ, skip_frames=False).run(duration, tick, ticks=path.ticks)
+            if stats.stopped:
+                return f"手を振る動作を中断しました ({side}, {stats.elapsed:.2f}/{duration}秒, キーは解放済み)"
+
+        return f"手を振る動作完了 ({side}, {duration}秒)"
     finally:
         # 必ずキーを離す
-        for k in keys:
-            pyautogui.keyUp(k)
+        for k in pressed:
+            INPUT.key_up(k)
+
+def _wait_step(step: WaitStep, app_name: str = None) -> str:
+    """ステップ: 待機"""
+    if _pause(step.seconds):
+        return f"待機を中断しました ({current_control().percent()} 完了)"
+    return f"待機完了 ({step.seconds}秒)"
+
+STEP_EXECUTOR = StepExecutor({
+    "key": _key_step,
+    "chord": _chord_step,
+    "timeline": _timeline_step,
+    "drag": _drag_step,
+    "scroll": _scroll_step,
+    "emote": _emote_step,
+    "comment": _comment_step,
+    "wave": _wave_step,
+    "wait": _wait_step,
+})
+
+def _run_tool_step(step, app_name: str, error_format: str) -> str:
+    """内部用: 単一ステップのツールを実行する (フォーカス → ステップ実行 → メッセージ整形)"""
+    target_app = app_name if app_name else _default_app()
+    focus_msg = _focus_window_impl(target_app)
+    result = STEP_EXECUTOR.run([step], target_app)[0]
+    msg = result.message if result.ok else error_format.format(result.error)
+    return f"{focus_msg}\n{msg}" if focus_msg else msg
+
+
+def _progress_sender(ctx: Context):
+    """内部用: 実行スレッドから MCP の進捗通知を送る関数を返す (進捗トークンが無ければ None)"""
+    if ctx is None:
+        return None
+    try:
+        meta = ctx.request_context.meta
+    except Exception:
+        return None
+    if meta is None or meta.progressToken is None:
+        return None
+    loop = asyncio.get_running_loop()
+
+    def send(progress: float, total: float, message: str = None):
+        asyncio.run_coroutine_threadsafe(ctx.report_progress(progress, total, message), loop)
+    return send
+
+def _queue_error(e: Exception) -> str:
+    """内部用: 受け付けられなかった・期限切れになった入力アクションのメッセージ"""
+    if isinstance(e, Overloaded):
+        return f"混雑エラー: {e}。少し待ってから再度実行してください。"
+    return f"期限切れ: {e}。操作は実行していません。"
+
+async def _submit_action(target_app: str, ctx: Context, func, *args):
+    """
+    内部用: 中断・進捗通知付きで入力アクションをアプリのキューに積み、結果を待つ。
+    リクエストがキャンセルされた場合や cancel_actions が呼ばれた場合は、実行スレッドが次のティックで
+    押しているキー・ボタンを離して止まる。混雑で断られた場合・期限までに始まらなかった場合はその旨を返す。
+    """
+    control = ActionControl(_progress_sender(ctx), min_interval=PROGRESS_INTERVAL)
+    controls = ACTIVE_CONTROLS.setdefault(target_app.lower(), set())
+    controls.add(control)
+    # キューはコンテキストごと実行スレッドに渡すので、実行中のステップから current_control() で参照できる
+    token = CURRENT_CONTROL.set(control)
+    try:
+        return await ACTION_QUEUES.submit(target_app, func, *args)
+    except (Overloaded, DeadlineExceeded) as e:
+        return _queue_error(e)
+    except asyncio.CancelledError:
+        control.cancel()
+        raise
+    finally:
+        CURRENT_CONTROL.reset(token)
+        controls.discard(control)
 
 @mcp.tool()
-def take_screenshot(app_name: str = None) -> str:
+@METRICS.tool
+@_input_errors
+async def cancel_actions(app_name: str = None, instance: str = None) -> str:
     """
-    現在の画面をスクリーンショット撮影し、一時ファイルのパスを返します。
-    アプリ名を指定する（またはデフォルトアプリがある）場合、そのウィンドウをアクティブにしてから
-    その領域だけを撮影します。
+    指定したアプリで実行中・実行待ちの入力操作 (ドラッグ、キー長押し、手を振る動作、run_actions など) を中断します。
+    そのアプリで継続移動 (start_moving) 中なら移動も止めます。
+    押しているキーやマウスボタンは離され、中断された操作はどこまで進んだかを返します。
+    """
+    target_app = _target_app(app_name, instance)
+    controls = list(ACTIVE_CONTROLS.get(target_app.lower(), ()))
+    for control in controls:
+        control.cancel()
+    moving = LOCOMOTION is not None and LOCOMOTION.running and LOCOMOTION_APP == target_app.lower()
+    if moving:
+        await asyncio.to_thread(LOCOMOTION.stop, reason="cancel")
+    if not controls and not moving:
+        return f"'{target_app}' で実行中の操作はありません。"
+    lines = []
+    if controls:
+        lines.append(f"'{target_app}' の操作 {len(controls)} 件に中断を要求しました。")
+    if moving:
+        lines.append(f"継続移動を停止しました: {_describe_locomotion(LOCOMOTION.state())}")
+    return "\n".join(lines)
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def press_game_keys(keys: str = "", duration: float = 0.1, app_name: str = None,
+                          timeline: List[KeyEvent] = None, instance: str = None, ctx: Context = None) -> str:
+    """
+    キー入力または同時押し操作を行います。
+    Args:
+        keys: スペース区切りのキー (例: "w", "shift+w", "space", "command+c")
+              MacのCommandキーは 'command' と指定します。
+        duration: キーを押す時間
+        app_name: キー入力前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        timeline: タイムラインモード。指定した場合 keys, duration は使わず、各キーを開始時刻と押下時間で指定します。
+                  押下は重なってもよく、例えば w を2秒押しながら0.5秒後に space を押せます。
+                  例: [{"key": "w", "start": 0, "hold": 2.0}, {"key": "space", "start": 0.5, "hold": 0.1}]
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
     """
+    target_app = _target_app(app_name, instance)
+    if timeline:
+        errors = validate_key_events(timeline)
+        if errors:
+            return "入力エラー: " + ", ".join(errors)
+        step = KeyTimelineStep(events=timeline)
+    else:
+        step = _make_step(KeyStep, keys=keys, duration=duration)
+    return await _submit_action(target_app, ctx, _run_tool_step, step, target_app,
+                                "入力エラー: {} (キー名が正しいか確認してください)")
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def move_mouse_relative(x: int, y: int, button: str = "right", duration: float = 2.0, app_name: str = None,
+                              profile: str = "linear", instance: str = None, ctx: Context = None) -> str:
+    """
+    マウスを現在の位置から相対的に移動（ドラッグ）させます。視点変更用。
+
+    Args:
+        x: 横方向移動量
+        y: 縦方向移動量
+        button: ドラッグするボタン ('left', 'right', 'middle')。デフォルトは 'right' (視点移動用)。ただの移動なら None または 'none'。
+        duration: かける時間 (デフォルト: 2.0秒)
+        app_name: 操作前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        profile: 動き方。'linear' (等速), 'ease_in_out' (加減速), 'bezier' (曲線を描いて加減速)。デフォルトは 'linear'。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    step = _make_step(DragStep, x=x, y=y, button=button, duration=duration, profile=profile)
+    return await _submit_action(target_app, ctx, _run_tool_step, step, target_app, "マウス操作エラー: {}")
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def scroll_zoom(amount: float, duration: float = 0.0, app_name: str = None, instance: str = None,
+                      profile: str = "linear", ctx: Context = None) -> str:
+    """
+    マウスホイールを回転させてスクロール操作を行います。視点の拡大縮小などに使用します。
+
+    Args:
+        amount: スクロール量。正の値で上回転（ズームイン）、負の値で下回転（ズームアウト）。
+                目安として 10 程度で大きく変化します。小数も指定でき、端数は次のスクロールに持ち越すので
+                合計は指定した量の合計と一致します (例: 5 を2回で 10 と同じ)。
+        duration: アニメーション時間（秒）。0の場合は瞬時にスクロールします。指定した場合は時間をかけてスクロールします。
+        app_name: 操作前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+        profile: duration 指定時の速さの変化。'linear' (一定), 'ease_in_out' (加減速), 'ease_in' (加速),
+                 'ease_out' (減速)。デフォルトは 'linear'。
+    """
+    target_app = _target_app(app_name, instance)
+    step = _make_step(ScrollStep, amount=amount, duration=duration, profile=profile)
+    return await _submit_action(target_app, ctx, _run_tool_step, step, target_app, "スクロール操作エラー: {}")
+
+def _read_clipboard() -> str:
+    """クリップボードの内容を読み出す"""
     try:
-        target_app = app_name if app_name else CURRENT_APP_NAME
-        
-        # アプリをアクティブにする
-        if target_app:
-            _focus_window_impl(target_app)
-            # アニメーション待ちなどを考慮して少し待機
-            time.sleep(0.5)
-
-        # ウィンドウ領域を取得
-        region = None
-        if target_app:
-            bounds = _get_window_bounds_impl(target_app)
-            # boundsは (x, y, w, h) のタプルであることを期待
-            if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
-                region = bounds
-        
-        temp_dir = tempfile.gettempdir()
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"mac_screenshot_{timestamp}.png"
-        filepath = os.path.join(temp_dir, filename)
+        return INPUT.clipboard_read()
+    except Exception:
+        return ""
+
+def _copy_to_clipboard(text: str):
+    """クリップボードにテキストをコピー (プロセス内のペーストボードに直接書き込む)"""
+    try:
+        INPUT.clipboard_write(text)
+    except Exception as e:
+        print(f"Clipboard Error: {e}")
+
+def _comment_outbox(app_name: str) -> CommentOutbox:
+    """内部用: アプリごとのコメント送信キューを返す (無ければ作る)"""
+    key = app_name.lower()
+    outbox = COMMENT_OUTBOXES.get(key)
+    if outbox is None:
+        async def runner(session, rate_limiter):
+            # まとめて送るコメントは複数のクライアントのものなので、受け付け・公平性はサーバー ("system") として数える
+            INTERNAL_CLIENT.set("system")
+            await ACTION_QUEUES.submit(app_name, _send_comment_batch, session, app_name, rate_limiter)
+        outbox = COMMENT_OUTBOXES[key] = CommentOutbox(runner, min_interval=COMMENT_MIN_INTERVAL)
+    return outbox
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def send_comment(comment: str, app_name: str = None, wait: bool = True, instance: str = None) -> str:
+    """
+    チャットコメントを送信します。
+    Bキーでチャットを開き、クリップボード経由で貼り付けてエンターで送信します。
+    日本語も送信可能です。
+    連続して送信したコメントはキューに溜まり、チャットを1回開いたまままとめて送信されます
+    (送信間隔は一定以上あけます。送信待ちの同じ文面は1件にまとめます)。
+
+    Args:
+        comment: 送信するコメント。
+        app_name: アプリ名.
+        wait: True の場合は送信完了まで待ちます。False の場合はキューに積んですぐに戻ります。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    outbox = _comment_outbox(target_app)
+    future = outbox.enqueue(comment)
+    if wait:
+        return await future
+    if future.done():
+        return future.result()
+    return f"コメントを送信キューに追加しました: {comment} (送信待ち {outbox.depth}件)"
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def get_comment_outbox_status(app_name: str = None, instance: str = None) -> str:
+    """
+    コメント送信キューの状態 (送信待ち件数・送信済み件数・失敗件数・まとめた件数・破棄件数・送信までの待ち時間) を返します。
+    """
+    target_app = _target_app(app_name, instance)
+    outbox = COMMENT_OUTBOXES.get(target_app.lower())
+    if outbox is None:
+        return f"'{target_app}' のコメント送信キューはまだありません。"
+    s = outbox.stats()
+    return (f"コメント送信キュー ({target_app}): 送信待ち {s['depth']}件, 送信済み {s['sent']}件, 失敗 {s['failed']}件 "
+            f"({s['batches']}回に分けて送信), まとめた重複 {s['coalesced']}件, 破棄 {s['dropped']}件, "
+            f"送信開始までの待ち p50 {s['wait_p50']:.2f}s / p99 {s['wait_p99']:.2f}s, "
+            f"送信完了まで p50 {s['latency_p50']:.2f}s / p99 {s['latency_p99']:.2f}s, "
+            f"送信間隔による待ち合計 {s['rate_wait']:.2f}s")
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def perform_emote(emote_name: str, app_name: str = None, instance: str = None, ctx: Context = None) -> str:
+    """
+    エモートを実行します。
+    名前（"wave", "clap"など）またはキー（"1"など）で指定できます。
+    利用可能なエモート名: wave, clap, nod, shake, heart, joy, surprise, sad, angry, special
+    """
+    target_app = _target_app(app_name, instance)
+    step = EmoteStep(emote=emote_name)
+    return await _submit_action(target_app, ctx, _run_tool_step, step, target_app,
+                                "入力エラー: {} (キー名が正しいか確認してください)")
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def wave_hands(side: str = "right", duration: float = 2.0, app_name: str = None, instance: str = None,
+                     ctx: Context = None) -> str:
+    """
+    指定した腕（CキーまたはZキー）を上げながらマウスを動かして手を振る動作を行います。
+
+    Args:
+        side: "right" (右手/Cキー), "left" (左手/Zキー), "both" (両手). Default: "right"
+        duration: 動作時間(秒). Default: 2.0
+        app_name: アプリ名.
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    step = WaveStep(side=side, duration=duration)
+    return await _submit_action(target_app, ctx, _run_tool_step, step, target_app, "エラー: {}")
+
+def _preempt_locomotion(app: str, func):
+    """
+    内部用: 入力アクションを実行する直前に (実行スレッドで) 呼ばれる。
+    継続移動中なら止めて、押しているキー・ボタンを離してから実行させる (start_moving 自身は除く)
+    """
+    if func is not _start_moving_impl and LOCOMOTION is not None and LOCOMOTION.running:
+        LOCOMOTION.stop(reason="input")
 
-        # region引数があればその範囲、なければ全画面
-        screenshot = pyautogui.screenshot(region=region)
-        screenshot.save(filepath)
+def _start_moving_impl(app_name: str, directions, sprint: bool, turn, watchdog: float) -> str:
+    """内部用: フォーカスしてウィンドウ中央を旋回の基点にし、継続移動を始める"""
+    global LOCOMOTION, LOCOMOTION_APP
+    # 別のアプリで移動中なら、フォーカスを移す前に止める
+    if LOCOMOTION is not None and LOCOMOTION.running and LOCOMOTION_APP != app_name.lower():
+        LOCOMOTION.stop(reason="input")
+    focus_msg = _focus_window_impl(app_name)
+    bounds = _get_window_bounds_impl(app_name)
+    if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
+        bx, by, bw, bh = bounds
+        anchor = (bx + bw // 2, by + bh // 2)
+    else:
+        anchor = INPUT.mouse_position()
+    # 入力バックエンドが差し替えられていたら作り直す
+    if LOCOMOTION is None or LOCOMOTION.backend is not INPUT:
+        if LOCOMOTION is not None:
+            LOCOMOTION.stop()
+        LOCOMOTION = LocomotionController(INPUT, LOCOMOTION_RATE_HZ, sprint_key=SPRINT_KEY)
+    LOCOMOTION.watchdog_timeout = watchdog
+    if not LOCOMOTION.running:
+        INPUT.mouse_move(*anchor)
+    LOCOMOTION_APP = app_name.lower()
+    LOCOMOTION.start(directions, sprint, turn, anchor)
+    return focus_msg
+
+# 継続移動が止まった理由 (LocomotionController.stop_reason) の表示
+_LOCOMOTION_STOP_REASONS = {
+    "watchdog": "無操作のため自動停止しました",
+    "input": "他の入力操作の前に停止しました",
+    "cancel": "cancel_actions で停止しました",
+}
+
+def _describe_locomotion(state: dict) -> str:
+    """内部用: 継続移動の状態を文字列にする"""
+    directions = "+".join(state["directions"]) or "なし"
+    sprint = " (ダッシュ)" if state["sprint"] else ""
+    tx, ty = state["turn"]
+    return (f"方向 {directions}{sprint}, 旋回 x={tx:g} y={ty:g} px/秒, "
+            f"経過 {state['elapsed']:.1f}秒, 旋回量合計 x={state['turned'][0]} y={state['turned'][1]}")
 
-        return filepath
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def start_moving(direction: str = "forward", sprint: bool = False, turn_x: float = 0.0, turn_y: float = 0.0,
+                       watchdog: float = 3.0, app_name: str = None, instance: str = None) -> str:
+    """
+    アバターの継続移動を開始し、すぐに戻ります。移動キーを押し続けたまま、steer で方向や旋回を変えられます。
+    watchdog 秒以上 steer / start_moving が呼ばれないと、安全のため自動で停止してキーを離します。
+    止めるときは stop_moving を呼びます。移動中に他の入力操作 (キー入力・ドラッグ・run_actions・focus_window など) や
+    cancel_actions を実行すると、移動を止めてキーを離してから実行します (撮影・ウィンドウ位置の取得は止めません)。
+
+    Args:
+        direction: 移動方向。"forward", "back", "left", "right" を "+" でつなげて指定 (例: "forward+left")。
+                   "" の場合は移動せず旋回だけ行います。
+        sprint: True の場合、ダッシュキーも押し続けます。
+        turn_x: 横方向の旋回速度 (ピクセル/秒, 右ドラッグ量)。正で右、負で左。
+        turn_y: 縦方向の旋回速度 (ピクセル/秒)。正で下、負で上。
+        watchdog: 自動停止までの無操作時間 (秒)。
+        app_name: アプリ名。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    if watchdog <= 0:
+        return "入力エラー: watchdog は正の値を指定してください"
+    try:
+        directions = parse_directions(direction)
+    except ValueError as e:
+        return f"入力エラー: {e}"
+    try:
+        focus_msg = await ACTION_QUEUES.submit(target_app, _start_moving_impl, target_app, directions, sprint,
+                                               (turn_x, turn_y), watchdog)
+    except (Overloaded, DeadlineExceeded) as e:
+        return _queue_error(e)
+    msg = f"移動開始: {_describe_locomotion(LOCOMOTION.state())}, {watchdog:g}秒操作が無いと自動停止"
+    return f"{focus_msg}\n{msg}" if focus_msg else msg
+
+@mcp.tool()
+@METRICS.tool
+async def steer(direction: str = None, sprint: bool = None, turn_x: float = None, turn_y: float = None) -> str:
+    """
+    継続移動中の方向・ダッシュ・旋回速度を変更し、すぐに戻ります。指定しなかった項目はそのままです。
+    何も指定せずに呼ぶと、状態を変えずに自動停止までの時間だけ延長します。
+
+    Args:
+        direction: 移動方向 (start_moving と同じ書式)。"" で移動キーをすべて離します。
+        sprint: ダッシュの有無。
+        turn_x: 横方向の旋回速度 (ピクセル/秒)。
+        turn_y: 縦方向の旋回速度 (ピクセル/秒)。
+    """
+    if LOCOMOTION is None or not LOCOMOTION.running:
+        reason = _LOCOMOTION_STOP_REASONS.get(LOCOMOTION.stop_reason) if LOCOMOTION else None
+        reason = f" ({reason})" if reason else ""
+        return f"移動中ではありません{reason}。start_moving で開始してください。"
+    try:
+        directions = parse_directions(direction) if direction is not None else None
+    except ValueError as e:
+        return f"入力エラー: {e}"
+    state = LOCOMOTION.state()
+    turn = None
+    if turn_x is not None or turn_y is not None:
+        tx, ty = state["turn"]
+        turn = (tx if turn_x is None else turn_x, ty if turn_y is None else turn_y)
+    LOCOMOTION.steer(directions, sprint, turn)
+    return f"変更しました: {_describe_locomotion(LOCOMOTION.state())}"
 
+@mcp.tool()
+@METRICS.tool
+async def stop_moving() -> str:
+    """継続移動を止め、押しているキー・マウスボタンをすべて離します。"""
+    if LOCOMOTION is None:
+        return "移動中ではありません。"
+    was_running = LOCOMOTION.running
+    await asyncio.to_thread(LOCOMOTION.stop)
+    state = LOCOMOTION.state()
+    if not was_running:
+        reason = _LOCOMOTION_STOP_REASONS.get(state["stop_reason"], "停止済み")
+        return f"移動中ではありません ({reason}): {_describe_locomotion(state)}"
+    return f"移動停止: {_describe_locomotion(state)}"
+
+def _window_origin(app_name: str):
+    """内部用: ウィンドウ左上の座標 (取得できなければ None)"""
+    bounds = _get_window_bounds_impl(app_name)
+    if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
+        return [int(bounds[0]), int(bounds[1])]
+    return None
+
+def _replay_session_impl(path: str, speed: float, start: float, end: float, app_name: str) -> str:
+    """内部用: 記録ファイルを mmap で開き、記録時とのウィンドウ位置の差を補正して再生する"""
+    focus_msg = _focus_window_impl(app_name)
+    with Session(path) as session:
+        offset = (0, 0)
+        recorded, current = session.meta.get("origin"), _window_origin(app_name)
+        if recorded and current:
+            offset = (current[0] - recorded[0], current[1] - recorded[1])
+        # イベント時刻は任意なので、ティック単位の丸めはせず記録どおりの期限で送る
+        stats, sent = replay(session, INPUT, _scheduler(skip_frames=False), speed, start, end, offset)
+        total = session.index_at(end) if end is not None else session.count
+        total -= session.index_at(start)
+    s = stats.summary()
+    head = "再生を中断" if stats.stopped else "再生完了"
+    msg = (f"{head}: {sent}/{total} イベント ({speed:g}倍速, {start:g}秒から), 実時間 {stats.elapsed:.2f}秒, "
+           f"遅れ p99 {s['jitter_p99'] * 1000:.1f}ms")
+    return f"{focus_msg}\n{msg}" if focus_msg else msg
+
+@mcp.tool()
+@METRICS.tool
+async def start_recording(name: str = None, app_name: str = None) -> str:
+    """
+    人が行うマウス・キーボード操作の記録を開始します (stop_recording で保存)。記録は replay_session で再生できます。
+    Mac の「入力監視」の許可が必要です。
+
+    Args:
+        name: 保存するファイル名 (拡張子不要)。省略時は日時から付けます。
+        app_name: 基準にするアプリ名。再生時はこのウィンドウの位置の差を補正します。
+    """
+    global RECORDING
+    if RECORDING is not None:
+        return f"既に記録中です: {RECORDING[2]}"
+    target_app = app_name if app_name else _default_app()
+    name = name or datetime.datetime.now().strftime("session_%Y%m%d_%H%M%S")
+    path = os.path.join(SESSION_DIR, os.path.basename(name) + ".clsn")
+    recorder = SessionRecorder(meta={"app": target_app, "origin": _window_origin(target_app),
+                                     "created": datetime.datetime.now().isoformat(timespec="seconds")})
+    try:
+        tap = QuartzEventTap(recorder)
+        await asyncio.to_thread(tap.start)
+    except Exception as e:
+        return f"エラー: 記録を開始できません: {e}"
+    RECORDING = (recorder, tap, path)
+    return f"記録を開始しました: {path}"
+
+@mcp.tool()
+@METRICS.tool
+async def stop_recording() -> str:
+    """操作の記録を止めてファイルに保存し、保存先とイベント数を返します。"""
+    global RECORDING
+    if RECORDING is None:
+        return "記録中ではありません。"
+    recorder, tap, path = RECORDING
+    RECORDING = None
+    await asyncio.to_thread(tap.stop)
+    try:
+        size = await asyncio.to_thread(recorder.save, path)
+    except OSError as e:
+        return f"エラー: 保存に失敗しました: {e}"
+    duration = recorder.columns["t"][-1] if len(recorder) else 0.0
+    warn = f"\n警告: 一部のイベントを記録できませんでした: {tap.error}" if tap.error else ""
+    return f"記録を保存しました: {path} ({len(recorder)} イベント, {duration:.1f}秒, {size} バイト){warn}"
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def replay_session(path: str, speed: float = 1.0, start: float = 0.0, end: float = None,
+                         app_name: str = None, instance: str = None, ctx: Context = None) -> str:
+    """
+    start_recording で記録した操作を、記録どおりのタイミングで再生します。cancel_actions で中断できます。
+
+    Args:
+        path: 記録ファイルのパス (stop_recording が返したもの)。
+        speed: 再生速度の倍率 (2.0 で2倍速)。
+        start: 記録の何秒目から再生するか (シーク)。
+        end: 記録の何秒目で再生を終えるか。省略時は最後まで。
+        app_name: 再生前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    if speed <= 0:
+        return "入力エラー: speed は正の値を指定してください"
+    if not os.path.exists(path):
+        return f"エラー: ファイルが見つかりません: {path}"
+    try:
+        return await _submit_action(target_app, ctx, _replay_session_impl, path, speed, start, end, target_app)
+    except ValueError as e:
+        return f"エラー: {e}"
+
+def _run_actions_impl(steps: list, app_name: str = None, stop_on_error: bool = True) -> str:
+    """内部用: run_actions の実装 (1回だけフォーカスして全ステップを実行)"""
+    target_app = app_name if app_name else _default_app()
+    focus_msg = _focus_window_impl(target_app)
+
+    control = current_control()
+    t0 = time.monotonic()
+    results = STEP_EXECUTOR.run(steps, target_app, stop_on_error,
+                                should_stop=control.should_stop, on_step=control.begin_step)
+    total = time.monotonic() - t0
+
+    succeeded = sum(1 for r in results if r.ok)
+    lines = [r.describe() for r in results]
+    summary = f"一括実行完了: {succeeded}/{len(steps)} ステップ成功, 合計 {total:.3f}秒"
+    if control.cancelled:
+        summary += f" (中断のため {len(steps) - len(results)} ステップ未実行)"
+    elif len(results) < len(steps):
+        summary += f" (エラーのため {len(steps) - len(results)} ステップ未実行)"
+    msg = "\n".join([summary] + lines)
+    return f"{focus_msg}\n{msg}" if focus_msg else msg
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def run_actions(steps: List[Step], stop_on_error: bool = True, app_name: str = None, instance: str = None,
+                      ctx: Context = None) -> str:
+    """
+    複数の入力操作を1回の呼び出しでまとめて実行します。フォーカスは最初に1回だけ行います。
+    実行前に全ステップを検証し、問題があれば何も実行せずにエラーを返します。
+    戻り値には各ステップの開始時刻・所要時間・エラーが含まれます。
+
+    Args:
+        steps: ステップのリスト。type ごとの項目:
+               {"type": "key", "keys": "w", "duration": 1.0}          キー入力 (press_game_keys と同じ書式)
+               {"type": "chord", "keys": ["shift", "w"], "duration": 1.0}  同時押し
+               {"type": "timeline", "events": [{"key": "w", "start": 0, "hold": 2.0}]}  キータイムライン
+               {"type": "drag", "x": 100, "y": 0, "button": "right", "duration": 0.5}  視点操作
+               {"type": "scroll", "amount": 10, "duration": 0.0, "profile": "linear"}  スクロール
+               {"type": "emote", "emote": "like", "wait": 1.0}        エモート
+               {"type": "comment", "text": "こんにちは"}              チャット送信
+               {"type": "wave", "side": "right", "duration": 2.0}     手を振る
+               {"type": "wait", "seconds": 0.5}                       待機
+        stop_on_error: True の場合、エラーが起きたステップで中断します。
+        app_name: 操作前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+
+    実行中は進捗を通知し、キャンセルまたは cancel_actions で途中のステップから中断できます。
+    """
+    errors = validate_steps(steps)
+    if errors:
+        return "検証エラー (何も実行していません):\n" + "\n".join(errors)
+    target_app = _target_app(app_name, instance)
+    return await _submit_action(target_app, ctx, _run_actions_impl, steps, target_app, stop_on_error)
+
+def _target_window(app_name: str):
+    """内部用: 撮影対象のウィンドウ (インスタンスならそのウィンドウ、アプリなら面積最大のもの)"""
+    try:
+        if app_name in INSTANCES:
+            return INSTANCES.window(app_name)
+        return WINDOW_REGISTRY.find(app_name)
+    except Exception:
+        return None
+
+def _remember_capture(app_name: str, capture: Capture) -> Capture:
+    """内部用: 撮影した範囲を覚えておく (バッファのフレームからも画面座標を求められるように)"""
+    CAPTURE_GEOMETRY[(app_name or "").lower()] = (capture.bounds, capture.image.size)
+    return capture
+
+def _is_front_window(window) -> bool:
+    """内部用: window が最前面の (他に隠れていない) ウィンドウか"""
+    try:
+        front = WINDOW_REGISTRY.frontmost()
+    except Exception:
+        return False
+    return front is not None and (front.pid, front.window_id) == (window.pid, window.window_id)
+
+def _grab_window(app_name: str):
+    """
+    内部用: フォーカスを変えずにウィンドウを撮る。撮れなければ None。
+    ウィンドウIDで撮れない場合の画面領域での撮影は、対象が最前面にある時だけ使う
+    (隠れていると前面にある別のウィンドウが写り、それを対象のフレームとして扱ってしまうため)。
+    """
+    window = _target_window(app_name)
+    if window is None:
+        return None
+    for source in (CAPTURE_SOURCE, FALLBACK_CAPTURE_SOURCE):
+        if source.needs_focus and not _is_front_window(window):
+            continue
+        try:
+            capture = source.capture(window)
+        except Exception:
+            capture = None
+        if capture is not None:
+            return _remember_capture(app_name, capture)
+    return None
+
+@METRICS.timed("capture")
+def _capture_impl(app_name: str = None, allow_focus: bool = False) -> Capture:
+    """
+    内部用: 対象アプリのウィンドウを撮影する。
+    通常はウィンドウIDで直接撮るのでフォーカスを変えない。撮れない場合 (非対応の環境・最小化中など) は
+    最前面にしてからウィンドウ領域 (ウィンドウが無ければ全画面) を撮る。
+    フォーカスの変更は入力操作と同じキューで行う必要があるので、allow_focus=False (観測用) の場合は
+    代わりに CaptureNeedsFocus を送出する (呼び出し側が入力キューで撮り直す)。
+    """
+    target_app = app_name if app_name else _default_app()
+    window = _target_window(target_app) if target_app else None
+    if window is not None and not CAPTURE_SOURCE.needs_focus:
+        try:
+            capture = CAPTURE_SOURCE.capture(window)
+        except Exception:
+            capture = None
+        if capture is not None:
+            return _remember_capture(target_app, capture)
+
+    # アプリをアクティブにする (最前面になるまでの待機はフォーカス管理側で行う)
+    if target_app:
+        if not allow_focus:
+            raise CaptureNeedsFocus(f"'{target_app}' はアクティブにしないと撮影できません")
+        _focus_window_impl(target_app)
+        bounds = _get_window_bounds_impl(target_app)
+        # boundsは (x, y, w, h) のタプルであることを期待
+        if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
+            capture = FALLBACK_CAPTURE_SOURCE.capture(WindowInfo(0, 0, target_app, tuple(bounds)))
+            if capture is not None:
+                return _remember_capture(target_app, capture)
+
+    # ウィンドウが無ければ全画面
+    gui = load_pyautogui()
+    image = gui.screenshot()
+    width, height = gui.size()
+    return Capture(image, (0, 0, width, height), image.width / width)
+
+def _capture_screenshot_impl(app_name: str = None, allow_focus: bool = False):
+    """内部用: 対象アプリのウィンドウ (無ければ全画面) を撮影して画像を返す"""
+    return _capture_impl(app_name, allow_focus).image
+
+async def _run_observation(target_app: str, func, *args):
+    """
+    内部用: 観測 (func(target_app, *args, allow_focus=...)) を入力操作を待たずに実行する。
+    フォーカスしないと撮れなかった場合は、入力キューに並べてフォーカスを許して実行し直す
+    (他のクライアントの入力中にフォーカスを奪わないように)
+    """
+    try:
+        return await ACTION_QUEUES.run_readonly(func, target_app, *args)
+    except CaptureNeedsFocus:
+        return await ACTION_QUEUES.submit(target_app, func, target_app, *args, allow_focus=True)
+
+@METRICS.timed("save")
+def _save_screenshot(screenshot) -> str:
+    """内部用: 画像を一時ディレクトリにPNGで保存してパスを返す"""
+    temp_dir = tempfile.gettempdir()
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"mac_screenshot_{timestamp}.png"
+    filepath = os.path.join(temp_dir, filename)
+
+    screenshot.save(filepath)
+
+    return filepath
+
+def _buffered_frame(target_app: str, after: float = None, after_last_action: bool = False):
+    """内部用: バックグラウンド撮影中なら、バッファから条件に合うフレームを返す (無ければ None)"""
+    capturer = CAPTURERS.get((target_app or "").lower())
+    if capturer is None or not capturer.running:
+        return None
+    since = after
+    if after_last_action:
+        since = max(since or 0.0, ACTION_QUEUES.last_completed.get(target_app.lower(), 0.0))
+    if since is None:
+        return capturer.buffer.latest()
+    # 指定時刻より後のフレームが撮れるまで少しだけ待つ
+    return capturer.buffer.wait_for_frame_after(since, FRAME_WAIT_TIMEOUT)
+
+@METRICS.timed("encode")
+def _encode_image(img, fmt: str, max_dimension: int = None, quality: int = 80):
+    """内部用: 画像をメモリ上でエンコードする (計測付き)"""
+    return encode_image(img, fmt, max_dimension, quality)
+
+async def _shared_capture(target_app: str):
+    """内部用: 撮影する (同時に要求した他のクライアントと1回の撮影を共有し、直後なら前回の画像を返す)"""
+    try:
+        return await ACTION_QUEUES.run_shared(("capture", target_app.lower()), target_app, _capture_screenshot_impl,
+                                              target_app, max_age=OBSERVATION_MAX_AGE)
+    except CaptureNeedsFocus:
+        return await ACTION_QUEUES.submit(target_app, _capture_screenshot_impl, target_app, allow_focus=True)
+
+@mcp.tool(structured_output=False)
+@METRICS.tool
+@_input_errors
+async def take_screenshot(app_name: str = None, return_image: bool = False, max_dimension: int = None,
+                          format: str = "jpeg", quality: int = 80,
+                          after: float = None, after_last_action: bool = False, instance: str = None):
+    """
+    現在の画面をスクリーンショット撮影し、一時ファイルのパスを返します。
+    アプリ名を指定する（またはデフォルトアプリがある）場合、そのウィンドウだけを撮影します。
+    ウィンドウを直接撮るので、アクティブにする必要はなく、他のウィンドウに隠れていても撮れます
+    (撮れない環境では従来通りアクティブにしてから画面の領域を撮影します)。
+    start_capture でバックグラウンド撮影中の場合は、撮影済みの最新フレームを待たずに返します。
+
+    Args:
+        app_name: 撮影するアプリ名。
+        return_image: True の場合、ファイルに保存せず画像そのものを返します。
+        max_dimension: return_image 時、長辺をこのピクセル数以下に縮小します (例: 1280)。
+        format: return_image 時の画像形式 ("png", "jpeg", "webp")。
+        quality: JPEG / WebP の画質 (1-100)。
+        after: バックグラウンド撮影中のみ。この時刻 (UNIX秒) より後に撮影された最初のフレームを返します。
+        after_last_action: バックグラウンド撮影中のみ。最後の入力操作が終わった後の最初のフレームを返します。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    try:
+        screenshot = None
+        note = ""
+        frame = await asyncio.to_thread(_buffered_frame, target_app, after, after_last_action)
+        if frame is not None:
+            screenshot = frame.image
+            note = f" (バッファ #{frame.seq}, {time.time() - frame.timestamp:.3f}秒前)"
+        else:
+            screenshot = await _shared_capture(target_app)
+        # screen_changed / wait_for_change の比較基準にする
+        CHANGE_BASELINES[target_app.lower()] = screenshot
+
+        if not return_image:
+            return await asyncio.to_thread(_save_screenshot, screenshot)
+
+        # エンコードは重いのでワーカースレッドで行う
+        encoded = await asyncio.to_thread(_encode_image, screenshot, format, max_dimension, quality)
+    except (Overloaded, DeadlineExceeded) as e:
+        return _queue_error(e)
     except Exception as e:
         return f"撮影エラー: {str(e)}"
+    return [f"撮影完了: {encoded.describe()}{note}", Image(data=encoded.data, format=encoded.format)]
+
+def _window_capture_source(app_name: str):
+    """内部用: 対象アプリのウィンドウを撮影する関数を返す (フォーカスは変えない)"""
+    def source():
+        capture = _grab_window(app_name)
+        return capture.image if capture is not None else None
+    return source
+
+@mcp.tool()
+@METRICS.tool
+async def start_capture(app_name: str = None, fps: float = 5.0, max_frames: int = 30, max_mb: int = 256) -> str:
+    """
+    対象ウィンドウのバックグラウンド撮影を開始します。
+    撮影中は take_screenshot がバッファ済みのフレームを即座に返します。
+
+    Args:
+        app_name: 撮影するアプリ名。
+        fps: 1秒あたりの撮影回数。
+        max_frames: バッファに保持する最大フレーム数。
+        max_mb: バッファの最大メモリ量 (MB)。
+    """
+    target_app = app_name if app_name else _default_app()
+    if fps <= 0 or max_frames <= 0 or max_mb <= 0:
+        return "エラー: fps, max_frames, max_mb は正の値を指定してください"
+    key = target_app.lower()
+    old = CAPTURERS.pop(key, None)
+    if old is not None:
+        await asyncio.to_thread(old.stop)
+    capturer = BackgroundCapturer(
+        _window_capture_source(target_app), fps=fps,
+        buffer=FrameRingBuffer(max_frames=max_frames, max_bytes=max_mb * 1024 * 1024),
+        name=key,
+    )
+    capturer.start()
+    CAPTURERS[key] = capturer
+    return f"バックグラウンド撮影開始: '{target_app}' {fps}fps, 最大{max_frames}フレーム/{max_mb}MB"
+
+@mcp.tool()
+@METRICS.tool
+async def stop_capture(app_name: str = None) -> str:
+    """バックグラウンド撮影を停止し、撮影統計 (撮影数・取りこぼし数など) を返します。"""
+    target_app = app_name if app_name else _default_app()
+    capturer = CAPTURERS.pop(target_app.lower(), None)
+    if capturer is None:
+        return f"'{target_app}' のバックグラウンド撮影は行われていません"
+    await asyncio.to_thread(capturer.stop)
+    st = capturer.stats()
+    return (f"バックグラウンド撮影停止: 撮影 {st['captured']}枚, 取りこぼし {st['dropped']}回, "
+            f"撮影できず {st['skipped']}回, 破棄 {st['evicted']}枚, エラー {st['errors']}回, "
+            f"平均撮影時間 {st['capture_ms']:.1f}ms")
+
+
+def _observe_frame(target_app: str, newer_than: float = None, allow_focus: bool = False):
+    """内部用: 比較用の現在フレームを (撮影時刻, 画像) で返す。バックグラウンド撮影中はバッファを使う"""
+    capturer = CAPTURERS.get(target_app.lower())
+    if capturer is not None and capturer.running:
+        frame = (capturer.buffer.latest() if newer_than is None
+                 else capturer.buffer.wait_for_frame_after(newer_than, FRAME_WAIT_TIMEOUT))
+        if frame is not None:
+            return frame.timestamp, frame.image
+    return time.time(), _capture_screenshot_impl(target_app, allow_focus)
+
+def _change_result(diff, image, return_regions: bool, max_dimension: int, header: str):
+    """内部用: 比較結果のテキストと、必要なら変化領域の切り出し画像を返す"""
+    from frame_diff import crop_regions
+    text = f"{header}: {diff.describe()}"
+    if not return_regions or not diff.boxes:
+        return text
+    contents = [text]
+    for crop, box in zip(crop_regions(image, diff.boxes), diff.boxes):
+        encoded = _encode_image(crop, "jpeg", max_dimension)
+        contents.append(f"領域 {box}: {encoded.describe()}")
+        contents.append(Image(data=encoded.data, format=encoded.format))
+    return contents
+
+def _screen_changed_impl(target_app: str, threshold: float, return_regions: bool, max_dimension: int,
+                        allow_focus: bool = False):
+    """内部用: screen_changed の実装"""
+    from frame_diff import diff_frames
+    key = target_app.lower()
+    _, image = _observe_frame(target_app, allow_focus=allow_focus)
+    baseline = CHANGE_BASELINES.get(key)
+    CHANGE_BASELINES[key] = image
+    if baseline is None:
+        return "比較基準が無いため、現在の画面を基準として記録しました"
+    diff = diff_frames(baseline, image)
+    header = "変化あり" if diff.changed(threshold) else "変化なし"
+    return _change_result(diff, image, return_regions, max_dimension, header)
+
+def _wait_for_change_impl(target_app: str, timeout: float, threshold: float, poll_interval: float,
+                          return_regions: bool, max_dimension: int, allow_focus: bool = False):
+    """内部用: wait_for_change の実装"""
+    from frame_diff import diff_frames
+    key = target_app.lower()
+    t0 = time.monotonic()
+    timestamp, image = _observe_frame(target_app, allow_focus=allow_focus)
+    baseline = CHANGE_BASELINES.get(key)
+    if baseline is None:
+        # 基準が無ければ今の画面を基準にして、ここからの変化を待つ
+        baseline = image
+
+    while True:
+        diff = diff_frames(baseline, image)
+        elapsed = time.monotonic() - t0
+        if diff.changed(threshold):
+            CHANGE_BASELINES[key] = image
+            return _change_result(diff, image, return_regions, max_dimension, f"変化検出 ({elapsed:.2f}秒)")
+        if elapsed >= timeout:
+            CHANGE_BASELINES[key] = image
+            return f"タイムアウト ({elapsed:.2f}秒): {diff.describe()}"
+        capturer = CAPTURERS.get(key)
+        if capturer is None or not capturer.running:
+            time.sleep(min(poll_interval, max(0.0, timeout - elapsed)))
+        timestamp, image = _observe_frame(target_app, newer_than=timestamp, allow_focus=allow_focus)
+
+@mcp.tool(structured_output=False)
+@METRICS.tool
+@_input_errors
+async def screen_changed(app_name: str = None, threshold: float = 0.01, return_regions: bool = False,
+                         max_dimension: int = 512, instance: str = None):
+    """
+    前回の観測 (take_screenshot / screen_changed / wait_for_change) から画面が変化したかを返します。
+    画像全体を取り直す代わりに、変化スコアと変化した領域 (x, y, 幅, 高さ) だけを返します。
+
+    Args:
+        app_name: 対象アプリ名。
+        threshold: 変化ありとみなすスコア (変化したタイルの割合, 0.0-1.0)。
+        return_regions: True の場合、変化した領域だけを切り出した画像も返します。
+        max_dimension: 切り出し画像の長辺の最大ピクセル数。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    try:
+        return await _run_observation(target_app, _screen_changed_impl, threshold, return_regions, max_dimension)
+    except (Overloaded, DeadlineExceeded) as e:
+        return _queue_error(e)
+    except Exception as e:
+        return f"比較エラー: {str(e)}"
+
+@mcp.tool(structured_output=False)
+@METRICS.tool
+@_input_errors
+async def wait_for_change(app_name: str = None, timeout: float = 5.0, threshold: float = 0.01,
+                          poll_interval: float = 0.2, return_regions: bool = False, max_dimension: int = 512,
+                          instance: str = None):
+    """
+    画面が変化するまで待ちます (チャットが開く、テレポート完了、カメラが止まる等の確認用)。
+    前回の観測からの変化スコアが threshold 以上になった時点で、スコアと変化領域を返します。
+
+    Args:
+        app_name: 対象アプリ名。
+        timeout: 最大待ち時間(秒)。
+        threshold: 変化ありとみなすスコア (変化したタイルの割合, 0.0-1.0)。
+        poll_interval: バックグラウンド撮影していない場合の撮影間隔(秒)。
+        return_regions: True の場合、変化した領域だけを切り出した画像も返します。
+        max_dimension: 切り出し画像の長辺の最大ピクセル数。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    try:
+        return await _run_observation(target_app, _wait_for_change_impl, timeout, threshold,
+                                      poll_interval, return_regions, max_dimension)
+    except (Overloaded, DeadlineExceeded) as e:
+        return _queue_error(e)
+    except Exception as e:
+        return f"比較エラー: {str(e)}"
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def get_window_bounds(app_name: str = None, instance: str = None) -> str:
+    """
+    指定したアプリのウィンドウ位置とサイズ (x, y, 幅, 高さ) を返します。
+    入力操作の実行中でも待たずに応答します。
+    """
+    target_app = _target_app(app_name, instance)
+    try:
+        bounds = await ACTION_QUEUES.run_shared(("bounds", target_app.lower()), target_app, _get_window_bounds_impl,
+                                                target_app, max_age=OBSERVATION_MAX_AGE)
+    except Overloaded as e:
+        return _queue_error(e)
+    if isinstance(bounds, (tuple, list)) and len(bounds) == 4:
+        bx, by, bw, bh = bounds
+        return f"ウィンドウ位置: x={bx}, y={by}, w={bw}, h={bh}"
+    return f"取得エラー: {bounds}"
+
+def _template_path(template: str) -> str:
+    """内部用: テンプレート名 (TEMPLATE_DIR 内、拡張子省略可) またはパスを画像ファイルのパスにする"""
+    if os.path.isfile(template):
+        return template
+    base = os.path.join(TEMPLATE_DIR, template)
+    for path in [base] + [base + ext for ext in TEMPLATE_EXTS]:
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError(f"テンプレート '{template}' が見つかりません "
+                            f"({TEMPLATE_DIR} に画像を置くか、パスを指定してください)")
+
+def _to_screen(app_name: str, image_size, point):
+    """内部用: 撮影した画像の画素座標を画面座標 (ポイント) にする (Retinaでは画素がポイントの倍)"""
+    geometry = CAPTURE_GEOMETRY.get(app_name.lower())
+    if geometry is not None and tuple(geometry[1]) == tuple(image_size):
+        bounds = geometry[0]
+    else:
+        bounds = _get_window_bounds_impl(app_name)
+    if not (isinstance(bounds, (tuple, list)) and len(bounds) == 4):
+        return point
+    bx, by, bw, bh = bounds
+    iw, ih = image_size
+    return int(bx + point[0] * bw / iw), int(by + point[1] * bh / ih)
+
+def _locator():
+    """内部用: テンプレート検索器 (初回呼び出し時に作る)"""
+    global LOCATOR
+    if LOCATOR is None:
+        from locator import Locator
+        LOCATOR = Locator()
+    return LOCATOR
+
+@METRICS.timed("locate")
+def _locate_impl(app_name: str, template: str, threshold: float, frame_image=None):
+    """内部用: 画面 (frame_image 省略時は撮影) からテンプレートを探し、(一致, 画面座標の中心, 画像サイズ) を返す"""
+    from locator import Frame
+    templ = _locator().template(_template_path(template))
+    if frame_image is None:
+        frame_image = _capture_screenshot_impl(app_name)
+    match = _locator().locate(Frame(frame_image), templ, threshold)
+    if match is None:
+        raise ValueError(f"テンプレート ({templ.size[0]}x{templ.size[1]}) が画面より大きいため探せません")
+    return match, _to_screen(app_name, frame_image.size, match.center), frame_image.size
+
+def _describe_match(template: str, match, center, threshold: float) -> str:
+    """内部用: 探索結果を文字列にする"""
+    how = "前回の位置の周辺" if match.cached else "画面全体"
+    timing = f"一致度 {match.score:.3f}, 探索 {match.elapsed * 1000:.1f}ms ({how})"
+    if match.score < threshold:
+        return f"'{template}' は見つかりませんでした (しきい値 {threshold:g} 未満, 最も近い候補の{timing})"
+    x, y, w, h = match.box
+    return (f"'{template}' が見つかりました: 画面座標 ({center[0]}, {center[1]}), "
+            f"画像内の領域 x={x}, y={y}, w={w}, h={h}, {timing}")
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def find_on_screen(template: str, threshold: float = 0.8, app_name: str = None, instance: str = None) -> str:
+    """
+    参照画像 (ボタン・アイコン・チャット欄など) を画面内から探し、中心の画面座標と一致度を返します。
+    スクリーンショットから座標を推測する代わりに使えます。前回見つかった位置の周辺から先に探すので、2回目以降は速くなります。
+    バックグラウンド撮影中 (start_capture) は最新のフレームから探します。
+
+    Args:
+        template: 参照画像の名前 (テンプレートフォルダ内のファイル名、拡張子省略可) または画像ファイルのパス。
+                  save_template で画面の一部を保存して作れます。
+        threshold: 見つかったとみなす一致度 (0.0-1.0)。
+        app_name: 対象アプリ名。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    try:
+        buffered = await asyncio.to_thread(_buffered_frame, target_app)
+        image = buffered.image if buffered is not None else await _shared_capture(target_app)
+        match, center, _ = await ACTION_QUEUES.run_readonly(_locate_impl, target_app, template, threshold, image)
+    except (OSError, ValueError) as e:
+        return f"エラー: {e}"
+    except (Overloaded, DeadlineExceeded) as e:
+        return _queue_error(e)
+    return _describe_match(template, match, center, threshold)
+
+def _click_image_impl(app_name: str, template: str, threshold: float, button: str, clicks: int,
+                      offset_x: int, offset_y: int) -> str:
+    """内部用: フォーカスして撮影し、テンプレートの中心 (+オフセット) をクリックする"""
+    focus_msg = _focus_window_impl(app_name)
+    # 入力キューの中なので、ウィンドウIDで撮れなければアクティブにして撮ってよい
+    match, center, _ = _locate_impl(app_name, template, threshold,
+                                    _capture_screenshot_impl(app_name, allow_focus=True))
+    msg = _describe_match(template, match, center, threshold)
+    if match.score >= threshold:
+        x, y = center[0] + offset_x, center[1] + offset_y
+        INPUT.mouse_move(x, y)
+        for _ in range(clicks):
+            INPUT.mouse_button(button, True, x, y)
+            INPUT.mouse_button(button, False, x, y)
+        msg += f"\n{button} ボタンで ({x}, {y}) を {clicks} 回クリックしました。"
+    return f"{focus_msg}\n{msg}" if focus_msg else msg
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def click_image(template: str, button: str = "left", clicks: int = 1, threshold: float = 0.8,
+                      offset_x: int = 0, offset_y: int = 0, app_name: str = None, instance: str = None,
+                      ctx: Context = None) -> str:
+    """
+    参照画像を画面内から探してクリックします。見つからない場合はクリックせず、最も近い候補の一致度を返します。
+
+    Args:
+        template: 参照画像の名前またはパス (find_on_screen と同じ)。
+        button: クリックするボタン ('left', 'right', 'middle')。
+        clicks: クリック回数 (2 でダブルクリック)。
+        threshold: 見つかったとみなす一致度 (0.0-1.0)。
+        offset_x: 参照画像の中心からずらす量 (画面座標, 横)。
+        offset_y: 参照画像の中心からずらす量 (画面座標, 縦)。
+        app_name: 操作前にアクティブにするアプリ名。指定しない場合は前回のfocus_windowまたはデフォルト("cluster")を使用。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    if button not in ("left", "right", "middle"):
+        return "入力エラー: button は 'left', 'right', 'middle' のいずれかを指定してください"
+    try:
+        return await _submit_action(target_app, ctx, _click_image_impl, target_app, template, threshold, button,
+                                    max(1, clicks), offset_x, offset_y)
+    except (OSError, ValueError) as e:
+        return f"エラー: {e}"
+
+@mcp.tool()
+@METRICS.tool
+@_input_errors
+async def save_template(name: str, x: int, y: int, width: int, height: int, app_name: str = None,
+                        instance: str = None) -> str:
+    """
+    現在の画面の一部を参照画像として保存し、find_on_screen / click_image で名前で使えるようにします。
+
+    Args:
+        name: 参照画像の名前 (例: "ok_button")。
+        x: 切り出す領域の左上X (take_screenshot の画像 (縮小なし) の画素座標)。
+        y: 切り出す領域の左上Y。
+        width: 幅 (画素)。
+        height: 高さ (画素)。
+        app_name: 対象アプリ名。
+        instance: 操作するクライアントのインスタンス名 (list_instances で確認)。指定した場合は app_name より優先します。
+    """
+    target_app = _target_app(app_name, instance)
+    if width <= 0 or height <= 0:
+        return "入力エラー: width, height は正の値を指定してください"
+    try:
+        screenshot = await _run_observation(target_app, _capture_screenshot_impl)
+        os.makedirs(TEMPLATE_DIR, exist_ok=True)
+        path = os.path.join(TEMPLATE_DIR, os.path.basename(name) + ".png")
+        await asyncio.to_thread(screenshot.crop((x, y, x + width, y + height)).save, path)
+    except Exception as e:
+        return f"保存エラー: {e}"
+    _locator().forget(path)
+    return f"参照画像を保存しました: {path} ({width}x{height})"
+
+def _describe_latency(name: str, summary: dict, rejected: int = 0) -> str:
+    """内部用: キューの集計1行分"""
+    return (f"  {name}: 完了 {summary['completed']} 件 (失敗 {summary['failed']}), "
+            f"待ち p50 {summary['wait_p50'] * 1000:.0f}ms / p99 {summary['wait_p99'] * 1000:.0f}ms, "
+            f"応答 p99 {summary['latency_p99'] * 1000:.0f}ms, 待ち {summary['depth']} 件"
+            + (f", 拒否 {rejected} 件" if rejected else ""))
+
+@mcp.tool()
+@METRICS.tool
+async def get_queue_stats() -> str:
+    """
+    入力アクションのキューの状況を返します。複数のクライアントから使っている場合の、クライアントごとの
+    待ち時間 (p50/p99)、混雑で断った件数、期限切れの件数、撮影結果を共有・使い回した回数などです。
+    """
+    st = ACTION_QUEUES.stats()
+    adm = st["admission"]
+    lines = [
+        f"要求元: {_request_info()[0]}",
+        f"受け付け中 {adm['pending']} 件 (上限 全体 {adm['max_pending']} / クライアントごと {adm['max_per_client']}), "
+        f"受け付け {adm['admitted']} 件, 拒否 {adm['rejected']} 件, 期限切れ {st['expired']} 件",
+        "クライアント別:",
+    ]
+    lines += [_describe_latency(c, s, adm["rejected_by_client"].get(c, 0)) for c, s in st["clients"].items()]
+    lines.append("アプリ別:")
+    lines += [_describe_latency(a, s) for a, s in st["apps"].items()]
+    shared = st["shared"]
+    lines.append(f"観測の共有: 実行 {shared['loads']} 回, 実行中の結果を共有 {shared['joins']} 回, "
+                 f"直前の結果を使用 {shared['hits']} 回 ({OBSERVATION_MAX_AGE:g}秒以内)")
+    lines.append(f"キューの切り替え {st['switches']} 回 / まとめて実行 {st['batches']} 回")
+    return "\n".join(lines)
+
+@mcp.tool()
+@METRICS.tool
+async def get_metrics(reset: bool = False, enabled: bool = None) -> str:
+    """
+    ツールごと・処理段階ごと (applescript, focus, window_bounds, mouse_event, key_event, clipboard,
+    capture, encode, save など) の所要時間の分布 (p50/p95/p99/最大) を返します。
+
+    Args:
+        reset: True の場合、表示後に計測結果を消去します。
+        enabled: True / False で計測を有効 / 無効にします。省略時は変更しません。
+    """
+    text = METRICS.format()
+    if reset:
+        METRICS.reset()
+        text += "\n(計測結果を消去しました)"
+    if enabled is not None:
+        METRICS.enabled = enabled
+        text += f"\n(計測を{'有効' if enabled else '無効'}にしました)"
+    return text
+
+@mcp.resource("metrics://latency", mime_type="application/json")
+def metrics_resource() -> str:
+    """ツール・処理段階ごとの所要時間の分布 (秒単位, JSON)"""
+    return json.dumps(METRICS.snapshot(), ensure_ascii=False)
+
+
+
+# 起動直後の先読み: MCP の初期化 (initialized 通知) が済んでから、重いモジュールと AppleScript ワーカーを
+# バックグラウンドで用意する。ハンドシェイクは待たせず、最初のツール呼び出しも読み込みを待たない
+# CLUSTER_MCP_PREWARM=0 で無効 (それぞれ最初に使う時点で読み込む)
+PREWARM = os.environ.get("CLUSTER_MCP_PREWARM", "1") != "0"
+# 項目 -> 所要秒数 (失敗した場合はエラー文字列)
+PREWARM_RESULTS = {}
+
+def _prewarm_encoder():
+    """内部用: JPEG / PNG のエンコーダを読み込んでおく"""
+    from PIL import Image as PILImage
+    img = PILImage.new("RGB", (16, 16))
+    for fmt in ("jpeg", "png"):
+        _encode_image(img, fmt)
+
+def _prewarm_numpy():
+    """内部用: 経路計算・画像比較・テンプレート検索のモジュールを読み込んでおく"""
+    import frame_diff, trajectory  # noqa: F401
+    _locator()
+
+def _prewarm():
+    """内部用: 先読みの本体 (失敗しても最初に使う時点で読み込み直すので、結果を記録するだけ)"""
+    steps = (
+        ("input", INPUT.prewarm),
+        ("windows", lambda: WINDOW_REGISTRY.find_windows(CURRENT_APP_NAME)),
+        ("encoder", _prewarm_encoder),
+        ("numpy", _prewarm_numpy),
+        ("applescript", get_default_pool().warm),
+    )
+    for name, step in steps:
+        t0 = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            PREWARM_RESULTS[name] = f"エラー: {e}"
+            continue
+        elapsed = time.perf_counter() - t0
+        PREWARM_RESULTS[name] = elapsed
+        METRICS.record("(startup)", f"prewarm_{name}", elapsed)
+
+def start_prewarm():
+    """先読みスレッドを起動する (2回目以降は何もしない)"""
+    global _PREWARM_THREAD
+    if _PREWARM_THREAD is None:
+        _PREWARM_THREAD = threading.Thread(target=_prewarm, name="prewarm", daemon=True)
+        _PREWARM_THREAD.start()
+    return _PREWARM_THREAD
+
+_PREWARM_THREAD = None
+
+async def _on_initialized(notification):
+    if PREWARM:
+        start_prewarm()
+
+mcp._mcp_server.notification_handlers[types.InitializedNotification] = _on_initialized
+
+
+# 通信方式: "stdio" (既定、1クライアント) または "http" (Streamable HTTP、複数のクライアントで1台を共有する)
+TRANSPORT = os.environ.get("CLUSTER_MCP_TRANSPORT", "stdio")
+mcp.settings.host = os.environ.get("CLUSTER_MCP_HOST", mcp.settings.host)
+mcp.settings.port = int(os.environ.get("CLUSTER_MCP_PORT", mcp.settings.port))
+
 
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    if TRANSPORT in ("http", "streamable-http"):
+        mcp.run("streamable-http")
+    else:
+        mcp.run()
\ No newline at end of file
@@ -0,0 +1,227 @@
+import bisect
+import contextvars
+import functools
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 実行中のツール名 (スレッドへは AppActionQueues / asyncio.to_thread がコンテキストごと引き継ぐ)
+CURRENT_TOOL = contextvars.ContextVar("current_tool", default="(background)")
+
+# 1µs から約2分までを 5% 刻みの対数バケットに分ける
+_BOUNDS: List[float] = [1e-6 * (1.05 ** i) for i in range(int(math.log(120 / 1e-6, 1.05)) + 2)]
+
+
+class Histogram:
+    """対数バケットのヒストグラム。値を保持しないので記録は O(log バケット数)、メモリは一定"""
+
+    def __init__(self):
+        self.counts = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """q (0-100) パーセンタイル (バケット内は線形補間で近似、最大値を超えない)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(q / 100.0 * self.count)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank:
+                if i >= len(_BOUNDS):
+                    return self.max
+                lower = _BOUNDS[i - 1] if i > 0 else 0.0
+                value = lower + (_BOUNDS[i] - lower) * (rank - seen) / c
+                return min(value, self.max)
+            seen += c
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class _Span:
+    __slots__ = ("_metrics", "_phase", "_t0")
+
+    def __init__(self, metrics: "Metrics", phase: str):
+        self._metrics = metrics
+        self._phase = phase
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.record(CURRENT_TOOL.get(), self._phase, time.perf_counter() - self._t0)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """
+    (ツール, フェーズ) ごとの所要時間ヒストグラム。
+    enabled=False の間は span() が共有の空オブジェクトを返すだけなので、計測のコストはほぼ無い。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._hist: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    def span(self, phase: str):
+        """with metrics.span("phase"): ... の区間を計測する"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, phase)
+
+    def timed(self, phase: str):
+        """関数全体を span で計測するデコレータ"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, phase):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def tool(self, func):
+        """MCPツール (async関数) 用デコレータ: ツール名を設定し、全体を "total" として計測する"""
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = CURRENT_TOOL.set(name)
+            try:
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                with _Span(self, "total"):
+                    return await func(*args, **kwargs)
+            finally:
+                CURRENT_TOOL.reset(token)
+        return wrapper
+
+    def record(self, tool: str, phase: str, seconds: float):
+        key = (tool, phase)
+        with self._lock:
+            hist = self._hist.get(key)
+            if hist is None:
+                hist = self._hist[key] = Histogram()
+            hist.record(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> dict:
+        """{ツール: {フェーズ: 集計}} (秒単位)"""
+        with self._lock:
+            items = [(k, h.summary()) for k, h in self._hist.items()]
+        result: Dict[str, dict] = {}
+        for (tool, phase), summary in sorted(items):
+            result.setdefault(tool, {})[phase] = summary
+        return result
+
+    def format(self) -> str:
+        snap = self.snapshot()
+        if not snap:
+            return "計測データはまだありません。" if self.enabled else "計測は無効です。"
+        lines = [f"計測 ({'有効' if self.enabled else '無効'}, {time.time() - self.started_at:.0f}秒分):"]
+        for tool, phases in snap.items():
+            lines.append(f"{tool}:")
+            for phase, s in phases.items():
+                lines.append(f"  {phase:<14} n={s['count']:<5} p50 {s['p50'] * 1000:8.2f}ms  "
+                             f"p95 {s['p95'] * 1000:8.2f}ms  p99 {s['p99'] * 1000:8.2f}ms  "
+                             f"max {s['max'] * 1000:8.2f}ms")
+        return "\n".join(lines)
+
+    def start_dump(self, path: str, interval: float = 60.0):
+        """interval 秒ごとにスナップショットを JSONL として path に追記するスレッドを開始する"""
+        if self._dump_thread is not None:
+            return
+        self._dump_stop.clear()
+
+        def run():
+            while not self._dump_stop.wait(interval):
+                self.dump(path)
+
+        self._dump_thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_dump(self):
+        self._dump_stop.set()
+        self._dump_thread = None
+
+    def dump(self, path: str):
+        line = json.dumps({"time": time.time(), "metrics": self.snapshot()}, ensure_ascii=False)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+_default: Optional[Metrics] = None
+
+
+def get_default_metrics() -> Metrics:
+    """プロセス共通の計測器 (環境変数 CLUSTER_MCP_METRICS=0 で無効、CLUSTER_MCP_METRICS_DUMP でJSONL出力)"""
+    global _default
+    if _default is None:
+        _default = Metrics(enabled=os.environ.get("CLUSTER_MCP_METRICS", "1") != "0")
+        path = os.environ.get("CLUSTER_MCP_METRICS_DUMP")
+        if path:
+            _default.start_dump(path, float(os.environ.get("CLUSTER_MCP_METRICS_DUMP_INTERVAL", "60")))
+    return _default
+
+
+def span(phase: str):
+    return get_default_metrics().span(phase)
+
+
+def _overhead(n: int = 200000):
+    """span 1回あたりのコスト (有効/無効) を表示する"""
+    m = Metrics()
+    for enabled in (True, False):
+        m.enabled = enabled
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with m.span("x"):
+                pass
+        print(f"enabled={enabled}: {(time.perf_counter() - t0) / n * 1e9:.0f} ns/span")
+
+
+if __name__ == "__main__":
+    _overhead()
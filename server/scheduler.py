@@ -0,0 +1,208 @@
+import math
+import time
+from typing import Callable, List, Optional, Tuple
+
+from action_queue import percentile
+
+# 期限直前のこの秒数だけは sleep(0) で詰める (それより長い待ちは実際に眠ってCPUを使わない)
+SPIN_SLICE = 0.001
+
+
+class ScheduleStats:
+    """1回分のスケジュール実行の記録 (ジッタ・オーバーラン・フレームスキップ)"""
+
+    def __init__(self, planned: float, ticks_planned: int, period: float):
+        self.planned = planned
+        self.ticks_planned = ticks_planned
+        self.period = period
+        self.ticks = 0
+        # 実行した最後のティック番号 + 1 (飛ばしたティックも進んだ分に含む)
+        self.reached = 0
+        self.stopped = False
+        self.skipped = 0
+        self.overruns = 0
+        self.elapsed = 0.0
+        # 各ティックの遅れ (実際の実行時刻 - 期限)
+        self.lateness: List[float] = []
+
+    @property
+    def fraction(self) -> float:
+        """予定のうち実行し終えた割合"""
+        return self.reached / self.ticks_planned if self.ticks_planned else 1.0
+
+    def summary(self) -> dict:
+        return {
+            "planned": self.planned,
+            "elapsed": self.elapsed,
+            "ticks": self.ticks,
+            "ticks_planned": self.ticks_planned,
+            "skipped": self.skipped,
+            "overruns": self.overruns,
+            "stopped": self.stopped,
+            "fraction": self.fraction,
+            "jitter_mean": sum(self.lateness) / len(self.lateness) if self.lateness else 0.0,
+            "jitter_p99": percentile(self.lateness, 99),
+            "jitter_max": max(self.lateness) if self.lateness else 0.0,
+        }
+
+
+class DeadlineScheduler:
+    """
+    単調増加クロックの絶対期限 (t0 + (i+1) * period) に合わせてティックを実行する。
+    sleep の寝過ごしは次の期限で吸収されるので、処理時間や遅れが積み上がらない。
+    1フレーム以上遅れた場合は溜まったティックを飛ばし、最新のティックだけを実行する
+    (コールバックは進捗から目標値を計算するので、飛ばしても移動量は失われない)。
+
+    on_tick(i, n): i は 0 始まりのティック番号、n は総ティック数。最後のティックは必ず実行される。
+    should_stop() が True を返すと次のティックを実行せずに終わる (stats.stopped)。
+    on_progress(done, total) はティックごとに呼ばれる。
+    """
+
+    def __init__(self, rate_hz: float = 120.0,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep,
+                 skip_frames: bool = True,
+                 observer: Optional[Callable[[ScheduleStats], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 on_progress: Optional[Callable[[int, int], None]] = None):
+        self.rate_hz = rate_hz
+        self._clock = clock
+        self._sleep = sleep
+        self.skip_frames = skip_frames
+        # 実行ごとの ScheduleStats を受け取るコールバック (計測用)
+        self.observer = observer
+        self.should_stop = should_stop
+        self.on_progress = on_progress
+        # sleep の平均寝過ごし量 (指数移動平均)。次回以降の sleep から差し引く
+        self.sleep_overshoot = 0.0
+
+    def _sleep_until(self, deadline: float):
+        if self.should_stop is not None and self.rate_hz > 0:
+            # 中断要求に1ティック以内で応じられるよう、長い待ちは1ティックずつに分ける
+            chunk = 1.0 / self.rate_hz
+            while deadline - self._clock() > chunk:
+                if self.should_stop():
+                    return
+                self._sleep_precise(self._clock() + chunk)
+        self._sleep_precise(deadline)
+
+    def _sleep_precise(self, deadline: float):
+        remaining = deadline - self._clock()
+        if remaining <= 0:
+            return
+        request = remaining - self.sleep_overshoot
+        if request > 0:
+            before = self._clock()
+            self._sleep(request)
+            overshoot = (self._clock() - before) - request
+            self.sleep_overshoot = max(0.0, 0.8 * self.sleep_overshoot + 0.2 * overshoot)
+        # 補正で早く起きすぎた分は、期限直前の SPIN_SLICE 秒だけ sleep(0) で詰め、それより前は眠って待つ
+        while True:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                return
+            self._sleep(remaining - SPIN_SLICE if remaining > SPIN_SLICE else 0)
+
+    def run(self, duration: float, on_tick: Callable[[int, int], None],
+            ticks: Optional[int] = None) -> ScheduleStats:
+        """duration 秒かけて on_tick を実行する。ticks 省略時は rate_hz から決める"""
+        n = ticks if ticks is not None else max(int(round(duration * self.rate_hz)), 1)
+        period = duration / n if n else 0.0
+        stats = ScheduleStats(duration, n, period)
+        t0 = self._clock()
+
+        i = 0
+        while i < n:
+            deadline = t0 + (i + 1) * period
+            self._sleep_until(deadline)
+            if self.should_stop is not None and self.should_stop():
+                stats.stopped = True
+                break
+
+            now = self._clock()
+            if self.skip_frames and period > 0 and i < n - 1:
+                # 既に期限を過ぎたティックがあれば、最新のものまで飛ばす
+                due = min(int(math.floor((now - t0) / period + 1e-9)) - 1, n - 1)
+                if due > i:
+                    stats.skipped += due - i
+                    i = due
+                    deadline = t0 + (i + 1) * period
+
+            stats.lateness.append(max(0.0, now - deadline))
+            on_tick(i, n)
+            stats.ticks += 1
+            stats.reached = i + 1
+            if self.on_progress is not None:
+                self.on_progress(i + 1, n)
+            if self._clock() - now > period:
+                stats.overruns += 1
+            i += 1
+
+        stats.elapsed = self._clock() - t0
+        if self.observer is not None:
+            self.observer(stats)
+        return stats
+
+    def run_events(self, offsets: List[float], on_event: Callable[[int], None]) -> ScheduleStats:
+        """
+        開始からの秒数 offsets (昇順) の各時刻に on_event(i) を実行する。
+        不定期なイベント列用。遅れてもイベントは飛ばさない (押下・解放を落とせないため)。
+        """
+        planned = offsets[-1] if offsets else 0.0
+        stats = ScheduleStats(planned, len(offsets), 0.0)
+        t0 = self._clock()
+        for i, offset in enumerate(offsets):
+            deadline = t0 + offset
+            self._sleep_until(deadline)
+            if self.should_stop is not None and self.should_stop():
+                stats.stopped = True
+                break
+            now = self._clock()
+            stats.lateness.append(max(0.0, now - deadline))
+            on_event(i)
+            stats.ticks += 1
+            stats.reached = i + 1
+            if self.on_progress is not None:
+                self.on_progress(i + 1, len(offsets))
+            # 次のイベントの期限までに処理が終わらなかった
+            if i + 1 < len(offsets) and self._clock() > t0 + offsets[i + 1]:
+                stats.overruns += 1
+        stats.elapsed = self._clock() - t0
+        if self.observer is not None:
+            self.observer(stats)
+        return stats
+
+
+class FakeClock:
+    """テスト用の仮想クロック。sleep で時刻が進む (overshoot で寝過ごしを再現)"""
+
+    def __init__(self, start: float = 0.0, overshoot: float = 0.0):
+        self.now = start
+        self.overshoot = overshoot
+        self.sleeps = 0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps += 1
+        # sleep(0) でも時間が進まないと無限ループになるので最小単位だけ進める
+        self.now += max(seconds, 1e-6) + (self.overshoot if seconds > 0 else 0.0)
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class RecordingSink:
+    """テスト用のイベント受け口。on_tick として渡すと呼び出し時刻を記録する"""
+
+    def __init__(self, clock: Callable[[], float], cost: float = 0.0):
+        self._clock = clock
+        self.cost = cost
+        self.events: List[Tuple[float, int, int]] = []
+
+    def __call__(self, i: int, n: int):
+        self.events.append((self._clock(), i, n))
+        # イベント送信にかかる時間を再現
+        if self.cost and hasattr(self._clock, "advance"):
+            self._clock.advance(self.cost)
@@ -0,0 +1,146 @@
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+
+def cgimage_to_pil(cg_image) -> Image.Image:
+    """Quartz の CGImage を PIL の RGB 画像に変換する"""
+    import Quartz
+    width = Quartz.CGImageGetWidth(cg_image)
+    height = Quartz.CGImageGetHeight(cg_image)
+    bytes_per_row = Quartz.CGImageGetBytesPerRow(cg_image)
+    data = Quartz.CGDataProviderCopyData(Quartz.CGImageGetDataProvider(cg_image))
+    # 行末にパディングがあるので bytes_per_row を指定して読み込む
+    img = Image.frombuffer("RGBA", (width, height), bytes(data), "raw", "BGRA", bytes_per_row, 1)
+    return img.convert("RGB")
+
+
+def grab_rect(x: int, y: int, w: int, h: int) -> Image.Image:
+    """
+    画面の矩形領域を撮影する。
+    Quartz (CGWindowListCreateImage) で直接取得するので screencapture を起動するより速い。
+    Retinaでは画素数がポイント数の倍になる。
+    """
+    try:
+        import Quartz
+        cg_image = Quartz.CGWindowListCreateImage(
+            Quartz.CGRectMake(x, y, w, h),
+            Quartz.kCGWindowListOptionOnScreenOnly,
+            Quartz.kCGNullWindowID,
+            Quartz.kCGWindowImageDefault,
+        )
+        if cg_image is not None:
+            return cgimage_to_pil(cg_image)
+    except ImportError:
+        pass
+    import pyautogui
+    return pyautogui.screenshot(region=(x, y, w, h))
+
+
+def grab_window(window_id: int, nominal: bool = False) -> Optional[Image.Image]:
+    """
+    ウィンドウIDを指定して、そのウィンドウだけを撮影する (他のウィンドウに隠れていても写る。最小化中は None)。
+    フォーカスを変えず待ちも無い。nominal=True ならRetinaでもポイント単位の解像度で撮る。
+    """
+    import Quartz
+    options = Quartz.kCGWindowImageBoundsIgnoreFraming
+    if nominal:
+        options |= Quartz.kCGWindowImageNominalResolution
+    cg_image = Quartz.CGWindowListCreateImage(
+        Quartz.CGRectNull,
+        Quartz.kCGWindowListOptionIncludingWindow,
+        window_id,
+        options,
+    )
+    if cg_image is None or Quartz.CGImageGetWidth(cg_image) == 0:
+        return None
+    return cgimage_to_pil(cg_image)
+
+
+class Capture(NamedTuple):
+    """撮影結果。bounds は写っている範囲の画面座標 (ポイント)、scale は1ポイントあたりの画素数"""
+    image: Image.Image
+    bounds: Tuple[int, int, int, int]
+    scale: float
+
+    def to_screen(self, x: float, y: float) -> Tuple[int, int]:
+        """画像の画素座標を画面座標にする"""
+        return int(self.bounds[0] + x / self.scale), int(self.bounds[1] + y / self.scale)
+
+
+class CaptureNeedsFocus(Exception):
+    """フォーカスを変えずには撮影できなかった (入力操作と同じキューで、最前面にしてから撮り直す必要がある)"""
+
+
+class CaptureSource(ABC):
+    """
+    ウィンドウ1枚を撮影する方法の共通部分。capture(window) は撮れなければ None を返す。
+    client_area=True ならタイトルバー (title_bar ポイント) を除いた描画領域だけを返す。
+    needs_focus が True の方法は、撮影前にウィンドウを最前面にする必要がある。
+    """
+    needs_focus = False
+
+    def __init__(self, client_area: bool = False, title_bar: float = 28.0):
+        self.client_area = client_area
+        self.title_bar = title_bar
+        self.captures = 0
+        self.failures = 0
+
+    @abstractmethod
+    def _grab(self, window) -> Optional[Image.Image]:
+        """window を撮影した画像 (撮れなければ None)"""
+
+    def capture(self, window) -> Optional[Capture]:
+        image = self._grab(window)
+        if image is None:
+            self.failures += 1
+            return None
+        self.captures += 1
+        x, y, w, h = window.bounds
+        scale = image.width / w if w else 1.0
+        if self.client_area and self.title_bar > 0 and h > self.title_bar:
+            top = int(round(self.title_bar * scale))
+            image = image.crop((0, top, image.width, image.height))
+            y, h = y + int(self.title_bar), h - int(self.title_bar)
+        return Capture(image, (x, y, w, h), scale)
+
+
+class WindowCaptureSource(CaptureSource):
+    """ウィンドウIDで撮影する (重なり・フォーカスに関係なく撮れる)"""
+
+    def __init__(self, client_area: bool = False, title_bar: float = 28.0, nominal: bool = False):
+        super().__init__(client_area, title_bar)
+        self.nominal = nominal
+
+    def _grab(self, window) -> Optional[Image.Image]:
+        return grab_window(window.window_id, self.nominal)
+
+
+class RegionCaptureSource(CaptureSource):
+    """ウィンドウの位置の画面領域を撮影する (前面に他のウィンドウがあればそれも写るので、最前面にしてから使う)"""
+    needs_focus = True
+
+    def _grab(self, window) -> Optional[Image.Image]:
+        return grab_rect(*window.bounds)
+
+
+class FakeCaptureSource(CaptureSource):
+    """
+    テスト用: frames (画像、または window を受け取って画像を返す関数) を撮影結果として返す (Linuxでも動作)。
+    scale を指定すると、ウィンドウの大きさ x scale の画像に拡大・縮小して Retina を模す。
+    """
+
+    def __init__(self, frames, scale: float = 1.0, client_area: bool = False, title_bar: float = 28.0):
+        super().__init__(client_area, title_bar)
+        self.frames = frames
+        self.scale = scale
+        self.windows = []
+
+    def _grab(self, window) -> Optional[Image.Image]:
+        self.windows.append(window)
+        image = self.frames(window) if callable(self.frames) else self.frames
+        if image is None:
+            return None
+        size = (int(window.bounds[2] * self.scale), int(window.bounds[3] * self.scale))
+        return image if image.size == size else image.resize(size)
@@ -0,0 +1,97 @@
+import math
+from typing import List
+
+UNITS = ("pixel", "line")
+PROFILES = ("linear", "ease_in_out", "ease_in", "ease_out")
+# scroll_zoom の amount 10 が1行 (ホイール1目盛り) に当たる
+AMOUNT_PER_LINE = 10.0
+
+
+def progress(profile: str, u: float) -> float:
+    """経過割合 u (0-1) の時点で送り終えている量の割合"""
+    if profile == "ease_in_out":
+        return 0.5 - 0.5 * math.cos(math.pi * u)
+    if profile == "ease_in":
+        return u * u
+    if profile == "ease_out":
+        return 1.0 - (1.0 - u) * (1.0 - u)
+    return u
+
+
+def _round(value: float) -> int:
+    # 正負で同じように四捨五入する (持ち越す端数は常に ±0.5 以内)
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+class ScrollEngine:
+    """
+    スクロール量 (amount) をスクロールイベントに変換して backend.scroll(delta, unit) で送る。
+    unit="pixel" ではピクセル単位 (amount 1 = pixels_per_line / 10 ピクセル)、unit="line" では行単位で送る。
+    pixels_per_line の既定の 1 は従来の送り方 (amount 10 で1ピクセル) と同じ量になる。
+    送る量は累積の目標値を丸めて決めるので、丸めた端数は次のイベントへ、呼び出しの最後に残った端数は
+    次の呼び出しへ持ち越され、送った合計は要求した量の合計と一致する (行単位でも amount 5 を2回で1行)。
+    時間をかける場合は速度の形 (profile) に沿って、スケジューラのティックごとに送る。
+    """
+
+    def __init__(self, backend, unit: str = "pixel", pixels_per_line: float = 1.0):
+        if unit not in UNITS:
+            raise ValueError(f"unit は {', '.join(UNITS)} のいずれかを指定してください: {unit}")
+        self.backend = backend
+        self.unit = unit
+        self.pixels_per_line = pixels_per_line
+        # まだ送っていない端数 (イベントの単位)
+        self.carry = 0.0
+        # 送ったイベントの合計 (イベントの単位)
+        self.sent = 0
+
+    def to_units(self, amount: float) -> float:
+        """amount をイベントの単位 (ピクセルまたは行) にする"""
+        lines = amount / AMOUNT_PER_LINE
+        return lines * self.pixels_per_line if self.unit == "pixel" else lines
+
+    def _post(self, delta: int):
+        if delta:
+            self.backend.scroll(delta, self.unit)
+            self.sent += delta
+
+    def scroll(self, amount: float) -> int:
+        """すぐに1回で送る。送った量 (イベントの単位) を返す"""
+        target = self.carry + self.to_units(amount)
+        delta = _round(target)
+        self.carry = target - delta
+        self._post(delta)
+        return delta
+
+    def plan(self, amount: float, ticks: int, profile: str = "linear") -> List[int]:
+        """ticks 回に分けて送る場合の各ティックの量 (端数の持ち越しは変えない)"""
+        if profile not in PROFILES:
+            raise ValueError(f"profile は {', '.join(PROFILES)} のいずれかを指定してください: {profile}")
+        total = self.to_units(amount)
+        deltas, done = [], 0
+        for i in range(ticks):
+            goal = _round(self.carry + total * progress(profile, (i + 1) / ticks))
+            deltas.append(goal - done)
+            done = goal
+        return deltas
+
+    def run(self, amount: float, duration: float, scheduler, profile: str = "linear"):
+        """
+        duration 秒かけて送る (scheduler は DeadlineScheduler)。(ScheduleStats, 送った量) を返す。
+        遅れて飛ばしたティックの分は次のティックでまとめて送るので、最後まで送れば合計は失われない。
+        中断された場合は、送らなかった分と端数を捨てる。
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"profile は {', '.join(PROFILES)} のいずれかを指定してください: {profile}")
+        base = self.carry
+        total = self.to_units(amount)
+        sent = [0]
+
+        def tick(i, n):
+            goal = _round(base + total * progress(profile, (i + 1) / n))
+            self._post(goal - sent[0])
+            sent[0] = goal
+
+        stats = scheduler.run(duration, tick)
+        self.carry = 0.0 if stats.stopped else base + total - sent[0]
+        return stats, sent[0]
+
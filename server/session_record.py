@@ -0,0 +1,349 @@
+import array
+import bisect
+import json
+import mmap
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+# イベント種別
+MOVE, DRAG, BUTTON_DOWN, BUTTON_UP, SCROLL, KEY_DOWN, KEY_UP = range(7)
+KIND_NAMES = ("move", "drag", "button_down", "button_up", "scroll", "key_down", "key_up")
+BUTTON_NAMES = ("left", "right", "middle")
+
+MAGIC = b"CLSN"
+VERSION = 1
+# magic, version, イベント数, メタデータ(JSON)のバイト数
+_HEADER = struct.Struct("<4sHxxQI4x")
+# 列の並び (要素サイズの大きい順に置き、各列の先頭を要素サイズに揃える)
+COLUMNS = (("t", "d"), ("code", "i"), ("x", "i"), ("y", "i"), ("dx", "i"), ("dy", "i"), ("kind", "B"))
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class SessionRecorder:
+    """
+    入力イベントを列ごとの array に溜め、列指向のバイナリファイルに書き出す。
+    1イベントあたり 29 バイトで、Python オブジェクトを作らずに保持する。
+    code はボタン番号 (BUTTON_NAMES) またはキー名表 (keys) の番号。
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, meta: Optional[dict] = None):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.columns = {name: array.array(code) for name, code in COLUMNS}
+        self.keys: List[str] = []
+        self._key_index: Dict[str, int] = {}
+        self.meta = dict(meta or {})
+        self.started_at = None
+
+    def __len__(self):
+        return len(self.columns["t"])
+
+    def key_code(self, name: str) -> int:
+        index = self._key_index.get(name)
+        if index is None:
+            index = self._key_index[name] = len(self.keys)
+            self.keys.append(name)
+        return index
+
+    def add(self, kind: int, code: int = 0, x: int = 0, y: int = 0, dx: int = 0, dy: int = 0,
+            t: Optional[float] = None):
+        now = self._clock() if t is None else t
+        with self._lock:
+            if self.started_at is None:
+                self.started_at = now
+            c = self.columns
+            c["t"].append(now - self.started_at)
+            c["kind"].append(kind)
+            c["code"].append(int(code))
+            c["x"].append(int(x))
+            c["y"].append(int(y))
+            c["dx"].append(int(dx))
+            c["dy"].append(int(dy))
+
+    def add_key(self, kind: int, name: str, t: Optional[float] = None):
+        self.add(kind, self.key_code(name), t=t)
+
+    def save(self, path: str) -> int:
+        """ファイルに書き出し、書いたバイト数を返す"""
+        with self._lock:
+            meta = dict(self.meta, keys=self.keys, columns=[name for name, _ in COLUMNS])
+            body = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+            count = len(self.columns["t"])
+            with open(path, "wb") as f:
+                f.write(_HEADER.pack(MAGIC, VERSION, count, len(body)))
+                f.write(body + b"\0" * (_pad8(len(body)) - len(body)))
+                for name, _ in COLUMNS:
+                    data = self.columns[name].tobytes()
+                    f.write(data + b"\0" * (_pad8(len(data)) - len(data)))
+                return f.tell()
+
+
+class Session:
+    """
+    記録ファイルを mmap で開き、各列を memoryview として読む (全体を Python オブジェクトに展開しない)。
+    with 文で使うか、使い終わったら close() する。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, meta_len = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"セッションファイルではありません: {path}")
+        offset = _HEADER.size
+        self.meta = json.loads(bytes(self._map[offset:offset + meta_len]).decode("utf-8"))
+        self.keys: List[str] = self.meta.get("keys", [])
+        self.count = count
+        offset += _pad8(meta_len)
+        view = memoryview(self._map)
+        self._views = [view]
+        self.columns = {}
+        for name, code in COLUMNS:
+            size = array.array(code).itemsize * count
+            col = view[offset:offset + size].cast(code)
+            self._views.append(col)
+            self.columns[name] = col
+            offset += _pad8(size)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def duration(self) -> float:
+        return self.columns["t"][-1] if self.count else 0.0
+
+    def index_at(self, seconds: float) -> int:
+        """seconds 秒以降の最初のイベント番号 (t 列を二分探索)"""
+        return bisect.bisect_left(self.columns["t"], seconds)
+
+    def close(self):
+        for v in reversed(getattr(self, "_views", [])):
+            v.release()
+        self._views = []
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        if getattr(self, "_file", None) is not None:
+            self._file.close()
+            self._file = None
+
+
+class _Offsets:
+    """イベント番号 [start, stop) の再生開始からの秒数を、必要な分だけ計算して返すシーケンス"""
+
+    def __init__(self, t, start: int, stop: int, speed: float):
+        self._t = t
+        self._start = start
+        self._len = max(0, stop - start)
+        self._t0 = t[start] if self._len else 0.0
+        self._speed = speed
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i: int) -> float:
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError(i)
+        return (self._t[self._start + i] - self._t0) / self._speed
+
+
+def replay(session: Session, backend, scheduler, speed: float = 1.0, start: float = 0.0,
+           end: Optional[float] = None, offset=(0, 0)):
+    """
+    セッションの [start, end) 秒のイベントを speed 倍速で backend に送る。
+    scheduler は DeadlineScheduler (run_events で期限どおりに送る。中断されたら押したままのキー・ボタンを離す)。
+    offset は座標に足す量 (記録時と再生時のウィンドウ位置の差)。(ScheduleStats, 送ったイベント数) を返す。
+    """
+    if speed <= 0:
+        raise ValueError("speed は正の値を指定してください")
+    first = session.index_at(start)
+    last = session.index_at(end) if end is not None else session.count
+    c = session.columns
+    kind, code, xs, ys, dxs, dys = c["kind"], c["code"], c["x"], c["y"], c["dx"], c["dy"]
+    ox, oy = offset
+    held_keys = set()
+    held_buttons = {}
+
+    def on_event(i):
+        j = first + i
+        k = kind[j]
+        if k == MOVE:
+            backend.mouse_move(xs[j] + ox, ys[j] + oy, dxs[j], dys[j])
+        elif k == DRAG:
+            backend.mouse_drag(BUTTON_NAMES[code[j]], xs[j] + ox, ys[j] + oy, dxs[j], dys[j])
+        elif k == BUTTON_DOWN or k == BUTTON_UP:
+            button = BUTTON_NAMES[code[j]]
+            backend.mouse_button(button, k == BUTTON_DOWN, xs[j] + ox, ys[j] + oy)
+            if k == BUTTON_DOWN:
+                held_buttons[button] = (xs[j] + ox, ys[j] + oy)
+            else:
+                held_buttons.pop(button, None)
+        elif k == SCROLL:
+            backend.scroll(dys[j])
+        elif k == KEY_DOWN:
+            backend.key_down(session.keys[code[j]])
+            held_keys.add(session.keys[code[j]])
+        elif k == KEY_UP:
+            backend.key_up(session.keys[code[j]])
+            held_keys.discard(session.keys[code[j]])
+
+    try:
+        stats = scheduler.run_events(_Offsets(c["t"], first, last, speed), on_event)
+    finally:
+        # 途中で止まった場合 (範囲の端・中断・エラー) も押したままにしない
+        for key in held_keys:
+            backend.key_up(key)
+        for button, (x, y) in held_buttons.items():
+            backend.mouse_button(button, False, x, y)
+    return stats, stats.reached
+
+
+class QuartzEventTap:
+    """
+    CGEventTap (受信専用) で人の操作を SessionRecorder に記録する Mac 用の入力源。
+    専用スレッドで CFRunLoop を回す。入力監視 (アクセシビリティ) の許可が必要。
+    """
+
+    def __init__(self, recorder: SessionRecorder):
+        # Quartz は Mac 専用なので、使う時点で読み込む
+        import Quartz
+        self._q = Quartz
+        self.recorder = recorder
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self.error = ""
+        # キーコード -> pyautogui のキー名 (再生時に pyautogui で押すため)
+        try:
+            from pyautogui import _pyautogui_osx
+            self._names = {}
+            for name, keycode in _pyautogui_osx.keyboardMapping.items():
+                self._names.setdefault(keycode, name)
+        except Exception:
+            self._names = {}
+        self._modifiers = set()
+        q = Quartz
+        self._buttons = {
+            q.kCGEventLeftMouseDown: (BUTTON_DOWN, 0), q.kCGEventLeftMouseUp: (BUTTON_UP, 0),
+            q.kCGEventRightMouseDown: (BUTTON_DOWN, 1), q.kCGEventRightMouseUp: (BUTTON_UP, 1),
+            q.kCGEventOtherMouseDown: (BUTTON_DOWN, 2), q.kCGEventOtherMouseUp: (BUTTON_UP, 2),
+        }
+        self._drags = {q.kCGEventLeftMouseDragged: 0, q.kCGEventRightMouseDragged: 1,
+                       q.kCGEventOtherMouseDragged: 2}
+
+    def _key_name(self, keycode: int) -> str:
+        return self._names.get(keycode, f"keycode:{keycode}")
+
+    def _callback(self, proxy, event_type, event, refcon):
+        q = self._q
+        rec = self.recorder
+        try:
+            loc = q.CGEventGetLocation(event)
+            x, y = int(loc.x), int(loc.y)
+            if event_type == q.kCGEventMouseMoved or event_type in self._drags:
+                dx = q.CGEventGetIntegerValueField(event, q.kCGMouseEventDeltaX)
+                dy = q.CGEventGetIntegerValueField(event, q.kCGMouseEventDeltaY)
+                if event_type == q.kCGEventMouseMoved:
+                    rec.add(MOVE, 0, x, y, dx, dy)
+                else:
+                    rec.add(DRAG, self._drags[event_type], x, y, dx, dy)
+            elif event_type in self._buttons:
+                kind, button = self._buttons[event_type]
+                rec.add(kind, button, x, y)
+            elif event_type == q.kCGEventScrollWheel:
+                rec.add(SCROLL, dy=q.CGEventGetIntegerValueField(event, q.kCGScrollWheelEventDeltaAxis1))
+            elif event_type in (q.kCGEventKeyDown, q.kCGEventKeyUp):
+                # キーリピートは押しっぱなしとして1回だけ記録する
+                if q.CGEventGetIntegerValueField(event, q.kCGKeyboardEventAutorepeat):
+                    return event
+                keycode = q.CGEventGetIntegerValueField(event, q.kCGKeyboardEventKeycode)
+                rec.add_key(KEY_DOWN if event_type == q.kCGEventKeyDown else KEY_UP, self._key_name(keycode))
+            elif event_type == q.kCGEventFlagsChanged:
+                # 修飾キーは押下・解放が同じ種別で届くので、押している集合で判定する
+                keycode = q.CGEventGetIntegerValueField(event, q.kCGKeyboardEventKeycode)
+                if keycode in self._modifiers:
+                    self._modifiers.discard(keycode)
+                    rec.add_key(KEY_UP, self._key_name(keycode))
+                else:
+                    self._modifiers.add(keycode)
+                    rec.add_key(KEY_DOWN, self._key_name(keycode))
+        except Exception as e:
+            self.error = str(e)
+        return event
+
+    def _run(self):
+        try:
+            self._run_loop()
+        except Exception as e:
+            self.error = f"イベントタップのエラー: {e}"
+            self._ready.set()
+
+    def _run_loop(self):
+        q = self._q
+        types = [q.kCGEventMouseMoved, q.kCGEventScrollWheel, q.kCGEventKeyDown, q.kCGEventKeyUp,
+                 q.kCGEventFlagsChanged] + list(self._buttons) + list(self._drags)
+        mask = 0
+        for t in types:
+            mask |= q.CGEventMaskBit(t)
+        tap = q.CGEventTapCreate(q.kCGSessionEventTap, q.kCGHeadInsertEventTap,
+                                 q.kCGEventTapOptionListenOnly, mask, self._callback, None)
+        if tap is None:
+            self.error = "イベントタップを作成できません (入力監視の許可を確認してください)"
+            self._ready.set()
+            return
+        source = q.CFMachPortCreateRunLoopSource(None, tap, 0)
+        self._loop = q.CFRunLoopGetCurrent()
+        q.CFRunLoopAddSource(self._loop, source, q.kCFRunLoopCommonModes)
+        q.CGEventTapEnable(tap, True)
+        self._ready.set()
+        q.CFRunLoopRun()
+
+    def start(self, timeout: float = 2.0):
+        self._thread = threading.Thread(target=self._run, name="session-tap", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout)
+        if self.error:
+            raise RuntimeError(self.error)
+
+    def stop(self):
+        if self._loop is not None:
+            self._q.CFRunLoopStop(self._loop)
+        if self._thread is not None:
+            self._thread.join(2.0)
+        self._thread = None
+        self._loop = None
+
+
+def recorder_from_events(events, button_names=BUTTON_NAMES) -> SessionRecorder:
+    """RecordingInputBackend.events (InputEvent のリスト) から記録を作る (テスト・変換用)"""
+    rec = SessionRecorder()
+    for e in events:
+        if e.kind == "move":
+            rec.add(MOVE, 0, *e.data, t=e.timestamp)
+        elif e.kind == "drag":
+            button, x, y, dx, dy = e.data
+            rec.add(DRAG, button_names.index(button), x, y, dx, dy, t=e.timestamp)
+        elif e.kind == "button":
+            button, down, x, y = e.data
+            rec.add(BUTTON_DOWN if down else BUTTON_UP, button_names.index(button), x, y, t=e.timestamp)
+        elif e.kind == "scroll":
+            rec.add(SCROLL, dy=e.data[0], t=e.timestamp)
+        elif e.kind in ("key_down", "key_up"):
+            rec.add_key(KEY_DOWN if e.kind == "key_down" else KEY_UP, e.data[0], t=e.timestamp)
+    return rec
+
@@ -0,0 +1,172 @@
+"""
+サーバーの起動時間の計測。
+- import main にかかる時間と、その時点で重いモジュール (Quartz / pyautogui / AppKit / numpy) が読み込まれていないか
+- python main.py を起動してから initialize / tools/list / 最初の tools/call に応答するまでの時間
+
+Mac 以外でも動くよう、既定では Quartz / pyautogui / AppKit を読み込みに時間のかかる仮のモジュールに差し替えて
+子プロセスで計測する (仮のモジュールは一時フォルダに作る)。起動時に読み込んでしまう変更を入れると、
+その分だけ応答が遅れ、loaded に名前が出るので分かる。--real で差し替えずに実際のモジュールで計測する。
+"""
+import argparse
+import json
+import os
+import queue
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+# 起動時 (import main の時点) に読み込まれていてはいけないモジュール
+HEAVY_MODULES = ("Quartz", "pyautogui", "AppKit", "numpy")
+
+# 仮のモジュール: 読み込みに delay 秒かかり、どの属性も 0 か何もしない関数を返す
+_STUB_SOURCE = """import time
+time.sleep({delay})
+
+
+def _noop(*args, **kwargs):
+    return None
+
+
+def __getattr__(name):
+    if name.startswith("k"):
+        return 0
+    return _noop
+"""
+
+_IMPORT_PROBE = """import json, sys, time
+t0 = time.perf_counter()
+import main
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def write_stubs(path: str, delay: float):
+    """Mac 専用モジュールの代わりを path に作る"""
+    for name in ("Quartz", "pyautogui", "AppKit"):
+        with open(os.path.join(path, name + ".py"), "w", encoding="utf-8") as f:
+            f.write(_STUB_SOURCE.format(delay=delay))
+
+
+def _env(stub_dir, prewarm: bool):
+    env = dict(os.environ)
+    if stub_dir:
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (stub_dir, env.get("PYTHONPATH")) if p)
+    env["CLUSTER_MCP_PREWARM"] = "1" if prewarm else "0"
+    return env
+
+
+def measure_import(stub_dir=None, repeat: int = 5) -> dict:
+    """新しいプロセスで import main を repeat 回計測する"""
+    times, loaded = [], set()
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE], cwd=SERVER_DIR, env=_env(stub_dir, False),
+                             capture_output=True, text=True, timeout=60, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return {"median": statistics.median(times), "min": min(times), "loaded": sorted(loaded)}
+
+
+class _StdioClient:
+    """改行区切り JSON-RPC で MCP サーバーの子プロセスとやり取りする最小限のクライアント"""
+
+    def __init__(self, env):
+        self.t0 = time.perf_counter()
+        self.proc = subprocess.Popen([sys.executable, "main.py"], cwd=SERVER_DIR, env=env,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, text=True, encoding="utf-8", bufsize=1)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def send(self, message: dict):
+        self.proc.stdin.write(json.dumps(message) + "\n")
+        self.proc.stdin.flush()
+
+    def request(self, req_id: int, method: str, params: dict, timeout: float = 30.0) -> float:
+        """要求を送り、応答が来た時点の起動からの秒数を返す"""
+        self.send({"jsonrpc": "2.0", "id": req_id, "method": method, "params": params})
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            if line is None:
+                raise RuntimeError(f"サーバーが終了しました ({method})")
+            message = json.loads(line)
+            if message.get("id") == req_id:
+                if "error" in message:
+                    raise RuntimeError(f"{method}: {message['error']}")
+                return time.perf_counter() - self.t0
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+
+
+def measure_first_response(stub_dir=None, prewarm: bool = True, tool: str = "get_metrics") -> dict:
+    """サーバーを起動し、initialize / tools/list / 最初の tools/call に応答するまでの秒数を返す"""
+    client = _StdioClient(_env(stub_dir, prewarm))
+    try:
+        initialize = client.request(1, "initialize", {
+            "protocolVersion": "2025-06-18",
+            "capabilities": {},
+            "clientInfo": {"name": "startup_benchmark", "version": "0"},
+        })
+        client.send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+        tools_list = client.request(2, "tools/list", {})
+        first_call = client.request(3, "tools/call", {"name": tool, "arguments": {}})
+    finally:
+        client.close()
+    return {"initialize": initialize, "tools_list": tools_list, "first_call": first_call}
+
+
+def run_benchmark(real: bool = False, delay: float = 0.3, repeat: int = 5) -> dict:
+    with tempfile.TemporaryDirectory() as stub_dir:
+        if real:
+            stub_dir = None
+        else:
+            write_stubs(stub_dir, delay)
+        result = {"import": measure_import(stub_dir, repeat)}
+        for prewarm in (False, True):
+            runs = [measure_first_response(stub_dir, prewarm) for _ in range(repeat)]
+            result["prewarm" if prewarm else "no_prewarm"] = {
+                k: statistics.median(r[k] for r in runs) for k in runs[0]
+            }
+        return result
+
+
+def print_report(result: dict):
+    imp = result["import"]
+    print(f"import main: 中央値 {imp['median'] * 1000:.0f}ms / 最小 {imp['min'] * 1000:.0f}ms"
+          f"  起動時に読み込まれた重いモジュール: {', '.join(imp['loaded']) or 'なし'}")
+    print(f"{'先読み':<8} {'initialize':>12} {'tools/list':>12} {'最初のcall':>12}")
+    for key, label in (("no_prewarm", "なし"), ("prewarm", "あり")):
+        r = result[key]
+        print(f"{label:<8} {r['initialize'] * 1000:>10.0f}ms {r['tools_list'] * 1000:>10.0f}ms "
+              f"{r['first_call'] * 1000:>10.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="import時間と最初の応答までの時間を計測する")
+    parser.add_argument("--real", action="store_true", help="仮のモジュールに差し替えずに計測する (Mac 用)")
+    parser.add_argument("--delay", type=float, default=0.3, help="仮のモジュール1つの読み込み時間 (秒)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=None, help="initialize の応答がこの秒数を超えたら失敗にする")
+    args = parser.parse_args()
+    result = run_benchmark(args.real, args.delay, args.repeat)
+    print_report(result)
+    failed = bool(result["import"]["loaded"])
+    if args.budget is not None:
+        failed |= any(result[k]["initialize"] > args.budget for k in ("no_prewarm", "prewarm"))
+    sys.exit(1 if failed else 0)
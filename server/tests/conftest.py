@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# サーバーのモジュールは server/ 直下にフラットに置かれている
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def use_backend(monkeypatch):
+    """main の入力バックエンドを差し替える関数を返す (テストが終われば元に戻す)"""
+    import main
+
+    def use(backend):
+        # set_input_backend と同じ差し替えを monkeypatch 経由で行う
+        monkeypatch.setattr(main, "INPUT", backend)
+        monkeypatch.setattr(main, "WINDOW_REGISTRY", backend.registry)
+        monkeypatch.setattr(main.FOCUS_MANAGER, "registry", backend.registry)
+        monkeypatch.setattr(main.INSTANCES, "registry", backend.registry)
+        return backend
+    return use
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from action_queue import AppActionQueues
+
+
+def test_pause_input_lets_other_apps_run():
+    order = []
+
+    def paced():
+        order.append("a:start")
+        # 送信間隔をあけて待つ間、他のアプリの入力を先に通す
+        assert queues.pause_input(0.1)
+        order.append("a:end")
+
+    def other():
+        order.append("b")
+
+    def same_app():
+        order.append("a:next")
+
+    async def main():
+        first = asyncio.ensure_future(queues.submit("a", paced))
+        await asyncio.sleep(0.02)
+        # 同じアプリのアクションは待つ間も割り込まない
+        await asyncio.gather(first, queues.submit("b", other), queues.submit("a", same_app))
+
+    queues = AppActionQueues()
+    asyncio.run(main())
+    assert order == ["a:start", "b", "a:end", "a:next"]
+
+
+def test_pause_input_outside_action_just_sleeps():
+    queues = AppActionQueues()
+    t0 = time.monotonic()
+    assert not queues.pause_input(0.01)
+    assert time.monotonic() - t0 >= 0.01
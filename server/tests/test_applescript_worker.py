@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from applescript_worker import AppleScriptError, AppleScriptTimeout, AppleScriptWorker, AppleScriptWorkerPool
+
+STANDIN = [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                        "applescript_standin.py")]
+
+
+@pytest.fixture
+def worker():
+    w = AppleScriptWorker(STANDIN, timeout=5.0)
+    yield w
+    w.stop()
+
+
+def test_execute_returns_result(worker):
+    assert worker.execute("echo hello") == "hello"
+    assert worker.execute("echo again") == "again"
+    assert worker.restarts == 0
+
+
+def test_non_ascii_round_trip(worker):
+    # 日本語を含むスクリプトも \uXXXX で送られ、そのまま返ってくる
+    assert worker.execute("echo こんにちは、世界") == "こんにちは、世界"
+
+
+def test_error_response(worker):
+    with pytest.raises(AppleScriptError, match="boom"):
+        worker.execute("fail boom")
+    # エラー応答ではワーカーは生きたまま
+    assert worker.alive and worker.execute("echo ok") == "ok"
+
+
+def test_timeout_kills_and_restarts(worker):
+    with pytest.raises(AppleScriptTimeout):
+        worker.execute("sleep 5", timeout=0.3)
+    assert not worker.alive
+    assert worker.execute("echo back") == "back"
+    assert worker.restarts == 1
+
+
+def test_crash_restarts_on_next_call(worker):
+    with pytest.raises(AppleScriptError, match="worker exited"):
+        worker.execute("crash")
+    assert worker.execute("echo back") == "back"
+    assert worker.restarts == 1
+
+
+def test_pool_runs_calls_concurrently():
+    pool = AppleScriptWorkerPool(size=2, command=STANDIN)
+    pool.warm()
+    try:
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.execute("sleep 0.4"))) for _ in range(2)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 2個のワーカーで並行に動くので、2回分 (0.8秒) より短く終わる
+        assert time.perf_counter() - t0 < 0.75
+        assert results == ["slept", "slept"]
+        assert len(pool._workers) == 2
+    finally:
+        pool.close()
+
+
+def test_pool_waits_for_idle_worker_when_full():
+    pool = AppleScriptWorkerPool(size=1, command=STANDIN)
+    try:
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(pool.execute(f"echo {i}"))) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(results) == ["0", "1", "2", "3"]
+        assert len(pool._workers) == 1
+    finally:
+        pool.close()
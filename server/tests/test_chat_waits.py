@@ -0,0 +1,18 @@
+import main
+from input_backend import RecordingInputBackend
+
+
+def test_capture_error_falls_back_to_upper_bound_wait(monkeypatch):
+    slept = []
+    monkeypatch.setattr(main, "INPUT", RecordingInputBackend(sleep=slept.append))
+
+    def probe():
+        raise OSError("撮影できません")
+
+    waits = {}
+    main._open_chat(probe, waits)
+    main._post_chat_message("こんにちは", probe, waits)
+    # 基準画像を撮れなくても送信は止まらず、従来の固定待ち時間を上限まで待つ
+    assert waits["open"] == 0.5 and waits["paste"] == 0.1 and waits["send"] == 1.0
+    assert [e.data[0] for e in main.INPUT.events if e.kind == "key_down"] == ["b", "command", "v", "enter"]
+    assert main._wait_chat_settled(probe, 0.5) == 0.5
@@ -0,0 +1,135 @@
+import asyncio
+import contextvars
+
+from comment_outbox import CommentOutbox
+
+
+class Overloaded(Exception):
+    pass
+
+
+def test_runner_failure_before_next_fails_pending_comments():
+    calls = []
+
+    async def runner(session, rate_limiter):
+        calls.append(1)
+        # session.next() を呼ぶ前に失敗する (入力キューが混雑で断った場合など)
+        raise Overloaded("入力キューが混雑しています")
+
+    async def main():
+        outbox = CommentOutbox(runner, min_interval=0.0)
+        futures = [outbox.enqueue(text) for text in ("a", "b", "c")]
+        results = await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+        # 空回りせずに送信待ちを待つ状態に戻る
+        await asyncio.sleep(0.05)
+        return outbox, results
+
+    outbox, results = asyncio.run(main())
+    assert all(r == "コメント送信エラー: 入力キューが混雑しています" for r in results)
+    assert outbox.depth == 0 and len(calls) == 1
+    assert outbox.stats()["failed"] == 3
+
+
+def test_batch_failure_only_takes_one_batch():
+    attempts = []
+
+    async def runner(session, rate_limiter):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise Overloaded("混雑")
+        text = session.next()
+        while text is not None:
+            session.done(f"送信完了: {text}")
+            text = session.next()
+
+    async def main():
+        outbox = CommentOutbox(runner, min_interval=0.0, max_batch=2)
+        futures = [outbox.enqueue(str(i)) for i in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+
+    assert asyncio.run(main()) == ["コメント送信エラー: 混雑", "コメント送信エラー: 混雑", "送信完了: 2"]
+
+
+def test_sends_batch_and_coalesces_duplicates():
+    batches = []
+
+    async def runner(session, rate_limiter):
+        batch = []
+        text = session.next()
+        while text is not None:
+            batch.append(text)
+            session.done(f"送信完了: {text}")
+            text = session.next()
+        batches.append(batch)
+
+    async def main():
+        outbox = CommentOutbox(runner, min_interval=0.0)
+        futures = [outbox.enqueue(text) for text in ("a", "b", "a")]
+        return outbox, await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+
+    outbox, results = asyncio.run(main())
+    assert results == ["送信完了: a", "送信完了: b", "送信完了: a"]
+    assert batches == [["a", "b"]] and outbox.coalesced == 1
+
+
+def test_worker_does_not_inherit_first_callers_context():
+    caller = contextvars.ContextVar("caller", default=None)
+    seen = []
+
+    async def runner(session, rate_limiter):
+        seen.append(caller.get())
+        text = session.next()
+        while text is not None:
+            session.done(text)
+            text = session.next()
+
+    async def main():
+        outbox = CommentOutbox(runner, min_interval=0.0)
+        caller.set("client-a")
+        return await outbox.submit("hello")
+
+    assert asyncio.run(main()) == "hello"
+    assert seen == [None]
+
+
+def test_main_outbox_is_charged_to_system_client(monkeypatch):
+    import main as server
+
+    seen = []
+
+    class Queues:
+        async def submit(self, app, func, *args):
+            seen.append(server._request_info()[0])
+            raise Overloaded("混雑")
+
+    monkeypatch.setattr(server, "ACTION_QUEUES", Queues())
+    monkeypatch.setattr(server, "COMMENT_OUTBOXES", {})
+
+    async def main():
+        # 最初に積んだ呼び出し元のクライアントの代わり
+        server.INTERNAL_CLIENT.set("client-a")
+        return await server._comment_outbox("cluster").submit("hello")
+
+    assert asyncio.run(main()) == "コメント送信エラー: 混雑"
+    assert seen == ["system"]
+
+
+def test_counts_sent_and_failed_from_explicit_flag():
+    async def runner(session, rate_limiter):
+        text = session.next()
+        while text is not None:
+            if text == "bad":
+                session.done(f"コメント送信エラー: {text}", ok=False)
+            else:
+                # 本文に「エラー」を含んでも送信できていれば成功
+                session.done(f"コメント送信完了: {text}")
+            text = session.next()
+
+    async def main():
+        outbox = CommentOutbox(runner, min_interval=0.0)
+        futures = [outbox.enqueue(text) for text in ("エラーが出た", "bad")]
+        await asyncio.wait_for(asyncio.gather(*futures), 1.0)
+        return outbox.stats()
+
+    stats = asyncio.run(main())
+    assert stats["sent"] == 1 and stats["failed"] == 1
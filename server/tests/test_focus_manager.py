@@ -0,0 +1,58 @@
+from focus_manager import FocusManager
+from scheduler import FakeClock
+from window_registry import FakeWindowBackend, WindowInfo, WindowRegistry
+
+MENU_BAR = 25
+
+
+def make_manager():
+    backend = FakeWindowBackend([
+        WindowInfo(pid=2, window_id=20, owner_name="Finder", bounds=(100, 100, 800, 600)),
+        WindowInfo(pid=1, window_id=10, owner_name="Game", bounds=(300, 300, 1280, 720)),
+    ])
+    calls = []
+
+    def activate(app, width, height, x, y):
+        # macOS と同じく、メニューバーより上には置けない
+        calls.append((app, x, y))
+        win = next(w for w in backend.windows if app.lower() in w.owner_name.lower())
+        w, h = (width, height) if width is not None and height is not None else win.bounds[2:]
+        backend.set_bounds(win.window_id, (x, max(y, MENU_BAR), w, h))
+        return backend.raise_window(win.pid, win.window_id)
+
+    clock = FakeClock()
+    manager = FocusManager(WindowRegistry(backend, clock=clock), activate, backend.raise_window,
+                           clock=clock, sleep=clock.sleep)
+    return manager, backend, calls, clock
+
+
+def test_clamped_position_counts_as_focused():
+    manager, backend, calls, clock = make_manager()
+    assert manager.ensure_focus("Game") == (True, None)
+    # 移動先は (0, 25) に調整されたが、最前面になった時点で待つのをやめる
+    assert clock.now < manager.settle_timeout and manager.settle_timeouts == 0
+    assert manager.current_bounds == (0, MENU_BAR, 1280, 720)
+    # 2回目以降は調整後の配置のままなのでフォーカスし直さない
+    for _ in range(3):
+        assert manager.ensure_focus("Game") == (False, None)
+    assert len(calls) == 1 and manager.skips == 3
+
+
+def test_refocuses_when_moved_or_covered():
+    manager, backend, calls, clock = make_manager()
+    manager.ensure_focus("Game")
+    clock.advance(1.0)
+    backend.set_bounds(10, (200, 200, 1280, 720))
+    assert manager.ensure_focus("Game") == (True, None)
+    clock.advance(1.0)
+    backend.raise_window(2, 20)
+    assert manager.ensure_focus("Game") == (True, None)
+    assert len(calls) == 3
+
+
+def test_different_request_is_not_satisfied_by_remembered_placement():
+    manager, backend, calls, clock = make_manager()
+    manager.ensure_focus("Game")
+    clock.advance(1.0)
+    assert manager.ensure_focus("Game", width=1024, height=768) == (True, None)
+    assert backend.windows[0].bounds == (0, MENU_BAR, 1024, 768)
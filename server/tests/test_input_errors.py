@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+import main
+from input_backend import RecordingInputBackend
+
+
+def call(tool, args):
+    result = asyncio.run(main.mcp.call_tool(tool, args))
+    contents = result[0] if isinstance(result, tuple) else result
+    return contents[0].text
+
+
+@pytest.fixture(autouse=True)
+def fake_backend(use_backend):
+    return use_backend(RecordingInputBackend())
+
+
+@pytest.mark.parametrize("tool, args", [
+    ("press_game_keys", {"keys": "w"}),
+    ("move_mouse_relative", {"x": 10, "y": 0}),
+    ("scroll_zoom", {"amount": 10}),
+    ("run_actions", {"steps": [{"type": "wait", "seconds": 0.1}]}),
+    ("take_screenshot", {}),
+    ("get_window_bounds", {}),
+    ("cancel_actions", {}),
+])
+def test_unknown_instance(tool, args, fake_backend):
+    text = call(tool, dict(args, instance="no-such-instance"))
+    assert text.startswith("入力エラー: インスタンス 'no-such-instance'"), text
+    assert fake_backend.events == []
+
+
+@pytest.mark.parametrize("tool, args", [
+    ("move_mouse_relative", {"x": 10, "y": 0, "profile": "zigzag"}),
+    ("scroll_zoom", {"amount": 10, "profile": "zigzag"}),
+])
+def test_invalid_profile(tool, args, fake_backend):
+    text = call(tool, dict(args, app_name="cluster"))
+    assert text.startswith("入力エラー: profile は"), text
+    assert "zigzag" in text
+    assert fake_backend.events == []
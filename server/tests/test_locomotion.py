@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import main
+from action_queue import AppActionQueues
+from input_backend import RecordingInputBackend
+from locomotion import LocomotionController, parse_directions
+from scheduler import FakeClock
+from window_registry import WindowInfo
+
+
+def wait_for(predicate, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def drag_total(backend):
+    drags = [e.data for e in backend.events if e.kind == "drag"]
+    return sum(d[3] for d in drags), sum(d[4] for d in drags)
+
+
+def test_parse_directions():
+    assert parse_directions("forward+left") == ("forward", "left")
+    assert parse_directions("") == ()
+    with pytest.raises(ValueError):
+        parse_directions("up")
+
+
+def test_key_state_follows_commands():
+    backend = RecordingInputBackend()
+    loco = LocomotionController(backend, rate_hz=200, watchdog_timeout=5.0)
+    loco.start(("forward",), sprint=True)
+    try:
+        assert wait_for(lambda: backend.held_keys == {"w", "shift"}), backend.held_keys
+        loco.steer(("forward", "left"), sprint=False)
+        assert wait_for(lambda: backend.held_keys == {"w", "a"}), backend.held_keys
+        loco.steer(())
+        assert wait_for(lambda: backend.held_keys == set())
+    finally:
+        loco.stop()
+    assert not loco.running and backend.held_keys == set()
+
+
+def test_turn_deltas_follow_elapsed_time():
+    # 旋回量は (仮想の) 経過時間 x 速度。端数は持ち越すので合計はずれない
+    clock = FakeClock()
+    backend = RecordingInputBackend()
+    loco = LocomotionController(backend, rate_hz=200, watchdog_timeout=5.0, clock=clock)
+    loco.start((), turn=(150.5, -40.0), anchor=(640, 400))
+    try:
+        assert wait_for(lambda: backend.held_buttons == {"right"})
+        for _ in range(8):
+            clock.advance(0.125)
+            ticks = loco.ticks
+            loco.steer()
+            assert wait_for(lambda: loco.ticks > ticks)
+        assert drag_total(backend) == (150, -40) and tuple(loco.turned) == (150, -40)
+        loco.steer(turn=(0.0, 0.0))
+        assert wait_for(lambda: backend.held_buttons == set())
+    finally:
+        loco.stop()
+    assert all(e.data[1:3] == (640, 400) for e in backend.events if e.kind == "drag")
+
+
+def test_watchdog_releases_everything():
+    backend = RecordingInputBackend()
+    loco = LocomotionController(backend, rate_hz=200, watchdog_timeout=0.1)
+    loco.start(("back",), turn=(100.0, 0.0))
+    assert wait_for(lambda: backend.held_keys == {"s"} and backend.held_buttons == {"right"})
+    assert wait_for(lambda: not loco.running)
+    assert loco.stop_reason == "watchdog" and loco.watchdog_trips == 1
+    assert backend.held_keys == set() and backend.held_buttons == set()
+
+
+def test_restart_after_watchdog_resets_counters():
+    backend = RecordingInputBackend()
+    loco = LocomotionController(backend, rate_hz=200, watchdog_timeout=0.1)
+    loco.start((), turn=(400.0, 0.0))
+    assert wait_for(lambda: not loco.running) and loco.turned[0] > 0
+    loco.start(("back",))
+    try:
+        assert wait_for(lambda: backend.held_keys == {"s"})
+        assert loco.running and loco.stop_reason == "" and loco.turned == [0, 0]
+    finally:
+        loco.stop()
+    assert backend.held_keys == set() and not loco.running
+
+
+def test_concurrent_start_and_stop_leave_no_thread_or_key():
+    # start は実行スレッド、stop は asyncio.to_thread から呼ばれるので同時に来ることがある
+    backend = RecordingInputBackend()
+    loco = LocomotionController(backend, rate_hz=500, watchdog_timeout=5.0)
+    errors = []
+
+    def run(func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            errors.append(e)
+
+    for _ in range(20):
+        starter = threading.Thread(target=run, args=(loco.start, ("forward",)))
+        stopper = threading.Thread(target=run, args=(loco.stop,))
+        starter.start()
+        stopper.start()
+        starter.join()
+        stopper.join()
+        loco.stop()
+        assert not loco.running and backend.held_keys == set()
+    assert errors == []
+    assert not [t for t in threading.enumerate() if t.name == "locomotion"]
+
+
+@pytest.fixture
+def server(monkeypatch, use_backend):
+    backend = use_backend(RecordingInputBackend([WindowInfo(1000, 10, "cluster", (0, 25, 1280, 800))]))
+    monkeypatch.setattr(main.FOCUS_MANAGER, "_activate", lambda app, width, height, x, y: None)
+    monkeypatch.setattr(main, "LOCOMOTION", None)
+    monkeypatch.setattr(main, "LOCOMOTION_APP", None)
+
+    def call(tool, args):
+        # asyncio.run ごとにイベントループが変わるので、キューも呼び出しごとに作り直す
+        monkeypatch.setattr(main, "ACTION_QUEUES", AppActionQueues(before_input=main._preempt_locomotion))
+        result = asyncio.run(main.mcp.call_tool(tool, args))
+        contents = result[0] if isinstance(result, tuple) else result
+        return contents[0].text
+
+    yield backend, call
+    if main.LOCOMOTION is not None:
+        main.LOCOMOTION.stop()
+
+
+def test_other_input_stops_locomotion_first(server):
+    backend, call = server
+    assert "移動開始" in call("start_moving", {"direction": "forward", "app_name": "cluster"})
+    assert wait_for(lambda: backend.held_keys == {"w"})
+    call("press_game_keys", {"keys": "space", "duration": 0.01, "app_name": "cluster"})
+    assert not main.LOCOMOTION.running and main.LOCOMOTION.stop_reason == "input"
+    # 移動キーを離してから space を押している
+    keys = [(e.kind, e.data[0]) for e in backend.events if e.kind in ("key_down", "key_up")]
+    assert keys.index(("key_up", "w")) < keys.index(("key_down", "space"))
+    assert backend.held_keys == set()
+
+
+def test_cancel_actions_stops_locomotion(server):
+    backend, call = server
+    call("start_moving", {"direction": "back", "turn_x": 50, "app_name": "cluster"})
+    assert wait_for(lambda: backend.held_keys == {"s"})
+    assert "継続移動を停止しました" in call("cancel_actions", {"app_name": "cluster"})
+    assert not main.LOCOMOTION.running and main.LOCOMOTION.stop_reason == "cancel"
+    assert backend.held_keys == set() and backend.held_buttons == set()
+
+
+@pytest.mark.parametrize("watchdog", [0, -1.0])
+def test_non_positive_watchdog_is_rejected(server, watchdog):
+    backend, call = server
+    assert call("start_moving", {"watchdog": watchdog, "app_name": "cluster"}).startswith("入力エラー: watchdog")
+    assert backend.events == []
@@ -0,0 +1,81 @@
+import pytest
+
+from scheduler import SPIN_SLICE, DeadlineScheduler, FakeClock, RecordingSink
+
+
+def test_ticks_run_at_absolute_deadlines():
+    clock = FakeClock()
+    sink = RecordingSink(clock, cost=0.003)
+    stats = DeadlineScheduler(10, clock=clock, sleep=clock.sleep).run(1.0, sink)
+    assert [i for _, i, _ in sink.events] == list(range(10))
+    # 処理時間 (cost) が積み上がらず、各ティックは t0 + (i+1) * period に実行される
+    for t, i, _ in sink.events:
+        assert t == pytest.approx((i + 1) * 0.1, abs=1e-5)
+    assert stats.skipped == 0 and stats.reached == stats.ticks_planned == 10
+    assert stats.elapsed == pytest.approx(1.0 + 0.003, abs=1e-5)
+
+
+def test_late_ticks_are_skipped_but_last_tick_runs():
+    clock = FakeClock()
+    sink = RecordingSink(clock, cost=0.025)
+    stats = DeadlineScheduler(100, clock=clock, sleep=clock.sleep).run(0.5, sink)
+    indices = [i for _, i, _ in sink.events]
+    assert stats.skipped > 0
+    assert stats.ticks + stats.skipped == stats.ticks_planned == 50
+    assert indices == sorted(indices) and indices[-1] == 49
+    assert stats.fraction == 1.0
+
+
+def test_without_skipping_every_tick_runs():
+    clock = FakeClock()
+    sink = RecordingSink(clock, cost=0.025)
+    stats = DeadlineScheduler(100, clock=clock, sleep=clock.sleep, skip_frames=False).run(0.5, sink)
+    assert [i for _, i, _ in sink.events] == list(range(50))
+    assert stats.skipped == 0 and stats.overruns > 0
+
+
+def test_sleep_overshoot_is_compensated():
+    clock = FakeClock(overshoot=0.004)
+    scheduler = DeadlineScheduler(100, clock=clock, sleep=clock.sleep)
+    stats = scheduler.run(0.5, RecordingSink(clock))
+    # 最初は寝過ごした分だけ遅れるが、寝過ごし量を学習して次第に期限ちょうどに起きる
+    assert stats.lateness[0] == pytest.approx(0.004, abs=1e-4)
+    assert max(stats.lateness[-10:]) < 0.0005
+    assert scheduler.sleep_overshoot == pytest.approx(0.004, abs=1e-4)
+    assert stats.skipped == 0
+
+
+def test_spins_only_for_the_last_slice():
+    clock = FakeClock()
+    deadline = 0.1
+    spins = []
+
+    def sleep(seconds):
+        if seconds == 0:
+            spins.append(deadline - clock())
+        clock.sleep(seconds)
+
+    scheduler = DeadlineScheduler(10, clock=clock, sleep=sleep)
+    # 寝過ごし補正で 20ms 早く起きても、期限直前まで sleep(0) で回し続けない
+    scheduler.sleep_overshoot = 0.02
+    scheduler._sleep_precise(deadline)
+    assert clock() >= deadline
+    assert spins and max(spins) <= SPIN_SLICE
+
+
+def test_should_stop_ends_early():
+    clock = FakeClock()
+    sink = RecordingSink(clock)
+    scheduler = DeadlineScheduler(10, clock=clock, sleep=clock.sleep, should_stop=lambda: len(sink.events) >= 3)
+    stats = scheduler.run(1.0, sink)
+    assert stats.stopped and stats.reached == 3 and len(sink.events) == 3
+
+
+def test_run_events_keeps_every_event():
+    clock = FakeClock()
+    times = []
+    offsets = [0.0, 0.05, 0.05, 0.2, 0.35]
+    stats = DeadlineScheduler(clock=clock, sleep=clock.sleep).run_events(offsets, lambda i: times.append(clock()))
+    assert len(times) == len(offsets)
+    assert times == pytest.approx(offsets, abs=1e-5)
+    assert stats.reached == len(offsets)
@@ -0,0 +1,43 @@
+import pytest
+from PIL import Image
+
+import main
+from input_backend import RecordingInputBackend
+from screen_grab import CaptureSource, FakeCaptureSource
+from window_registry import WindowInfo
+
+CLUSTER = WindowInfo(100, 1, "cluster", (0, 25, 640, 400))
+TERMINAL = WindowInfo(200, 2, "Terminal", (0, 25, 640, 400))
+
+
+def test_capture_source_is_abstract():
+    with pytest.raises(TypeError):
+        CaptureSource()
+
+
+@pytest.fixture
+def region_fallback(monkeypatch, use_backend):
+    # ウィンドウIDでは撮れず、画面領域の撮影 (フォーカスが必要な方法) だけが使える状況
+    backend = use_backend(RecordingInputBackend([TERMINAL, CLUSTER]))
+    fallback = FakeCaptureSource(Image.new("RGB", (640, 400), "red"))
+    fallback.needs_focus = True
+    monkeypatch.setattr(main, "CAPTURE_SOURCE", FakeCaptureSource(None))
+    monkeypatch.setattr(main, "FALLBACK_CAPTURE_SOURCE", fallback)
+    monkeypatch.setattr(main, "CAPTURE_GEOMETRY", {})
+    return backend, fallback
+
+
+def test_background_grab_skips_region_capture_when_occluded(region_fallback):
+    backend, fallback = region_fallback
+    # 前面の Terminal が写るだけなので、cluster のフレームとしては使わない
+    assert main._grab_window("cluster") is None
+    assert fallback.windows == []
+
+
+def test_background_grab_uses_region_capture_when_frontmost(region_fallback):
+    backend, fallback = region_fallback
+    backend.registry.backend.raise_window(CLUSTER.pid, CLUSTER.window_id)
+    backend.registry.invalidate()
+    capture = main._grab_window("cluster")
+    assert capture is not None and capture.bounds == CLUSTER.bounds
+    assert fallback.windows == [CLUSTER]
@@ -0,0 +1,72 @@
+import pytest
+
+from input_backend import RecordingInputBackend
+from scheduler import DeadlineScheduler, FakeClock
+from scroll_engine import PROFILES, ScrollEngine
+
+
+def total(backend, unit):
+    return sum(e.data[0] for e in backend.events if e.kind == "scroll" and e.data[1] == unit)
+
+
+def test_line_unit_carries_remainder():
+    backend = RecordingInputBackend()
+    engine = ScrollEngine(backend, "line")
+    # amount 15 は1.5行: 2行送って -0.5 行を持ち越す
+    assert engine.scroll(15) == 2 and engine.carry == pytest.approx(-0.5)
+    engine.scroll(15)
+    assert total(backend, "line") == 3
+
+
+def test_small_amounts_add_up():
+    backend = RecordingInputBackend()
+    engine = ScrollEngine(backend, "line")
+    for _ in range(10):
+        engine.scroll(5)
+    assert total(backend, "line") == 5
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+@pytest.mark.parametrize("amount", [15, -37, 1, 250])
+def test_animated_scroll_sends_exact_total_despite_skipped_ticks(profile, amount):
+    clock = FakeClock(overshoot=0.02)
+    backend = RecordingInputBackend(clock=clock, sleep=clock.sleep)
+    engine = ScrollEngine(backend, "pixel", pixels_per_line=10.0)
+    stats, sent = engine.run(amount, 0.5, DeadlineScheduler(120, clock=clock, sleep=clock.sleep), profile)
+    assert stats.skipped > 0
+    assert sent == amount and total(backend, "pixel") == amount
+    assert engine.carry == 0.0 and stats.reached == stats.ticks_planned
+
+
+def test_fractional_pixels_per_line_keeps_running_total():
+    backend = RecordingInputBackend()
+    engine = ScrollEngine(backend, "pixel", pixels_per_line=12.0)
+    clock = FakeClock()
+    for amount in (3, 3, 7, -4, 11):
+        engine.run(amount, 0.1, DeadlineScheduler(120, clock=clock, sleep=clock.sleep), "ease_in_out")
+    assert engine.sent + engine.carry == pytest.approx(engine.to_units(20))
+    assert total(backend, "pixel") == engine.sent
+
+
+def test_stopped_run_discards_remainder():
+    clock = FakeClock()
+    backend = RecordingInputBackend(clock=clock, sleep=clock.sleep)
+    engine = ScrollEngine(backend, "pixel", pixels_per_line=10.0)
+    scheduler = DeadlineScheduler(100, clock=clock, sleep=clock.sleep, should_stop=lambda: clock() > 0.25)
+    stats, sent = engine.run(100, 1.0, scheduler)
+    assert stats.stopped and 0 < sent < 100 and engine.carry == 0.0
+
+
+def test_ease_out_front_loads():
+    deltas = ScrollEngine(None, pixels_per_line=10.0).plan(100, 10, "ease_out")
+    assert sum(deltas) == 100 and deltas[0] > deltas[-1]
+
+
+def test_default_keeps_previous_magnitude():
+    # 従来は int(amount / 10) ピクセルを送っていた: amount 10 で1ピクセル
+    backend = RecordingInputBackend()
+    engine = ScrollEngine(backend)
+    for amount in (10, 50, -30):
+        engine.scroll(amount)
+    assert [e.data for e in backend.events] == [(1, "pixel"), (5, "pixel"), (-3, "pixel")]
+
@@ -0,0 +1,21 @@
+import asyncio
+
+import main
+from action_queue import AppActionQueues
+from input_backend import RecordingInputBackend
+
+
+def test_carry_is_kept_per_target_app(monkeypatch, use_backend):
+    backend = use_backend(RecordingInputBackend())
+    monkeypatch.setattr(main, "SCROLL_ENGINES", {})
+    monkeypatch.setattr(main, "SCROLL_UNIT", "pixel")
+    monkeypatch.setattr(main, "SCROLL_PIXELS_PER_LINE", 1.0)
+    monkeypatch.setattr(main, "_focus_window_impl", lambda *args, **kwargs: "")
+
+    for app in ("a", "b", "a", "b"):
+        # asyncio.run ごとにイベントループが変わるので、キューも呼び出しごとに作り直す
+        monkeypatch.setattr(main, "ACTION_QUEUES", AppActionQueues())
+        # 0.5 ピクセルずつ。端数を共有していると2回目の "b" が "a" の持ち越しで 0 になってしまう
+        asyncio.run(main.mcp.call_tool("scroll_zoom", {"amount": 5, "app_name": app}))
+    assert [e.data[0] for e in backend.events if e.kind == "scroll"] == [1, 1]
+    assert set(main.SCROLL_ENGINES) == {"a", "b"}
@@ -0,0 +1,100 @@
+import pytest
+
+from input_backend import RecordingInputBackend
+from scheduler import DeadlineScheduler, FakeClock
+from session_record import (BUTTON_DOWN, BUTTON_UP, DRAG, KEY_DOWN, KEY_UP, MOVE, SCROLL, Session,
+                            SessionRecorder, recorder_from_events, replay)
+
+
+def play(session, speed=1.0, **kwargs):
+    clock = FakeClock()
+    backend = RecordingInputBackend(clock=clock, sleep=clock.sleep)
+    stats, sent = replay(session, backend, DeadlineScheduler(200, clock=clock, sleep=clock.sleep),
+                         speed=speed, **kwargs)
+    return backend, stats, sent
+
+
+def sample_events():
+    clock = FakeClock()
+    backend = RecordingInputBackend(clock=clock, sleep=clock.sleep)
+    for i in range(20):
+        backend.mouse_move(100 + i, 200, 1, 0)
+        clock.advance(0.01)
+    backend.mouse_button("right", True, 120, 200)
+    backend.key_down("w")
+    clock.advance(0.1)
+    backend.mouse_drag("right", 130, 200, 10, 0)
+    backend.scroll(-3)
+    clock.advance(0.2)
+    backend.key_up("w")
+    backend.mouse_button("right", False, 130, 200)
+    return backend.events
+
+
+def test_record_save_replay_round_trip(tmp_path):
+    events = sample_events()
+    rec = recorder_from_events(events)
+    path = str(tmp_path / "session.clsn")
+    size = rec.save(path)
+    # 1イベント 29 バイト + ヘッダ・メタデータ・列ごとの端数
+    assert size < 64 + 29 * len(rec) + 512
+
+    with Session(path) as session:
+        assert session.count == len(events) and session.keys == ["w"]
+        assert session.duration == pytest.approx(events[-1].timestamp - events[0].timestamp)
+        backend, stats, sent = play(session)
+    assert sent == len(events) and not stats.stopped
+    assert [(e.kind, e.data) for e in backend.events] == [(e.kind, e.data) for e in events]
+    # 記録した時刻どおりに送る
+    t0 = backend.events[0].timestamp
+    for got, want in zip(backend.events, events):
+        assert got.timestamp - t0 == pytest.approx(want.timestamp - events[0].timestamp, abs=1e-4)
+    assert backend.held_keys == set() and backend.held_buttons == set()
+
+
+def test_speed_scales_replay_time(tmp_path):
+    rec = SessionRecorder()
+    for i in range(11):
+        rec.add(MOVE, 0, i, 0, 1, 0, t=i * 0.1)
+    path = str(tmp_path / "moves.clsn")
+    rec.save(path)
+    with Session(path) as session:
+        backend, stats, sent = play(session, speed=2.0)
+    assert sent == 11
+    assert backend.events[-1].timestamp - backend.events[0].timestamp == pytest.approx(0.5, abs=1e-4)
+
+
+def test_seeking_into_held_keys_releases_them(tmp_path):
+    rec = SessionRecorder()
+    rec.add(MOVE, 0, 100, 200, 1, 0, t=0.0)
+    rec.add(BUTTON_DOWN, 1, 300, 200, t=1.0)
+    rec.add_key(KEY_DOWN, "w", t=1.0)
+    rec.add(DRAG, 1, 310, 200, 10, 0, t=1.1)
+    rec.add(SCROLL, dy=-3, t=1.2)
+    rec.add_key(KEY_UP, "w", t=1.5)
+    rec.add(BUTTON_UP, 1, 310, 200, t=1.5)
+    path = str(tmp_path / "held.clsn")
+    rec.save(path)
+    with Session(path) as session:
+        assert session.index_at(1.0) == 1
+        backend, stats, sent = play(session, start=1.0, end=1.3, offset=(5, 0))
+    assert sent == 4
+    assert backend.events[0].data == ("right", True, 305, 200)
+    # 範囲の終わりで押したままのキー・ボタンを離す
+    assert backend.held_keys == set() and backend.held_buttons == set()
+
+
+def test_invalid_speed(tmp_path):
+    path = str(tmp_path / "empty.clsn")
+    SessionRecorder().save(path)
+    with Session(path) as session:
+        assert session.count == 0
+        with pytest.raises(ValueError):
+            play(session, speed=0)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        Session(str(path))
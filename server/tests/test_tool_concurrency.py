@@ -0,0 +1,17 @@
+import asyncio
+
+import tool_benchmark
+
+
+def test_observations_do_not_wait_for_input():
+    r = asyncio.run(tool_benchmark.run_concurrency_benchmark(inputs=2, observers=2, calls=4))
+    assert r["calls"] == 16
+    # 観測は入力の列に並ばないので、入力1回分 (キーを 0.05 秒押す) より大幅に待たされない
+    assert r["kinds"]["observe"]["p50"] < r["kinds"]["input"]["p50"]
+    assert r["focus_stolen"] == 0
+
+
+def test_capture_needing_focus_goes_through_input_queue():
+    r = asyncio.run(tool_benchmark.run_concurrency_benchmark(inputs=2, observers=2, calls=4, window_capture=False))
+    assert r["calls"] == 16
+    assert r["focus_stolen"] == 0
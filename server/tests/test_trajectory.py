@@ -0,0 +1,38 @@
+import pytest
+
+from trajectory import PROFILES, cache_info, figure8_path, motion_path, tick_count
+
+
+@pytest.mark.parametrize("profile", PROFILES)
+@pytest.mark.parametrize("dx, dy", [(0, 0), (1, 0), (-7, 3), (300, -41), (1234, 987)])
+@pytest.mark.parametrize("duration, rate", [(0.05, 120), (0.5, 120), (2.0, 120), (1.0, 60), (0.3, 33)])
+def test_delta_sums_equal_requested_displacement(profile, dx, dy, duration, rate):
+    tr = motion_path(profile, dx, dy, duration, rate)
+    assert tuple(int(v) for v in tr.deltas.sum(axis=0)) == (dx, dy)
+    assert tr.total == (dx, dy)
+    assert tr.ticks == tick_count(duration, rate)
+
+
+def test_ease_in_out_is_slower_at_both_ends():
+    tr = motion_path("ease_in_out", 1000, 0, 1.0, 60)
+    xs = [int(d[0]) for d in tr.deltas]
+    assert xs[0] < xs[len(xs) // 2] and xs[-1] < xs[len(xs) // 2]
+
+
+def test_figure8_deltas_sum_to_end_offset():
+    tr = figure8_path(40.0, 2.0, 20.0)
+    assert tuple(int(v) for v in tr.deltas.sum(axis=0)) == tr.total
+
+
+def test_invalid_profile():
+    with pytest.raises(ValueError):
+        motion_path("zigzag", 10, 0, 1.0, 60)
+
+
+def test_paths_are_cached_and_read_only():
+    first = motion_path("linear", 123, 45, 0.7, 120)
+    hits = cache_info()["motion"]["hits"]
+    assert motion_path("linear", 123, 45, 0.7, 120) is first
+    assert cache_info()["motion"]["hits"] == hits + 1
+    with pytest.raises(ValueError):
+        first.deltas[0, 0] = 1
@@ -0,0 +1,84 @@
+from scheduler import FakeClock
+from window_registry import FakeWindowBackend, WindowInfo, WindowRegistry
+
+
+def make_registry(windows=None, ttl=0.25):
+    clock = FakeClock()
+    backend = FakeWindowBackend(windows if windows is not None else [
+        WindowInfo(100, 1, "cluster", (0, 25, 1280, 800)),
+        WindowInfo(200, 2, "Terminal", (100, 100, 800, 600)),
+        WindowInfo(300, 3, "Dock", (0, 0, 1440, 900), layer=20),
+    ])
+    return WindowRegistry(backend, ttl=ttl, clock=clock), backend, clock
+
+
+def test_hit_within_ttl():
+    registry, backend, clock = make_registry()
+    assert registry.get_bounds("cluster") == (0, 25, 1280, 800)
+    clock.advance(0.2)
+    assert registry.get_bounds("Cluster") == (0, 25, 1280, 800)
+    assert registry.get(200, 2).owner_name == "Terminal"
+    assert backend.calls == 1
+    assert (registry.hits, registry.misses) == (2, 1) and registry.hit_rate == 2 / 3
+
+
+def test_miss_and_refresh_after_ttl():
+    registry, backend, clock = make_registry()
+    registry.get_bounds("cluster")
+    backend.set_bounds(1, (10, 40, 1024, 768))
+    # TTL 以内は古いジオメトリのまま
+    assert registry.get_bounds("cluster") == (0, 25, 1280, 800)
+    clock.advance(0.3)
+    assert registry.get_bounds("cluster") == (10, 40, 1024, 768)
+    assert backend.calls == 2 and registry.refreshes == 2 and registry.misses == 2
+
+
+def test_unknown_app_misses():
+    registry, backend, clock = make_registry()
+    assert registry.get_bounds("no-such-app") is None
+    assert registry.find("dock") is None  # 通常レイヤー以外は対象外
+    assert registry.misses == 2 and registry.hits == 0
+
+
+def test_invalidate_only_drops_that_app():
+    registry, backend, clock = make_registry()
+    registry.get_bounds("cluster")
+    registry.invalidate("cluster")
+    assert registry.invalidations == 1
+    # 他のアプリのエントリは残っているので取り直さない
+    assert registry.get_bounds("terminal") == (100, 100, 800, 600)
+    assert backend.calls == 1
+    backend.set_bounds(1, (5, 30, 640, 480))
+    assert registry.get_bounds("cluster") == (5, 30, 640, 480)
+    assert backend.calls == 2
+
+
+def test_invalidate_all():
+    registry, backend, clock = make_registry()
+    registry.get_bounds("cluster")
+    registry.invalidate()
+    registry.get_bounds("terminal")
+    assert backend.calls == 2 and registry.stats()["invalidations"] == 1
+
+
+def test_frontmost_follows_enumeration_order():
+    windows = [
+        WindowInfo(300, 3, "Dock", (0, 0, 1440, 900), layer=20),
+        WindowInfo(200, 2, "Terminal", (100, 100, 800, 600)),
+        WindowInfo(100, 1, "cluster", (0, 25, 1280, 800)),
+    ]
+    registry, backend, clock = make_registry(windows)
+    # 通常レイヤーのうち最前面 (列挙の先頭) のもの
+    assert registry.frontmost().owner_name == "Terminal"
+    backend.raise_window(100, 1)
+    # 列挙結果が新しいうちは取り直さない
+    assert registry.frontmost().owner_name == "Terminal"
+    clock.advance(0.01)
+    assert registry.frontmost(max_age=0.0).owner_name == "cluster"
+    backend.raise_window(200, 2)
+    clock.advance(0.3)
+    assert registry.frontmost().owner_name == "Terminal"
+    registry.invalidate("cluster")
+    backend.raise_window(100, 1)
+    # アプリ単位の無効化でも前面判定は取り直す
+    assert registry.frontmost().owner_name == "cluster"
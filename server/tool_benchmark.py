@@ -0,0 +1,191 @@
+import asyncio
+import time
+
+from PIL import Image
+
+import main
+from action_queue import AppActionQueues, percentile
+from input_backend import RecordingInputBackend
+from screen_grab import FakeCaptureSource
+from window_registry import WindowInfo
+
+# (表示名, ツール名, 引数)
+CASES = [
+    ("focus_window", "focus_window", {"app_name_keyword": "cluster"}),
+    ("press_game_keys", "press_game_keys", {"keys": "w a+d space", "duration": 0.1}),
+    ("press_game_keys(timeline)", "press_game_keys", {"timeline": [
+        {"key": "w", "start": 0.0, "hold": 0.5},
+        {"key": "shift", "start": 0.1, "hold": 0.3},
+        {"key": "space", "start": 0.25, "hold": 0.1},
+    ]}),
+    ("move_mouse_relative(drag)", "move_mouse_relative", {"x": 300, "y": -120, "duration": 0.5}),
+    ("move_mouse_relative(bezier)", "move_mouse_relative",
+     {"x": -200, "y": 80, "button": "none", "duration": 0.5, "profile": "bezier"}),
+    ("scroll_zoom", "scroll_zoom", {"amount": 50, "duration": 0.5}),
+    ("send_comment", "send_comment", {"comment": "こんにちは"}),
+    ("perform_emote", "perform_emote", {"emote_name": "wave"}),
+    ("wave_hands", "wave_hands", {"duration": 1.0}),
+    ("run_actions", "run_actions", {"steps": [
+        {"type": "key", "keys": "w", "duration": 0.2},
+        {"type": "drag", "x": 100, "y": 0, "duration": 0.3},
+        {"type": "wait", "seconds": 0.1},
+        {"type": "scroll", "amount": -20},
+    ]}),
+]
+
+
+async def run_benchmark(cases=CASES, repeat: int = 3):
+    """各ツールを記録用バックエンドで repeat 回実行し、実行時間が中央値の回の集計を返す"""
+    backend = RecordingInputBackend()
+    main.set_input_backend(backend)
+    # 画面を撮らずに固定時間で待ち、連投制限の待ちも入れない
+    main.CHAT_ROI = None
+    main.COMMENT_MIN_INTERVAL = 0.0
+    rows = []
+    for label, tool, args in cases:
+        runs = []
+        for _ in range(repeat):
+            backend.reset()
+            t0 = time.perf_counter()
+            await main.mcp.call_tool(tool, args)
+            runs.append(backend.summary(time.perf_counter() - t0))
+        runs.sort(key=lambda r: r["wall"])
+        rows.append((label, runs[len(runs) // 2]))
+    return rows
+
+
+def print_report(rows):
+    print(f"{'tool':<28} {'events':>6} {'wall':>8} {'sleep':>8} {'work':>8} {'ticks':>5} {'skip':>4} "
+          f"{'err_mean':>8} {'err_p99':>8} {'err_max':>8}")
+    for label, r in rows:
+        print(f"{label:<28} {r['events']:>6} {r['wall'] * 1000:>6.1f}ms {r['sleep'] * 1000:>6.1f}ms "
+              f"{r['work'] * 1000:>6.1f}ms {r['ticks']:>5} {r['skipped']:>4} "
+              f"{r['sched_err_mean'] * 1000:>6.2f}ms {r['sched_err_p99'] * 1000:>6.2f}ms "
+              f"{r['sched_err_max'] * 1000:>6.2f}ms")
+        if r["held_keys"] or r["held_buttons"]:
+            print(f"  !! 押したままのキー/ボタン: {r['held_keys']} {r['held_buttons']}")
+
+
+async def run_instance_benchmark(instances: int = 3, actions: int = 10, max_batch: int = 8,
+                                 focus_delay: float = 0.05, tool: str = "press_game_keys", args=None):
+    """
+    instances 個のクライアントへ交互に actions 回ずつ操作を投入し、フォーカス切り替え回数と処理件数/秒を返す。
+    ウィンドウとフォーカスは記録用バックエンドの偽物で、アクティブ化すると focus_delay 秒後に
+    そのウィンドウが最前面に並ぶ (AppleScript での切り替えにかかる時間の代わり)。
+    """
+    windows = [WindowInfo(1000 + i, 10 + i, "cluster", (i * 640, 0, 640, 400)) for i in range(instances)]
+    backend = RecordingInputBackend(windows)
+    main.set_input_backend(backend)
+
+    def activate(pid, window_id):
+        time.sleep(focus_delay)
+        return backend.registry.backend.raise_window(pid, window_id)
+    main.FOCUS_MANAGER.activate_window = activate
+    main.ACTION_QUEUES = AppActionQueues(max_batch)
+    main.CHAT_ROI = None
+    names = [i.name for i in main.INSTANCES.discover("cluster")]
+    args = args or {"keys": "w", "duration": 0.01}
+    refocuses = main.FOCUS_MANAGER.refocuses
+    t0 = time.perf_counter()
+    # 投入順は cluster-1, cluster-2, ... の繰り返し
+    tasks = [asyncio.create_task(main.mcp.call_tool(tool, dict(args, instance=name)))
+             for _ in range(actions) for name in names]
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - t0
+    total = instances * actions
+    return {
+        "instances": instances,
+        "max_batch": max_batch,
+        "actions": total,
+        "wall": wall,
+        "actions_per_s": total / wall,
+        "focus_switches": main.FOCUS_MANAGER.refocuses - refocuses,
+        "queue_switches": main.ACTION_QUEUES.switches,
+        "batches": main.ACTION_QUEUES.batches,
+    }
+
+
+def print_instance_report(rows):
+    print(f"{'instances':>9} {'batch':>5} {'actions':>7} {'wall':>8} {'act/s':>7} {'focus_sw':>8} {'batches':>7}")
+    for r in rows:
+        print(f"{r['instances']:>9} {r['max_batch']:>5} {r['actions']:>7} {r['wall'] * 1000:>6.0f}ms "
+              f"{r['actions_per_s']:>7.1f} {r['focus_switches']:>8} {r['batches']:>7}")
+
+
+async def run_concurrency_benchmark(inputs: int = 4, observers: int = 4, calls: int = 10,
+                                    capture_delay: float = 0.02, window_capture: bool = True):
+    """
+    別のアプリ ("editor") への入力操作 (press_game_keys) と、"cluster" の観測 (take_screenshot /
+    get_window_bounds) を同時に投げ、処理件数/秒と種類ごとの応答時間 (p50/p99/最大) を返す。
+    入力・ウィンドウ・撮影はすべて偽物。window_capture=False ではウィンドウIDで撮れない環境を再現する
+    (観測の撮影は入力キューに回るので、キーを押している途中でフォーカスを奪っていないことを focus_stolen で数える)。
+    """
+    windows = [WindowInfo(1000, 10, "cluster", (0, 25, 640, 400)), WindowInfo(2000, 20, "editor", (0, 25, 800, 600))]
+    backend = RecordingInputBackend(windows)
+    main.set_input_backend(backend)
+    frame = Image.new("RGB", (640, 400), (40, 80, 120))
+
+    def grab(window):
+        time.sleep(capture_delay)
+        return frame if window_capture else None
+    fallback = FakeCaptureSource(grab if window_capture else frame)
+    fallback.needs_focus = True
+    main.set_capture_source(FakeCaptureSource(grab), fallback)
+    main.ACTION_QUEUES = AppActionQueues()
+    main.CHAT_ROI = None
+    main.CAPTURERS.clear()
+
+    # 他の入力操作がキーを押している途中にフォーカスが切り替わった回数
+    focus_stolen = [0]
+
+    def activate(app, width, height, x, y):
+        if backend.held_keys:
+            focus_stolen[0] += 1
+        win = next(w for w in windows if app in w.owner_name)
+        return backend.registry.backend.raise_window(win.pid, win.window_id)
+    main.FOCUS_MANAGER._activate = activate
+    main.FOCUS_MANAGER.current_app = None
+
+    results = []
+
+    async def client(kind, plan):
+        for tool, args in plan:
+            t0 = time.perf_counter()
+            await main.mcp.call_tool(tool, args)
+            results.append((kind, time.perf_counter() - t0))
+
+    observe = [("take_screenshot", {"app_name": "cluster"}), ("get_window_bounds", {"app_name": "cluster"})]
+    plans = ([("input", [("press_game_keys", {"keys": "w", "duration": 0.05, "app_name": "editor"})] * calls)]
+             * inputs
+             + [("observe", [observe[i % 2] for i in range(calls)])] * observers)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(kind, plan) for kind, plan in plans))
+    wall = time.perf_counter() - t0
+    report = {"window_capture": window_capture, "calls": len(results), "wall": wall,
+              "throughput": len(results) / wall, "focus_stolen": focus_stolen[0], "kinds": {}}
+    for kind in ("input", "observe"):
+        lat = [t for k, t in results if k == kind]
+        report["kinds"][kind] = {"calls": len(lat), "p50": percentile(lat, 50), "p99": percentile(lat, 99),
+                                 "max": max(lat, default=0.0)}
+    return report
+
+
+def print_concurrency_report(rows):
+    print(f"{'capture':<8} {'kind':<8} {'calls':>5} {'p50':>9} {'p99':>9} {'max':>9} {'calls/s':>8} {'focus!':>6}")
+    for r in rows:
+        label = "window" if r["window_capture"] else "region"
+        for kind, k in r["kinds"].items():
+            print(f"{label:<8} {kind:<8} {k['calls']:>5} {k['p50'] * 1000:>7.1f}ms {k['p99'] * 1000:>7.1f}ms "
+                  f"{k['max'] * 1000:>7.1f}ms {r['throughput']:>8.1f} {r['focus_stolen']:>6}")
+
+
+async def _instance_rows():
+    return [await run_instance_benchmark(n, 10, batch) for n in (2, 4) for batch in (1, 8)]
+
+
+if __name__ == "__main__":
+    print_report(asyncio.run(run_benchmark()))
+    print()
+    print_instance_report(asyncio.run(_instance_rows()))
+    print()
+    print_concurrency_report([asyncio.run(run_concurrency_benchmark(window_capture=w)) for w in (True, False)])
@@ -0,0 +1,97 @@
+import functools
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+PROFILES = ("linear", "ease_in_out", "bezier")
+
+# bezier プロファイルで経路を横に膨らませる量 (移動距離に対する割合)
+BEZIER_BEND = 0.2
+
+
+@dataclass(frozen=True)
+class Trajectory:
+    """
+    事前計算した移動経路。
+    offsets[i] は i 番目のティック後の始点からの整数座標、deltas[i] はその直前からの整数移動量。
+    小数の経路を累積値で丸めるので、丸め誤差は次のティックに持ち越され deltas の合計は終点と一致する。
+    """
+    profile: str
+    rate_hz: float
+    duration: float
+    offsets: np.ndarray  # (n, 2) int64
+    deltas: np.ndarray  # (n, 2) int64
+
+    @property
+    def ticks(self) -> int:
+        return len(self.deltas)
+
+    @property
+    def total(self):
+        return tuple(int(v) for v in self.offsets[-1]) if len(self.offsets) else (0, 0)
+
+
+def tick_count(duration: float, rate_hz: float) -> int:
+    """DeadlineScheduler.run と同じ規則でティック数を決める"""
+    return max(int(round(duration * rate_hz)), 1)
+
+
+def _readonly(a: np.ndarray) -> np.ndarray:
+    # キャッシュした配列を呼び出し側で書き換えられないようにする
+    a.flags.writeable = False
+    return a
+
+
+def quantize(path: np.ndarray, profile: str, duration: float, rate_hz: float) -> Trajectory:
+    """小数の累積経路 (n, 2) を整数の座標・移動量に丸める"""
+    offsets = np.rint(path).astype(np.int64)
+    deltas = np.diff(offsets, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    return Trajectory(profile, rate_hz, duration, _readonly(offsets), _readonly(deltas))
+
+
+def _progress(profile: str, n: int) -> np.ndarray:
+    """各ティック終了時点の進み具合 (0 < u <= 1)"""
+    u = np.arange(1, n + 1, dtype=np.float64) / n
+    if profile == "ease_in_out":
+        return 0.5 - 0.5 * np.cos(np.pi * u)
+    return u
+
+
+@functools.lru_cache(maxsize=256)
+def motion_path(profile: str, dx: int, dy: int, duration: float, rate_hz: float) -> Trajectory:
+    """
+    始点から (dx, dy) まで duration 秒で動く経路。
+    linear: 等速の直線, ease_in_out: 加減速する直線,
+    bezier: 進行方向の左側に膨らむ2次ベジェ曲線 (加減速付き)
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"profile は {', '.join(PROFILES)} のいずれかを指定してください: {profile}")
+    n = tick_count(duration, rate_hz)
+    end = np.array([dx, dy], dtype=np.float64)
+
+    if profile == "bezier":
+        t = _progress("ease_in_out", n)[:, None]
+        # 中点から進行方向に垂直にずらした制御点
+        control = end / 2 + np.array([-dy, dx], dtype=np.float64) * BEZIER_BEND
+        path = 2 * (1 - t) * t * control + t * t * end
+    else:
+        path = _progress(profile, n)[:, None] * end
+    return quantize(path, profile, duration, rate_hz)
+
+
+@functools.lru_cache(maxsize=64)
+def figure8_path(amplitude: float, duration: float, rate_hz: float, speed: float = 8.0) -> Trajectory:
+    """
+    8の字を描く経路 (手を振る動作用)。
+    ティック i の移動量は (amp * cos(speed * t), amp/2 * cos(2 * speed * t))、t = i / rate_hz。
+    """
+    n = tick_count(duration, rate_hz)
+    t = np.arange(n, dtype=np.float64) / rate_hz
+    step = np.stack([amplitude * np.cos(speed * t), amplitude * 0.5 * np.cos(2 * speed * t)], axis=1)
+    return quantize(np.cumsum(step, axis=0), "figure8", duration, rate_hz)
+
+
+def cache_info() -> dict:
+    return {"motion": motion_path.cache_info()._asdict(), "figure8": figure8_path.cache_info()._asdict()}
+
@@ -0,0 +1,62 @@
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass
+class WaitResult:
+    """wait_until の結果"""
+    ok: bool  # 条件が満たされたか (False ならタイムアウト)
+    elapsed: float
+    polls: int
+
+    def __bool__(self):
+        return self.ok
+
+
+def wait_until(predicate: Callable[[], bool], timeout: float,
+               interval: float = 0.01, backoff: float = 1.5, max_interval: float = 0.1,
+               min_wait: float = 0.0,
+               clock: Callable[[], float] = time.monotonic,
+               sleep: Callable[[float], None] = time.sleep) -> WaitResult:
+    """
+    predicate() が True を返すまで、最大 timeout 秒ポーリングして待つ。
+    ポーリング間隔は interval から backoff 倍ずつ max_interval まで伸ばす。
+    predicate の例外は「まだ満たされていない」として扱う。
+    min_wait を指定すると、その時間が経つまでは判定しない。
+    """
+    t0 = clock()
+    deadline = t0 + timeout
+    polls = 0
+    if min_wait > 0:
+        sleep(min(min_wait, timeout))
+    while True:
+        polls += 1
+        try:
+            if predicate():
+                return WaitResult(True, clock() - t0, polls)
+        except Exception:
+            pass
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return WaitResult(False, clock() - t0, polls)
+        sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+
+def changed_from(probe: Callable[[], object], differs: Callable[[object, object], bool]) -> Callable[[], bool]:
+    """今の probe() の値を基準にして、そこから変化したら True を返す述語を作る"""
+    baseline = probe()
+    return lambda: differs(baseline, probe())
+
+
+def settled(probe: Callable[[], object], differs: Callable[[object, object], bool]) -> Callable[[], bool]:
+    """連続した2回の probe() が同じになったら (動きが収まったら) True を返す述語を作る"""
+    last = [probe()]
+
+    def predicate():
+        cur = probe()
+        same = not differs(last[0], cur)
+        last[0] = cur
+        return same
+    return predicate
@@ -0,0 +1,183 @@
+import time
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class WindowInfo(NamedTuple):
+    """ウィンドウ1枚分の情報"""
+    pid: int
+    window_id: int
+    owner_name: str
+    bounds: Tuple[int, int, int, int]  # (x, y, w, h)
+    layer: int = 0
+
+
+class QuartzWindowBackend:
+    """CGWindowListCopyWindowInfo でオンスクリーンのウィンドウを列挙するバックエンド"""
+
+    def __init__(self):
+        # Quartz は Mac 専用なので、使う時点で読み込む
+        import Quartz
+        self._q = Quartz
+
+    def list_windows(self) -> List[WindowInfo]:
+        q = self._q
+        options = q.kCGWindowListOptionOnScreenOnly | q.kCGWindowListExcludeDesktopElements
+        infos = q.CGWindowListCopyWindowInfo(options, q.kCGNullWindowID) or []
+        windows = []
+        for info in infos:
+            b = info.get(q.kCGWindowBounds)
+            if not b:
+                continue
+            windows.append(WindowInfo(
+                pid=int(info.get(q.kCGWindowOwnerPID, 0)),
+                window_id=int(info.get(q.kCGWindowNumber, 0)),
+                owner_name=str(info.get(q.kCGWindowOwnerName, "") or ""),
+                bounds=(int(b["X"]), int(b["Y"]), int(b["Width"]), int(b["Height"])),
+                layer=int(info.get(q.kCGWindowLayer, 0)),
+            ))
+        return windows
+
+
+class FakeWindowBackend:
+    """テスト用バックエンド: windows を直接書き換えて使う (Linuxでも動作)"""
+
+    def __init__(self, windows: Optional[List[WindowInfo]] = None):
+        self.windows = list(windows or [])
+        self.calls = 0
+
+    def list_windows(self) -> List[WindowInfo]:
+        self.calls += 1
+        return list(self.windows)
+
+    def set_bounds(self, window_id: int, bounds: Tuple[int, int, int, int]):
+        self.windows = [w._replace(bounds=tuple(bounds)) if w.window_id == window_id else w
+                        for w in self.windows]
+
+    def raise_window(self, pid: int, window_id: int) -> Optional[str]:
+        """プロセス pid のウィンドウを前面に並べ替える (FocusManager.activate_window として使える)"""
+        front = [w for w in self.windows if w.pid == pid]
+        if not front:
+            return f"エラー: PID {pid} のウィンドウがありません"
+        front.sort(key=lambda w: w.window_id != window_id)
+        self.windows = front + [w for w in self.windows if w.pid != pid]
+        return None
+
+
+class WindowRegistry:
+    """
+    プロセス内のウィンドウレジストリ。
+    (オーナーPID, ウィンドウID) をキーにジオメトリを短いTTLでキャッシュし、
+    osascript を起動せずにウィンドウ位置・サイズを返す。
+    """
+
+    def __init__(self, backend=None, ttl: float = 0.25, clock: Callable[[], float] = time.monotonic):
+        self._backend = backend
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (pid, window_id) -> (WindowInfo, 取得時刻)
+        self._entries: Dict[Tuple[int, int], Tuple[WindowInfo, float]] = {}
+        # 列挙順 (Quartzは前面から背面の順で返す)
+        self._order: List[Tuple[int, int]] = []
+        self._refreshed_at = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self):
+        # Quartzバックエンドは初回利用時に生成する
+        if self._backend is None:
+            self._backend = QuartzWindowBackend()
+        return self._backend
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hit_rate,
+            "entries": len(self._entries),
+        }
+
+    def refresh(self) -> List[WindowInfo]:
+        """バックエンドから全ウィンドウを取り直してキャッシュを置き換える"""
+        windows = self.backend.list_windows()
+        now = self._clock()
+        with self._lock:
+            self._entries = {(w.pid, w.window_id): (w, now) for w in windows}
+            self._order = [(w.pid, w.window_id) for w in windows]
+            self._refreshed_at = now
+            self.refreshes += 1
+        return windows
+
+    def _fresh(self, predicate) -> List[WindowInfo]:
+        now = self._clock()
+        with self._lock:
+            return [w for w, t in self._entries.values()
+                    if now - t <= self.ttl and predicate(w)]
+
+    def _lookup(self, predicate) -> List[WindowInfo]:
+        found = self._fresh(predicate)
+        if found:
+            self.hits += 1
+            return found
+        self.misses += 1
+        self.refresh()
+        return self._fresh(predicate)
+
+    def get(self, pid: int, window_id: int) -> Optional[WindowInfo]:
+        """PIDとウィンドウIDでウィンドウ情報を取得"""
+        found = self._lookup(lambda w: w.pid == pid and w.window_id == window_id)
+        return found[0] if found else None
+
+    def find_windows(self, app_name_keyword: str) -> List[WindowInfo]:
+        """アプリ名(部分一致・大小文字無視)に該当する通常レイヤーのウィンドウ一覧"""
+        keyword = (app_name_keyword or "").lower()
+        return self._lookup(lambda w: w.layer == 0 and keyword in w.owner_name.lower())
+
+    def find(self, app_name_keyword: str) -> Optional[WindowInfo]:
+        """アプリのメインウィンドウ (面積最大のもの) を返す"""
+        windows = self.find_windows(app_name_keyword)
+        if not windows:
+            return None
+        return max(windows, key=lambda w: w.bounds[2] * w.bounds[3])
+
+    def get_bounds(self, app_name_keyword: str) -> Optional[Tuple[int, int, int, int]]:
+        """アプリのメインウィンドウの (x, y, w, h) を返す。見つからなければ None"""
+        win = self.find(app_name_keyword)
+        return win.bounds if win else None
+
+    def frontmost(self, max_age: Optional[float] = None) -> Optional[WindowInfo]:
+        """最前面にある通常レイヤーのウィンドウを返す。max_age より古い列挙結果なら取り直す"""
+        max_age = self.ttl if max_age is None else max_age
+        if self._refreshed_at is None or self._clock() - self._refreshed_at > max_age:
+            self.refresh()
+        with self._lock:
+            for key in self._order:
+                entry = self._entries.get(key)
+                if entry and entry[0].layer == 0:
+                    return entry[0]
+        return None
+
+    def invalidate(self, app_name_keyword: Optional[str] = None):
+        """キャッシュを無効化する。アプリ名指定時はそのアプリのエントリだけを捨てる"""
+        with self._lock:
+            if app_name_keyword is None:
+                self._entries.clear()
+                self._refreshed_at = None
+            else:
+                keyword = app_name_keyword.lower()
+                self._entries = {k: v for k, v in self._entries.items()
+                                 if keyword not in v[0].owner_name.lower()}
+                # 前面判定も取り直させる
+                self._refreshed_at = None
+            self.invalidations += 1